@@ -0,0 +1,184 @@
+"""Minimal OpenAI-compatible chat completions server with simulated latency.
+
+It answers every ``/v1/chat/completions`` request with the same reply,
+either as a single JSON response or as a stream of server-sent events, so
+that the graphs can be load-tested without calling OpenAI. Like OpenAI, it
+reports its rate limits in ``x-ratelimit-*`` headers, and it can enforce
+them, answering with 429 errors when a request exceeds them. To run it on
+its own:
+
+    uv run python benchmarks/fake_llm_server.py --port 8000 --latency 0.2
+    uv run python benchmarks/fake_llm_server.py --rpm 60 --tpm 10000
+
+and point the graphs at it with ``OPENAI_BASE_URL=http://127.0.0.1:8000/v1``.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Optional, Tuple
+
+# Limits reported when none are enforced
+UNLIMITED_RPM = 1_000_000
+UNLIMITED_TPM = 1_000_000_000
+
+
+def request_tokens(request: dict) -> int:
+    """Tokens counted against the TPM limit: about 4 characters per prompt token, plus max_tokens."""
+    max_tokens = request.get("max_completion_tokens") or request.get("max_tokens") or 0
+    return len(json.dumps(request.get("messages", []))) // 4 + max_tokens
+
+
+class FakeLLMServer:
+    """Serves canned chat completions over HTTP/1.1 with keep-alive.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        reply (str): Content of every answer.
+        host (str): Interface to listen on.
+        port (int): Port to listen on, or 0 to pick a free one.
+        requests_per_minute (int): RPM limit to enforce, if any.
+        tokens_per_minute (int): TPM limit to enforce, if any.
+    """
+
+    def __init__(self, latency: float = 0.2, reply: str = "This is a canned answer.",
+                 host: str = "127.0.0.1", port: int = 0,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.latency = latency
+        self.reply = reply
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.throttled = 0
+        self.enforced = requests_per_minute is not None or tokens_per_minute is not None
+        self.rpm = requests_per_minute or UNLIMITED_RPM
+        self.tpm = tokens_per_minute or UNLIMITED_TPM
+        # Remaining requests and tokens, refilled continuously as in a token bucket
+        self._remaining = [float(self.rpm), float(self.tpm)]
+        self._updated = time.monotonic()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    @property
+    def base_url(self) -> str:
+        return "http://{}:{}/v1".format(self.host, self.port)
+
+    async def start(self) -> "FakeLLMServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Closing idle keep-alive connections lets their handlers finish
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._respond(writer, json.loads(body or b"{}"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    def _completion(self, request: dict, chunk: bool) -> dict:
+        tokens = len(self.reply.split())
+        message = {"role": "assistant", "content": self.reply}
+        return {
+            "id": "chatcmpl-fake-{}".format(self.requests),
+            "object": "chat.completion.chunk" if chunk else "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                **({"delta": message} if chunk else {"message": message}),
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": 10 + tokens},
+        }
+
+    def _take(self, tokens: int) -> Tuple[bool, Dict[str, str]]:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        limits = (self.rpm, self.tpm)
+        self._remaining = [min(limit, left + elapsed * limit / 60) for left, limit in zip(self._remaining, limits)]
+        allowed = not self.enforced or (self._remaining[0] >= 1 and self._remaining[1] >= tokens)
+        if allowed:
+            self._remaining[0] -= 1
+            self._remaining[1] -= tokens
+        resets = [max(0.0, (limit - left) * 60 / limit) for left, limit in zip(self._remaining, limits)]
+        headers = {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-limit-tokens": str(self.tpm),
+            "x-ratelimit-remaining-requests": str(max(0, int(self._remaining[0]))),
+            "x-ratelimit-remaining-tokens": str(max(0, int(self._remaining[1]))),
+            "x-ratelimit-reset-requests": "{:.3f}s".format(resets[0]),
+            "x-ratelimit-reset-tokens": "{:.3f}s".format(resets[1]),
+        }
+        if not allowed:
+            needed = [(1 - self._remaining[0]) * 60 / self.rpm, (tokens - self._remaining[1]) * 60 / self.tpm]
+            headers["retry-after-ms"] = str(int(1000 * max(needed)) + 1)
+        return allowed, headers
+
+    async def _respond(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        self.requests += 1
+        allowed, headers = self._take(request_tokens(request))
+        if not allowed:
+            self.throttled += 1
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            self._write(writer, "429 Too Many Requests", "application/json", json.dumps(error), headers)
+            await writer.drain()
+            return
+        await asyncio.sleep(self.latency)
+        if request.get("stream"):
+            events = [self._completion(request, chunk=True)]
+            payload = "".join("data: {}\n\n".format(json.dumps(e)) for e in events) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps(self._completion(request, chunk=False))
+            content_type = "application/json"
+        self._write(writer, "200 OK", content_type, payload, headers)
+        await writer.drain()
+
+    def _write(self, writer: asyncio.StreamWriter, status: str, content_type: str,
+               payload: str, headers: Dict[str, str]) -> None:
+        data = payload.encode("utf-8")
+        extra = "".join("{}: {}\r\n".format(name, value) for name, value in headers.items())
+        writer.write(
+            "HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n{}\r\n"
+            .format(status, content_type, len(data), extra).encode("latin-1") + data
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rpm", type=int, help="requests per minute to allow")
+    parser.add_argument("--tpm", type=int, help="tokens per minute to allow")
+    args = parser.parse_args()
+
+    server = await FakeLLMServer(latency=args.latency, port=args.port,
+                                 requests_per_minute=args.rpm, tokens_per_minute=args.tpm).start()
+    print("Listening on {}".format(server.base_url))
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""Stand-in for ``duckduckgo-mcp-server``, with the same tools and simulated latency.
+
+It speaks MCP over stdio, so it can replace the real server in the
+connection of ``MCPSessionPool`` without network access:
+
+    {"command": sys.executable, "args": ["benchmarks/fake_mcp_server.py"], "transport": "stdio"}
+
+The ``FAKE_MCP_LATENCY`` environment variable sets the seconds each tool
+call takes (0.1 by default).
+"""
+import asyncio
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+LATENCY = float(os.environ.get("FAKE_MCP_LATENCY", "0.1"))
+
+mcp = FastMCP("fake-ddg", log_level="WARNING")
+
+
+@mcp.tool()
+async def search(query: str, max_results: int = 10) -> str:
+    """Search DuckDuckGo and return formatted results."""
+    await asyncio.sleep(LATENCY)
+    return "\n".join(
+        "{}. Result for {}\n   URL: https://example.com/{}".format(i + 1, query, i)
+        for i in range(max_results)
+    )
+
+
+@mcp.tool()
+async def fetch_content(url: str) -> str:
+    """Fetch and parse content from a webpage URL."""
+    await asyncio.sleep(LATENCY)
+    return "Content of {}".format(url)
+
+
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,82 @@
+"""Load test of the chatbot graph against a local fake LLM server.
+
+Runs the chatbot graph with many concurrent threads, comparing its async
+``call_model`` node with a blocking variant that calls ``llm.invoke``
+(which LangGraph has to run in its executor threads). No API keys are
+needed. Run it from the ``lg-llm-with_server`` folder with:
+
+    uv run python benchmarks/load.py --concurrency 10 100 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fake_llm_server import FakeLLMServer
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def run_threads(graph, concurrency: int) -> Dict[str, float]:
+    async def run_one(i: int) -> float:
+        start = time.perf_counter()
+        await graph.ainvoke(
+            {"messages": [("user", "Hello, this is thread {}".format(i))]},
+            {"configurable": {"thread_id": str(i)}},
+        )
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(run_one(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": concurrency / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.mean(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency in seconds")
+    args = parser.parse_args()
+
+    server = await FakeLLMServer(latency=args.latency).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    # Import after pointing the OpenAI client at the fake server
+    from langgraph.graph import StateGraph, START
+    from agent.chatbot import State, llm, graph as async_graph
+
+    def blocking_call_model(state: State) -> Dict[str, Any]:
+        return { "messages": llm.invoke(state["messages"]) }
+
+    blocking_graph = (
+        StateGraph(State)
+        .add_node("call_model", blocking_call_model)
+        .add_edge(START, "call_model")
+        .compile()
+    )
+
+    print("{:>12} {:>10} {:>12} {:>10} {:>10}".format("concurrency", "node", "runs/s", "p50 (s)", "p99 (s)"))
+    for concurrency in args.concurrency:
+        for label, graph in (("blocking", blocking_graph), ("async", async_graph)):
+            result = await run_threads(graph, concurrency)
+            print("{:>12} {:>10} {:>12.1f} {:>10.3f} {:>10.3f}".format(
+                concurrency, label, result["throughput"], result["p50"], result["p99"]))
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
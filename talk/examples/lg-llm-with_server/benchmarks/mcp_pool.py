@@ -0,0 +1,77 @@
+"""Compares per-graph MCP clients with the shared session pool.
+
+Measures how long ``make_graph()`` of the searcher takes, and how long a
+burst of concurrent tool calls takes, with a fresh ``MultiServerMCPClient``
+(as the searchers used to do) and with ``MCPSessionPool``. It uses the
+local ``fake_mcp_server.py`` instead of DuckDuckGo, so no network access or
+API keys are needed. Run it from the ``lg-llm-with_server`` folder with:
+
+    uv run python benchmarks/mcp_pool.py --graphs 5 --calls 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+FAKE_CONNECTION = {
+    "command": sys.executable,
+    "args": [os.path.join(os.path.dirname(__file__), "fake_mcp_server.py")],
+    "transport": "stdio",
+}
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+
+async def burst(tools, calls: int) -> float:
+    search = next(t for t in tools if t.name == "search")
+    elapsed, _ = await timed(asyncio.gather(*(
+        search.ainvoke({"query": "query {}".format(i)}) for i in range(calls)
+    )))
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--graphs", type=int, default=5, help="number of graphs to create")
+    parser.add_argument("--calls", type=int, default=20, help="concurrent tool calls")
+    parser.add_argument("--size", type=int, default=4, help="sessions in the pool")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    from agent import mcp_pool
+    from agent.searcher import make_graph
+
+    client_times = []
+    for _ in range(args.graphs):
+        elapsed, tools = await timed(MultiServerMCPClient({"ddg": FAKE_CONNECTION}).get_tools())
+        client_times.append(elapsed)
+    client_burst = await burst(tools, args.calls)
+
+    mcp_pool.ddg_pool.connection = FAKE_CONNECTION
+    mcp_pool.ddg_pool.size = args.size
+    graph_times = []
+    for _ in range(args.graphs):
+        start = time.perf_counter()
+        async with make_graph():
+            graph_times.append(time.perf_counter() - start)
+    pool_burst = await burst(await mcp_pool.ddg_pool.get_tools(), args.calls)
+    await mcp_pool.ddg_pool.aclose()
+
+    print("{:>16} {:>14} {:>14} {:>18}".format("", "first (s)", "later (s)", "{} calls (s)".format(args.calls)))
+    print("{:>16} {:>14.3f} {:>14.3f} {:>18.3f}".format(
+        "per-graph client", client_times[0], sum(client_times[1:]) / max(1, len(client_times) - 1), client_burst))
+    print("{:>16} {:>14.3f} {:>14.3f} {:>18.3f}".format(
+        "session pool", graph_times[0], sum(graph_times[1:]) / max(1, len(graph_times) - 1), pool_burst))
+    print("Pool stats: {}".format(mcp_pool.ddg_pool.stats))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Compares the chatbot graph with and without the shared rate limiter.
+
+Runs many concurrent chatbot threads against a local fake LLM server that
+enforces an RPM limit, and reports how many requests the server rejected
+with a 429 error, how many threads failed after the client's own retries,
+and the latency of interactive threads against that of batch threads (which
+get a lower priority from the limiter). No API keys are needed. Run it from
+the ``lg-llm-with_server`` folder with:
+
+    uv run python benchmarks/rate_limits.py --threads 150 --rpm 120
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fake_llm_server import FakeLLMServer
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def seconds(value: Optional[float]) -> str:
+    return "-" if value is None else "{:.2f}".format(value)
+
+
+async def run(args, limited: bool) -> None:
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    import agent  # noqa: F401 (the package replaces the chatbot attribute with its graph)
+    from agent.rate_limits import BATCH, INTERACTIVE, RateLimitedAsyncTransport, RateLimiter, request_priority
+
+    chatbot = sys.modules["agent.chatbot"]
+    server = await FakeLLMServer(latency=args.latency, requests_per_minute=args.rpm,
+                                 tokens_per_minute=args.tpm).start()
+    limiter = RateLimiter()
+    transport = httpx.AsyncHTTPTransport()
+    client = httpx.AsyncClient(transport=RateLimitedAsyncTransport(limiter, transport) if limited else transport)
+    chatbot.llm = ChatOpenAI(model="gpt-4o-mini", base_url=server.base_url, max_tokens=args.max_tokens,
+                             http_async_client=client)
+
+    async def run_one(i: int) -> Tuple[int, float, bool]:
+        priority = BATCH if i % 2 else INTERACTIVE
+        with request_priority(priority):
+            start = time.perf_counter()
+            try:
+                await chatbot.graph.ainvoke(
+                    {"messages": [("user", "Hello, this is thread {}".format(i))]},
+                    {"configurable": {"thread_id": str(i)}},
+                )
+                return priority, time.perf_counter() - start, True
+            except Exception:
+                return priority, time.perf_counter() - start, False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_one(i) for i in range(args.threads)))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+    await client.aclose()
+
+    interactive = [t for p, t, ok in results if ok and p == INTERACTIVE]
+    batch = [t for p, t, ok in results if ok and p == BATCH]
+    failed = sum(1 for _, _, ok in results if not ok)
+    print("{:>10} {:>8} {:>8} {:>8} {:>16} {:>16} {:>10}".format(
+        "limiter" if limited else "none", server.requests, server.throttled, failed,
+        seconds(percentile(interactive, 90)), seconds(percentile(batch, 90)), seconds(elapsed)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=150)
+    parser.add_argument("--rpm", type=int, default=120, help="requests per minute allowed by the server")
+    parser.add_argument("--tpm", type=int, help="tokens per minute allowed by the server")
+    parser.add_argument("--max-tokens", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency in seconds")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+    print("{:>10} {:>8} {:>8} {:>8} {:>16} {:>16} {:>10}".format(
+        "scheduler", "requests", "429s", "failed", "interactive p90", "batch p90", "total (s)"))
+    for limited in (False, True):
+        await run(args, limited)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,25 +1,38 @@
 from typing import Any, Dict
 from langgraph.graph import StateGraph, MessagesState, START
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 
+from agent.compaction import MessageCompactor
+from agent.http_clients import http_async_client, http_client
+from agent.metrics import instrument
+
 llm = ChatOpenAI(
     model="gpt-4o-mini",
     temperature=0.1,
     timeout=10,
-    max_tokens=5_000
+    max_tokens=5_000,
+    http_client=http_client,
+    http_async_client=http_async_client,
 )
 
+# Older messages are summarized in the background instead of resent in full
+compactor = MessageCompactor(max_tokens=8_000, summarizer=llm)
+
 class State(MessagesState):
     # nothing else
     pass
 
 
-def call_model(state: State) -> Dict[str, Any]:
-    return { "messages": llm.invoke(state["messages"]) }
+async def call_model(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    messages, saved = compactor.compact_with_savings(state["messages"], config)
+    response = await llm.ainvoke(messages)
+    response.response_metadata["compaction_tokens_saved"] = saved
+    return { "messages": response }
 
 
 # Define the graph
-graph = (
+graph = instrument(
     StateGraph(State)
     .add_node(call_model)
     .add_edge(START, "call_model")
@@ -0,0 +1,12 @@
+"""HTTP clients of the module-level models of the graphs.
+
+They send the requests of the models through the process-wide
+``rate_limiter`` of ``agent.rate_limits``, so all the graphs of a server
+share the same RPM and TPM limits.
+"""
+import httpx
+
+from agent.rate_limits import RateLimitedAsyncTransport, RateLimitedTransport, rate_limiter
+
+http_client = httpx.Client(transport=RateLimitedTransport(rate_limiter, httpx.HTTPTransport()))
+http_async_client = httpx.AsyncClient(transport=RateLimitedAsyncTransport(rate_limiter, httpx.AsyncHTTPTransport()))
@@ -9,28 +9,26 @@ from langgraph.types import interrupt
 from langchain.chat_models import init_chat_model
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from agent.http_clients import http_async_client, http_client
+from agent.mcp_pool import ddg_limiter, ddg_pool
+from agent.metrics import instrument
+from agent.tool_cache import tool_cache
 
 llm = init_chat_model(
     "gpt-4o-mini",
     temperature=0.1,
     timeout=10,
-    max_tokens=5_000
+    max_tokens=5_000,
+    http_client=http_client,
+    http_async_client=http_async_client,
 )
 
 @asynccontextmanager
 async def make_graph():
-    client = MultiServerMCPClient(
-        {
-            "ddg": {
-                "command": "uvx",
-                "args": ["duckduckgo-mcp-server"],
-                "transport": "stdio"
-            }
-        }
-    )
-
-    mcp_tools = await client.get_tools()
+    # The DDG server processes are started once, and shared across graphs.
+    # Cache hits skip the limits, which only apply to the actual calls.
+    mcp_tools = [tool_cache.wrap(ddg_limiter.wrap(t)) for t in await ddg_pool.get_tools()]
     search_tool = next(e for e in mcp_tools if e.name == 'search')
     fetch_tool = next(e for e in mcp_tools if e.name != 'search')
 
@@ -67,8 +65,8 @@ async def make_graph():
         # nothing else
         pass
 
-    def call_model(state: State) -> Dict[str, Any]:
-        return { "messages": llm_with_tools.invoke(state["messages"]) }
+    async def call_model(state: State) -> Dict[str, Any]:
+        return { "messages": await llm_with_tools.ainvoke(state["messages"]) }
 
     # Define the graph
     graph = (
@@ -81,4 +79,4 @@ async def make_graph():
         .compile(name="Chatbot with interruptible DDG search")
     )
 
-    yield graph
+    yield instrument(graph)
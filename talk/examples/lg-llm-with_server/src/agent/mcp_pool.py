@@ -0,0 +1,272 @@
+"""Pool of long-lived MCP client sessions shared by the searcher graphs.
+
+``MultiServerMCPClient.get_tools()`` starts a new MCP server process to list
+the tools, and another one for every single tool call. ``MCPSessionPool``
+instead keeps a few server processes running with an open session each,
+and sends every tool call to the least busy of them. A background task
+pings the sessions and restarts the ones that stop answering.
+
+Each session is opened and closed by its own task, as the stdio transport
+has to be entered and exited from the same task.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+import anyio
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_mcp_adapters.sessions import Connection, create_session
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from agent.tool_limits import ToolLimit, ToolLimiter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MCPPoolStats:
+    started: int = 0
+    restarts: int = 0
+    calls: int = 0
+    retried_calls: int = 0
+    failed_health_checks: int = 0
+
+
+class _Worker:
+    """One MCP server process with its open session and tools."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.session: Optional[ClientSession] = None
+        self.tools: Dict[str, BaseTool] = {}
+        self.in_flight = 0
+        self.stop = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and not self.stop.is_set()
+
+
+class MCPSessionPool:
+    """Keeps ``size`` warm sessions to an MCP server and spreads tool calls over them.
+
+    Args:
+        connection (Connection): How to reach the MCP server, as given to
+            ``MultiServerMCPClient`` for each server. It is read again
+            whenever a session is (re)started.
+        size (int): Number of sessions (and server processes) to keep.
+        health_interval (float): Seconds between pings to each session.
+        timeout (float): Seconds allowed to start a session or answer a ping.
+    """
+
+    def __init__(self, connection: Connection, size: int = 2,
+                 health_interval: float = 30.0, timeout: float = 30.0):
+        self.connection = connection
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self.timeout = timeout
+        self.stats = MCPPoolStats()
+        self._workers: List[_Worker] = []
+        self._tools: List[BaseTool] = []
+        self._monitor: Optional[asyncio.Task] = None
+        self._restarting: Set[_Worker] = set()
+        self._background: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get_tools(self) -> List[BaseTool]:
+        """Return the tools of the server, starting the pool on first use."""
+        await self.start()
+        return list(self._tools)
+
+    async def start(self) -> None:
+        """Start the sessions, unless they are already running in this event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sessions and locks cannot be shared across event loops
+            self._loop, self._lock = loop, asyncio.Lock()
+            self._workers, self._tools, self._monitor = [], [], None
+        async with self._lock:
+            if self._workers:
+                return
+            workers = [_Worker(i) for i in range(self.size)]
+            results = await asyncio.gather(*(self._start(w) for w in workers), return_exceptions=True)
+            failed = [r for r in results if isinstance(r, BaseException)]
+            if len(failed) == len(workers):
+                raise failed[0]
+            for error in failed:
+                logger.warning("Could not start MCP session: %s", error)
+            self._workers = workers
+            self._tools = [self._pooled_tool(t) for t in self._any_alive().tools.values()]
+            self._monitor = asyncio.create_task(self._check_health(), name="mcp-pool-health")
+
+    async def aclose(self) -> None:
+        """Close all sessions and stop their server processes."""
+        for task in [self._monitor, *self._background]:
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        for worker in self._workers:
+            worker.stop.set()
+        await asyncio.gather(*(w.task for w in self._workers if w.task), return_exceptions=True)
+        self._workers, self._tools, self._monitor = [], [], None
+
+    def in_flight(self) -> List[int]:
+        """Return the number of tool calls running on each session."""
+        return [w.in_flight for w in self._workers]
+
+    async def _start(self, worker: _Worker) -> None:
+        ready = asyncio.get_running_loop().create_future()
+        worker.task = asyncio.create_task(self._serve(worker, ready), name="mcp-session-{}".format(worker.index))
+        try:
+            await asyncio.wait_for(ready, self.timeout)
+        except BaseException:
+            worker.stop.set()
+            worker.task.cancel()
+            raise
+        self.stats.started += 1
+
+    async def _serve(self, worker: _Worker, ready: asyncio.Future) -> None:
+        try:
+            async with create_session(self.connection) as session:
+                await session.initialize()
+                tools = await load_mcp_tools(session)
+                worker.session = session
+                worker.tools = {t.name: t for t in tools}
+                ready.set_result(None)
+                await worker.stop.wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+            raise
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning("MCP session %d ended with an error: %s", worker.index, e)
+        finally:
+            worker.session = None
+            worker.closed.set()
+        if ready.done() and not worker.stop.is_set():
+            # The server process went away on its own
+            self._restart_later(worker)
+
+    def _restart_later(self, worker: _Worker) -> None:
+        worker.stop.set()
+        task = asyncio.create_task(self._restart(worker))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _restart(self, worker: _Worker) -> None:
+        if worker in self._restarting or worker not in self._workers:
+            return
+        self._restarting.add(worker)
+        try:
+            worker.stop.set()
+            await asyncio.gather(worker.task, return_exceptions=True)
+            replacement = _Worker(worker.index)
+            await self._start(replacement)
+            self._workers[self._workers.index(worker)] = replacement
+            self.stats.restarts += 1
+        finally:
+            self._restarting.discard(worker)
+
+    async def _check_health(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in [w for w in self._workers if w not in self._restarting]:
+                try:
+                    if worker.session is None:
+                        raise ConnectionError("session is closed")
+                    await asyncio.wait_for(worker.session.send_ping(), self.timeout)
+                except Exception as e:
+                    self.stats.failed_health_checks += 1
+                    logger.warning("MCP session %d failed its health check (%s), restarting it", worker.index, e)
+                    try:
+                        await self._restart(worker)
+                    except Exception:
+                        logger.exception("Could not restart MCP session %d", worker.index)
+
+    def _any_alive(self) -> _Worker:
+        return next(w for w in self._workers if w.alive)
+
+    def _least_busy(self) -> _Worker:
+        alive = [w for w in self._workers if w.alive]
+        if not alive:
+            raise ConnectionError("No MCP session is available")
+        return min(alive, key=lambda w: w.in_flight)
+
+    def _pooled_tool(self, tool: BaseTool) -> BaseTool:
+        async def call_tool(**arguments: Any):
+            return await self._call(tool.name, arguments)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=call_tool,
+            response_format="content_and_artifact",
+            metadata=tool.metadata,
+        )
+
+    @staticmethod
+    async def _invoke(tool: BaseTool, arguments: Dict[str, Any]):
+        # Invoked as a tool call, so its answer keeps the artifact of the MCP result
+        message = await tool.ainvoke({"type": "tool_call", "name": tool.name, "args": arguments,
+                                      "id": str(uuid.uuid4())})
+        return message.content, message.artifact
+
+    async def _call(self, name: str, arguments: Dict[str, Any]):
+        self.stats.calls += 1
+        for attempt in range(2):
+            worker = self._least_busy()
+            worker.in_flight += 1
+            call = asyncio.ensure_future(self._invoke(worker.tools[name], arguments))
+            closed = asyncio.ensure_future(worker.closed.wait())
+            try:
+                # Requests pending on a session that went away are never answered
+                await asyncio.wait({call, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if call.done():
+                    return call.result()
+            except McpError as e:
+                if e.error.code != CONNECTION_CLOSED or attempt:
+                    raise
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError, ConnectionError, OSError):
+                if attempt:
+                    raise
+            finally:
+                worker.in_flight -= 1
+                closed.cancel()
+                call.cancel()
+            if attempt:
+                raise ConnectionError("MCP session closed during a call to {}".format(name))
+            # The server process went away: retry once on another session
+            logger.warning("MCP session %d closed during a call to %s, retrying", worker.index, name)
+            self.stats.retried_calls += 1
+            self._restart_later(worker)
+
+
+DDG_CONNECTION: Connection = {
+    "command": "uvx",
+    "args": ["duckduckgo-mcp-server"],
+    "transport": "stdio",
+}
+
+# Shared by the searcher graphs, so make_graph() does not start new servers
+ddg_pool = MCPSessionPool(DDG_CONNECTION, size=int(os.environ.get("MCP_POOL_SIZE", "2")))
+
+# Bounds how many searches and fetches the searchers send to those servers
+ddg_limiter = ToolLimiter({
+    "search": ToolLimit(max_concurrency=4, timeout=20),
+    "fetch_content": ToolLimit(max_concurrency=2, timeout=30),
+})
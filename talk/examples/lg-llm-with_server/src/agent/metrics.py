@@ -0,0 +1,392 @@
+"""Per-node latency, token and cost metrics for LangGraph graphs, without LangSmith.
+
+``instrument(graph)`` attaches a callback handler that records, for every
+node (including the nodes of subgraphs, as ``parent/child`` paths):
+
+* the wall time of the node,
+* the time spent in chat model and tool calls made from the node, and the
+  time to the first token of the chat model calls that stream,
+* the prompt and completion tokens of those calls, and their estimated cost,
+* the prompt tokens served from the provider's prompt cache.
+
+Durations are kept as Prometheus histograms. They can be scraped from an
+HTTP endpoint, or written to a file in the OpenMetrics text format, e.g.
+for ``node_exporter``'s textfile collector. Instrumentation is only enabled
+through these environment variables, and ``instrument`` returns the graph
+untouched otherwise:
+
+* ``AGENT_METRICS_PORT``: serve the metrics at ``http://localhost:PORT/metrics``.
+* ``AGENT_METRICS_FILE``: write the metrics to this file every
+  ``AGENT_METRICS_INTERVAL`` seconds (10 by default) and on exit.
+* ``AGENT_METRICS``: set to ``1`` to only collect them in ``metrics``.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Buckets in seconds, from fast nodes to long agent loops
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# USD per million (prompt, completion) tokens
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# Fraction of the prompt price billed for tokens read from the prompt cache
+CACHED_PROMPT_DISCOUNT = 0.5
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def estimate_cost(model_name: Optional[str], prompt_tokens: int, completion_tokens: int,
+                  cached_tokens: int = 0) -> float:
+    """Return the cost in USD of a call, or 0 for models without a known price.
+
+    ``cached_tokens`` are the part of ``prompt_tokens`` read from the prompt cache.
+    """
+    if not model_name:
+        return 0.0
+    # Match dated snapshots (e.g. gpt-4o-mini-2024-07-18) to the longest known prefix
+    matches = [name for name in PRICES if model_name.split(":")[-1].startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = PRICES[max(matches, key=len)]
+    prompt_cost = (prompt_tokens - cached_tokens * (1 - CACHED_PROMPT_DISCOUNT)) * prompt_price
+    return (prompt_cost + completion_tokens * completion_price) / 1_000_000
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe store of histograms and counters, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, help: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help[name] = help
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, help: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help[name] = help
+            self._counters[name][key] += value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, openmetrics: bool = False) -> str:
+        """Return the metrics in the Prometheus text format, or in OpenMetrics if requested."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines += ["# HELP {} {}".format(name, self._help[name]), "# TYPE {} histogram".format(name)]
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append("{}_bucket{} {}".format(name, _labels(labels + (("le", le),)), cumulative))
+                    lines.append("{}_sum{} {}".format(name, _labels(labels), histogram.sum))
+                    lines.append("{}_count{} {}".format(name, _labels(labels), histogram.count))
+            for name, series in sorted(self._counters.items()):
+                # OpenMetrics names the counter family without the _total suffix
+                family = name[:-len("_total")] if openmetrics and name.endswith("_total") else name
+                lines += ["# HELP {} {}".format(family, self._help[name]), "# TYPE {} counter".format(family)]
+                for labels, value in sorted(series.items()):
+                    lines.append("{}{} {}".format(name, _labels(labels), value))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics in the OpenMetrics format, replacing the file atomically."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render(openmetrics=True))
+        os.replace(tmp_path, path)
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _node_path(metadata: Dict[str, Any]) -> str:
+    """Return e.g. ``find_things_to_do/agent`` for the node of a subgraph."""
+    namespace = metadata.get("langgraph_checkpoint_ns", "")
+    if not namespace:
+        return metadata.get("langgraph_node", "")
+    return "/".join(part.split(":")[0] for part in namespace.split("|"))
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records node, chat model and tool metrics of the runs of a graph.
+
+    Args:
+        graph_name (str): Value of the ``graph`` label.
+        registry (MetricsRegistry): Where to record the metrics.
+    """
+
+    # Record from the thread of the run, instead of an executor
+    run_inline = True
+
+    def __init__(self, graph_name: str, registry: "MetricsRegistry"):
+        self.graph_name = graph_name
+        self.registry = registry
+        self._started: Dict[UUID, Tuple[float, str, Optional[str]]] = {}
+        # Chat model calls that have not streamed a token yet
+        self._awaiting_token: Set[UUID] = set()
+
+    def _start(self, run_id: UUID, node: str, name: Optional[str] = None) -> None:
+        self._started[run_id] = (time.perf_counter(), node, name)
+
+    def _finish(self, run_id: UUID) -> Optional[Tuple[float, str, Optional[str]]]:
+        self._awaiting_token.discard(run_id)
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        start, node, name = started
+        return time.perf_counter() - start, node, name
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None,
+                       **kwargs: Any) -> None:
+        metadata = metadata or {}
+        # Node runs are tagged with their superstep, unlike the runnables inside them
+        is_node = kwargs.get("name") == metadata.get("langgraph_node") and any(
+            t.startswith("graph:step:") for t in tags or ()
+        )
+        if is_node:
+            self._start(run_id, _node_path(metadata))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            self.registry.observe(
+                "agent_node_duration_seconds", "Wall time of graph nodes.",
+                finished[0], graph=self.graph_name, node=finished[1],
+            )
+
+    # Interrupts also end a node with an error
+    on_chain_error = on_chain_end
+
+    def on_chat_model_start(self, serialized: Optional[Dict[str, Any]], messages: Any, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, _node_path(metadata or {}), params.get("model_name") or params.get("model"))
+        self._awaiting_token.add(run_id)
+
+    def on_llm_start(self, serialized: Optional[Dict[str, Any]], prompts: Any, *, run_id: UUID,
+                     metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._awaiting_token:
+            return
+        self._awaiting_token.discard(run_id)
+        start, node, model = self._started[run_id]
+        self.registry.observe(
+            "agent_llm_time_to_first_token_seconds",
+            "Time from the start of streaming chat model calls to their first token.", time.perf_counter() - start, graph=self.graph_name, node=node, model=model or "unknown",
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if not finished:
+            return
+        duration, node, model = finished
+        model = model or (response.llm_output or {}).get("model_name") or "unknown"
+        labels = {"graph": self.graph_name, "node": node, "model": model}
+        self.registry.observe("agent_llm_duration_seconds", "Time spent in chat model calls.", duration, **labels)
+
+        prompt_tokens, completion_tokens, cached_tokens = _token_usage(response)
+        help = "Tokens used by chat model calls."
+        self.registry.inc("agent_llm_tokens_total", help, prompt_tokens, kind="prompt", **labels)
+        self.registry.inc("agent_llm_tokens_total", help, completion_tokens, kind="completion", **labels)
+        # Part of the prompt tokens, so a hit rate is cache_read / prompt
+        self.registry.inc("agent_llm_tokens_total", help, cached_tokens, kind="cache_read", **labels)
+        self.registry.inc(
+            "agent_llm_cost_usd_total", "Estimated cost of chat model calls in USD.",
+            estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens), **labels,
+        )
+        if cached_tokens:
+            logger.debug("%s: %d of %d prompt tokens read from the prompt cache", node, cached_tokens, prompt_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            duration, node, model = finished
+            self.registry.observe(
+                "agent_llm_duration_seconds", "Time spent in chat model calls.", duration,
+                graph=self.graph_name, node=node, model=model or "unknown",
+            )
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID,
+                      metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, _node_path(metadata or {}), (serialized or {}).get("name") or kwargs.get("name"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            duration, node, tool = finished
+            self.registry.observe(
+                "agent_tool_duration_seconds", "Time spent in tool calls.", duration,
+                graph=self.graph_name, node=node, tool=tool or "unknown",
+            )
+
+    on_tool_error = on_tool_end
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int, int]:
+    prompt_tokens = completion_tokens = cached_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0)
+    if not prompt_tokens and not completion_tokens:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = self.registry.render(openmetrics=openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", (
+            "application/openmetrics-text; version=1.0.0; charset=utf-8" if openmetrics
+            else "text/plain; version=0.0.4; charset=utf-8"
+        ))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(registry: MetricsRegistry, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics at ``/metrics`` from a background thread."""
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_periodically(registry: MetricsRegistry, path: str, interval: float) -> None:
+    """Write the metrics to ``path`` every ``interval`` seconds, and on exit."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write(path)
+            except OSError:
+                logger.exception("Could not write metrics to %s", path)
+
+    threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+    atexit.register(registry.write, path)
+
+
+metrics = MetricsRegistry()
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def metrics_enabled() -> bool:
+    return any(os.environ.get(v) for v in ("AGENT_METRICS", "AGENT_METRICS_PORT", "AGENT_METRICS_FILE"))
+
+
+def _start_exporters() -> None:
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+        port = os.environ.get("AGENT_METRICS_PORT")
+        if port:
+            try:
+                serve(metrics, int(port))
+                logger.info("Serving graph metrics at http://127.0.0.1:%s/metrics", port)
+            except OSError:
+                logger.exception("Could not serve graph metrics on port %s", port)
+        path = os.environ.get("AGENT_METRICS_FILE")
+        if path:
+            write_periodically(metrics, path, float(os.environ.get("AGENT_METRICS_INTERVAL", "10")))
+
+
+def instrument(graph: Any, name: Optional[str] = None) -> Any:
+    """
+    Returns the graph with a metrics callback handler attached, if enabled
+    through the environment variables. Otherwise, returns it unchanged.
+    Args:
+        graph: A compiled graph (callbacks cannot be set on a ``StateGraph``).
+        name (str): Value of the ``graph`` label. Defaults to the graph's name.
+    """
+    if not metrics_enabled():
+        return graph
+    _start_exporters()
+    handler = MetricsCallbackHandler(name or graph.name, metrics)
+    return graph.with_config(callbacks=[handler])
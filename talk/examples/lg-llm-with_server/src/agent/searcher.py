@@ -5,35 +5,42 @@ from typing import Any, Dict
 from langgraph.graph import StateGraph, MessagesState, START
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain.chat_models import init_chat_model
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_core.runnables import RunnableConfig
+
+from agent.compaction import MessageCompactor
+from agent.http_clients import http_async_client, http_client
+from agent.mcp_pool import ddg_limiter, ddg_pool
+from agent.metrics import instrument
+from agent.tool_cache import tool_cache
 
 llm = init_chat_model(
     "gpt-4o-mini",
     temperature=0.1,
     timeout=10,
-    max_tokens=5_000
+    max_tokens=5_000,
+    http_client=http_client,
+    http_async_client=http_async_client,
 )
 
+# Long fetched pages are truncated, and older messages are summarized
+compactor = MessageCompactor(max_tokens=8_000, max_tool_tokens=2_000, summarizer=llm)
+
 @asynccontextmanager
 async def make_graph():
-    client = MultiServerMCPClient(
-        {
-            "ddg": {
-                "command": "uvx",
-                "args": ["duckduckgo-mcp-server"],
-                "transport": "stdio"
-            }
-        }
-    )
-    tools = await client.get_tools()
+    # The DDG server processes are started once, and shared across graphs.
+    # Cache hits skip the limits, which only apply to the actual calls.
+    tools = [tool_cache.wrap(ddg_limiter.wrap(t)) for t in await ddg_pool.get_tools()]
     llm_with_tools = llm.bind_tools(tools)
 
     class State(MessagesState):
         # nothing else
         pass
 
-    def call_model(state: State) -> Dict[str, Any]:
-        return { "messages": llm_with_tools.invoke(state["messages"]) }
+    async def call_model(state: State, config: RunnableConfig) -> Dict[str, Any]:
+        messages, saved = compactor.compact_with_savings(state["messages"], config)
+        response = await llm_with_tools.ainvoke(messages)
+        response.response_metadata["compaction_tokens_saved"] = saved
+        return { "messages": response }
 
     # Define the graph
     graph = (
@@ -46,4 +53,4 @@ async def make_graph():
         .compile(name="Chatbot with DDG search")
     )
 
-    yield graph
+    yield instrument(graph)
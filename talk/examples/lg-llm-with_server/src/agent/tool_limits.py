@@ -0,0 +1,108 @@
+"""Per-tool concurrency limits and timeouts.
+
+``ToolNode`` already runs the tool calls of an ``AIMessage`` concurrently
+when the graph runs asynchronously, and returns their ``ToolMessage``s in
+the same order as the tool calls. ``ToolLimiter`` bounds how many calls of
+each tool run at once (e.g. to avoid flooding an MCP server when the model
+asks for many fetches), and turns calls that take too long into error
+results, so a slow ``fetch`` does not hold back the whole step.
+
+The semaphores are created for each event loop, as asyncio primitives are
+bound to the loop that first uses them: the limits apply to the calls made
+from the same loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+
+@dataclass
+class ToolLimit:
+    max_concurrency: int = 4
+    timeout: Optional[float] = 30.0
+
+
+@dataclass
+class ToolLimitStats:
+    calls: int = 0
+    queued: int = 0
+    timeouts: int = 0
+    cancellations: int = 0
+
+
+class ToolLimiter:
+    """Wraps tools so their calls respect a concurrency limit and a timeout.
+
+    Args:
+        limits (Dict[str, ToolLimit]): Limits for each tool name.
+        default (ToolLimit): Limits for the tools not in ``limits``
+            (``ToolLimit()`` if not given).
+    """
+
+    def __init__(self, limits: Optional[Dict[str, ToolLimit]] = None, default: Optional[ToolLimit] = None):
+        self.limits = dict(limits or {})
+        self.default = default if default is not None else ToolLimit()
+        self.stats = ToolLimitStats()
+        # Semaphores of each tool, for each event loop
+        self._semaphores: Dict[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]] = {}
+        self._lock = threading.Lock()
+
+    def limit_for(self, tool_name: str) -> ToolLimit:
+        return self.limits.get(tool_name, self.default)
+
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                # The semaphores refer to their loop, so forget the loops that were closed
+                for closed in [other for other in self._semaphores if other.is_closed()]:
+                    del self._semaphores[closed]
+            semaphores = self._semaphores.setdefault(loop, {})
+            if tool_name not in semaphores:
+                semaphores[tool_name] = asyncio.Semaphore(self.limit_for(tool_name).max_concurrency)
+            return semaphores[tool_name]
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Return an async tool with the same name and schema, subject to the limits.
+
+        A call that times out is cancelled and reported to the model as a
+        failed tool call. Like ``ToolCache.wrap``, the wrapped tool keeps
+        both the content and the artifact of the original results.
+        """
+        limit = self.limit_for(tool.name)
+
+        async def acall(config: RunnableConfig, **kwargs: Any):
+            semaphore = self._semaphore(tool.name)
+            self.stats.calls += 1
+            if semaphore.locked():
+                self.stats.queued += 1
+            tool_call = {"type": "tool_call", "name": tool.name, "args": kwargs, "id": str(uuid.uuid4())}
+            try:
+                async with semaphore:
+                    message: ToolMessage = await asyncio.wait_for(tool.ainvoke(tool_call, config), limit.timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                raise ToolException("The {} tool timed out after {} seconds".format(tool.name, limit.timeout))
+            except asyncio.CancelledError:
+                self.stats.cancellations += 1
+                raise
+            if message.status == "error":
+                raise ToolException(message.content)
+            return message.content, message.artifact
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=acall,
+            response_format="content_and_artifact",
+            handle_tool_error=True,
+        )
@@ -0,0 +1,100 @@
+"""Concurrency tests of the chatbot graph against the fake LLM server.
+
+The server runs on an event loop of its own, in a background thread, so a
+node that blocks the event loop of the graph makes these tests fail
+instead of hanging. No API keys are needed. Run them from the
+``lg-llm-with_server`` folder with:
+
+    uv run pytest
+"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from fake_llm_server import FakeLLMServer
+
+# Seconds the fake server waits before answering each request
+LATENCY = 0.2
+CONCURRENCY = 20
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    # All the tests of the module share one event loop, like the module-level
+    # HTTP client of the graphs does
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+def fake_llm_server():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(FakeLLMServer(latency=LATENCY).start(), loop).result()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def chatbot(fake_llm_server):
+    environ = dict(os.environ)
+    os.environ["OPENAI_BASE_URL"] = fake_llm_server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    # Import after pointing the OpenAI client at the fake server
+    from agent.chatbot import graph
+    yield graph
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+async def run_threads(graph, prefix: str):
+    return await asyncio.gather(*(
+        graph.ainvoke(
+            {"messages": [("user", "Hello, this is thread {}".format(i))]},
+            {"configurable": {"thread_id": "{}-{}".format(prefix, i)}},
+        )
+        for i in range(CONCURRENCY)
+    ))
+
+
+async def test_concurrent_runs_overlap(chatbot, fake_llm_server):
+    requests = fake_llm_server.requests
+    start = time.perf_counter()
+    results = await run_threads(chatbot, "overlap")
+    elapsed = time.perf_counter() - start
+
+    assert fake_llm_server.requests - requests == CONCURRENCY
+    assert all(result["messages"][-1].content == fake_llm_server.reply for result in results)
+    # Sequential runs would take CONCURRENCY * LATENCY seconds
+    assert elapsed < CONCURRENCY * LATENCY / 4
+
+
+async def test_concurrent_runs_do_not_block_the_event_loop(chatbot):
+    interval = 0.01
+    delays = []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            delays.append(time.perf_counter() - start - interval)
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        await run_threads(chatbot, "heartbeat")
+    finally:
+        done.set()
+        await beat
+
+    # A node waiting for the model without awaiting would stall it for LATENCY seconds
+    assert delays
+    assert max(delays) < LATENCY / 2
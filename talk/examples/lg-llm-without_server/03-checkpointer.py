@@ -1,9 +1,12 @@
 from typing import Any, Dict
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, MessagesState, START
-from langgraph.checkpoint.memory import InMemorySaver
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from bounded_saver import BoundedInMemorySaver
+from compaction import MessageCompactor
 
 load_dotenv()
 
@@ -14,13 +17,18 @@ llm = init_chat_model(
     max_tokens=5_000
 )
 
+compactor = MessageCompactor(max_tokens=8_000)
+
 class State(MessagesState):
     # nothing else
     pass
 
 
-def call_model(state: State) -> Dict[str, Any]:
-    return { "messages": llm.invoke(state["messages"]) }
+def call_model(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    messages, saved = compactor.compact_with_savings(state["messages"], config)
+    response = llm.invoke(messages)
+    response.response_metadata["compaction_tokens_saved"] = saved
+    return { "messages": response }
 
 
 # Define the graph
@@ -30,7 +38,9 @@ graph = (
     .add_edge(START, "call_model")
     .compile(
         name="Chatbot with in-memory checkpointer",
-        checkpointer=InMemorySaver())
+        checkpointer=BoundedInMemorySaver(
+            max_checkpoints_per_thread=10,
+            max_resident_bytes=64 * 1024 * 1024))
 )
 
 if __name__ == "__main__":
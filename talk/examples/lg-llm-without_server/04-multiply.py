@@ -1,11 +1,14 @@
 from typing import Any, Dict
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, MessagesState, START
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import ToolNode, tools_condition
 from langchain.chat_models import init_chat_model
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from bounded_saver import BoundedInMemorySaver
+from compaction import MessageCompactor
 
 load_dotenv()
 
@@ -25,14 +28,18 @@ llm = init_chat_model(
 )
 tools = [multiply]
 llm_with_tools = llm.bind_tools(tools)
+compactor = MessageCompactor(max_tokens=8_000)
 
 class State(MessagesState):
     # nothing else
     pass
 
 
-def call_model(state: State) -> Dict[str, Any]:
-    return { "messages": llm_with_tools.invoke(state["messages"]) }
+def call_model(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    messages, saved = compactor.compact_with_savings(state["messages"], config)
+    response = llm_with_tools.invoke(messages)
+    response.response_metadata["compaction_tokens_saved"] = saved
+    return { "messages": response }
 
 
 # Define the graph
@@ -45,7 +52,9 @@ graph = (
     .add_edge("tools", "call_model")
     .compile(
         name="Chatbot with multiply tool",
-        checkpointer=InMemorySaver())
+        checkpointer=BoundedInMemorySaver(
+            max_checkpoints_per_thread=10,
+            max_resident_bytes=64 * 1024 * 1024))
 )
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+"""Compares the bytes written per turn by InMemorySaver and DeltaInMemorySaver.
+
+Runs a chatbot with a fake LLM (no API keys needed) for threads of various
+lengths, and reports the serialized checkpoint bytes written by each saver.
+
+    uv run benchmark_delta_saver.py --turns 10 100 1000
+"""
+import argparse
+from typing import Any, Dict
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph import StateGraph, MessagesState, START
+
+from delta_saver import DeltaInMemorySaver
+
+llm = FakeListChatModel(responses=["This is a canned answer from the fake LLM, " * 4])
+
+
+class CountingSerializer(JsonPlusSerializer):
+    """Serializer which keeps count of the bytes it has produced."""
+
+    bytes_written = 0
+
+    def dumps_typed(self, obj: Any):
+        kind, data = super().dumps_typed(obj)
+        self.bytes_written += len(data)
+        return kind, data
+
+
+def call_model(state: MessagesState) -> Dict[str, Any]:
+    return { "messages": llm.invoke(state["messages"]) }
+
+
+def run(saver_class, turns: int):
+    serde = CountingSerializer()
+    graph = (
+        StateGraph(MessagesState)
+        .add_node(call_model)
+        .add_edge(START, "call_model")
+        .compile(checkpointer=saver_class(serde=serde))
+    )
+    config = {"configurable": {"thread_id": "1"}}
+    last_turn = 0
+    for i in range(turns):
+        before = serde.bytes_written
+        graph.invoke({"messages": [HumanMessage(content="Message number {}".format(i))]}, config)
+        last_turn = serde.bytes_written - before
+    return serde.bytes_written, last_turn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    print("{:>6} {:>20} {:>14} {:>14} {:>14}".format(
+        "turns", "saver", "total bytes", "bytes/turn", "last turn"))
+    for turns in args.turns:
+        for saver_class in (InMemorySaver, DeltaInMemorySaver):
+            total, last_turn = run(saver_class, turns)
+            print("{:>6} {:>20} {:>14,} {:>14,.0f} {:>14,}".format(
+                turns, saver_class.__name__, total, total / turns, last_turn))
@@ -0,0 +1,226 @@
+"""In-memory checkpointer with bounded memory use, for long-running processes.
+
+``InMemorySaver`` keeps every checkpoint of every thread forever. This
+subclass keeps only the latest checkpoints of each thread, and once the
+resident checkpoints go over a global memory budget, it spills the least
+recently used threads to a SQLite file. A spilled thread is loaded back
+into memory the next time its ``thread_id`` is used.
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+@dataclass
+class BoundedSaverStats:
+    trimmed_checkpoints: int = 0
+    spilled_threads: int = 0
+    reloaded_threads: int = 0
+
+
+class BoundedInMemorySaver(InMemorySaver):
+    """``InMemorySaver`` with per-thread checkpoint caps and a memory budget.
+
+    Args:
+        max_checkpoints_per_thread (int): Checkpoints kept for each thread and
+            namespace. Older checkpoints (and their writes) are dropped, so
+            time travel only reaches back this far.
+        max_resident_bytes (int): Budget for the serialized checkpoints kept
+            in memory, across all threads.
+        spill_path (str): SQLite file for spilled threads. Defaults to a new
+            temporary file.
+
+    Listing checkpoints without a ``thread_id`` only covers the threads that
+    are currently in memory.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_checkpoints_per_thread: int = 10,
+        max_resident_bytes: int = 64 * 1024 * 1024,
+        spill_path: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.max_checkpoints_per_thread = max(1, max_checkpoints_per_thread)
+        self.max_resident_bytes = max_resident_bytes
+        self.stats = BoundedSaverStats()
+        self._lock = threading.RLock()
+        # Resident threads, from least to most recently used, with their size
+        self._resident: OrderedDict[str, int] = OrderedDict()
+        self._write_keys: Dict[str, Set[Tuple[str, str, str]]] = defaultdict(set)
+        self._blob_keys: Dict[str, Set[Tuple[str, str, str, Any]]] = defaultdict(set)
+
+        if spill_path is None:
+            fd, spill_path = tempfile.mkstemp(prefix="checkpoints-", suffix=".sqlite")
+            os.close(fd)
+        self._spill = sqlite3.connect(spill_path, check_same_thread=False)
+        self._spill.execute(
+            "CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, data BLOB NOT NULL)"
+        )
+        self._spill.commit()
+
+    def resident_bytes(self) -> Dict[str, int]:
+        """Return the serialized size of each thread currently held in memory."""
+        with self._lock:
+            return dict(self._resident)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config:
+                self._touch(config["configurable"]["thread_id"])
+            items = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from items
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            self._touch(thread_id)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            for channel, version in new_versions.items():
+                self._blob_keys[thread_id].add((thread_id, checkpoint_ns, channel, version))
+            self._trim(thread_id, checkpoint_ns)
+            self._resident[thread_id] = self._measure(thread_id)
+            self._enforce_budget()
+            return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys[thread_id].add((
+                thread_id,
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"],
+            ))
+            self._resident[thread_id] = self._measure(thread_id)
+            self._enforce_budget()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._spill.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._spill.commit()
+            self._drop_from_memory(thread_id)
+
+    def _touch(self, thread_id: str) -> None:
+        if thread_id not in self._resident:
+            self._reload(thread_id)
+            self._resident[thread_id] = self._measure(thread_id)
+        self._resident.move_to_end(thread_id)
+
+    def _trim(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        excess = len(checkpoints) - self.max_checkpoints_per_thread
+        if excess <= 0:
+            return
+        for checkpoint_id in sorted(checkpoints)[:excess]:
+            del checkpoints[checkpoint_id]
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(key, None)
+            self._write_keys[thread_id].discard(key)
+        self.stats.trimmed_checkpoints += excess
+
+        # Drop the channel values no longer referenced by any checkpoint
+        live = {
+            (thread_id, checkpoint_ns, channel, version)
+            for saved in checkpoints.values()
+            for channel, version in self.serde.loads_typed(saved[0])["channel_versions"].items()
+        }
+        for key in [k for k in self._blob_keys[thread_id] if k[1] == checkpoint_ns and k not in live]:
+            self.blobs.pop(key, None)
+            self._blob_keys[thread_id].discard(key)
+
+    def _measure(self, thread_id: str) -> int:
+        size = 0
+        for saved in self.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _ in saved.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+        for key in self._write_keys.get(thread_id, ()):
+            for _, _, value, _ in self.writes.get(key, {}).values():
+                size += len(value[1])
+        for key in self._blob_keys.get(thread_id, ()):
+            if key in self.blobs:
+                size += len(self.blobs[key][1])
+        return size
+
+    def _enforce_budget(self) -> None:
+        # Never spill the most recently used thread, which is being written to
+        while sum(self._resident.values()) > self.max_resident_bytes and len(self._resident) > 1:
+            thread_id = next(iter(self._resident))
+            self._spill_thread(thread_id)
+
+    def _spill_thread(self, thread_id: str) -> None:
+        data = {
+            "storage": {ns: dict(saved) for ns, saved in self.storage.get(thread_id, {}).items()},
+            "writes": {k: self.writes[k] for k in self._write_keys.get(thread_id, ()) if k in self.writes},
+            "blobs": {k: self.blobs[k] for k in self._blob_keys.get(thread_id, ()) if k in self.blobs},
+        }
+        self._spill.execute(
+            "INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, pickle.dumps(data))
+        )
+        self._spill.commit()
+        self._drop_from_memory(thread_id)
+        self.stats.spilled_threads += 1
+
+    def _reload(self, thread_id: str) -> None:
+        row = self._spill.execute(
+            "SELECT data FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if row is None:
+            return
+        data = pickle.loads(row[0])
+        for ns, saved in data["storage"].items():
+            self.storage[thread_id][ns].update(saved)
+        self.writes.update(data["writes"])
+        self.blobs.update(data["blobs"])
+        self._write_keys[thread_id] = set(data["writes"])
+        self._blob_keys[thread_id] = set(data["blobs"])
+        self._spill.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+        self._spill.commit()
+        self.stats.reloaded_threads += 1
+
+    def _drop_from_memory(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        self._resident.pop(thread_id, None)
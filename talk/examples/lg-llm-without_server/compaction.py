@@ -0,0 +1,192 @@
+"""Compaction of the conversation history sent to the LLM.
+
+``MessagesState`` graphs keep the full conversation in their state, and
+sending all of it on every turn makes token cost and latency grow without
+limit. ``MessageCompactor`` decides what is sent, without changing the
+state itself:
+
+1. Tool results over a token budget are truncated (e.g. long pages from
+   the DuckDuckGo ``fetch`` tool).
+2. Only the most recent messages that fit a token budget are kept,
+   starting from a human message so tool calls are never split from their
+   results.
+3. Optionally, the messages that fell out of the window are folded into a
+   rolling summary by a background worker, which is sent as a system
+   message from the next turn onwards. Summaries are kept for the most
+   recently used threads only.
+
+``compact`` returns the messages to send, and ``compact_with_savings`` also
+returns the tokens saved by that call, as the compactor is shared by all
+threads of the process. The example graphs report these savings in the
+``response_metadata`` of each answer, as ``compaction_tokens_saved``.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string, trim_messages
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+Update the summary of the earlier part of a conversation with the new
+messages below. Keep any names, facts, decisions and open questions that
+may be needed later on. Respond only with the updated summary.
+
+<summary>
+{summary}
+</summary>
+
+<new_messages>
+{messages}
+</new_messages>
+"""
+
+
+@dataclass
+class CompactionStats:
+    turns: int = 0
+    tokens_in: int = 0
+    tokens_sent: int = 0
+    summaries: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_sent
+
+
+class MessageCompactor:
+    """Selects the messages to send to the LLM within a token budget.
+
+    Args:
+        max_tokens (int): Budget for the messages sent to the LLM.
+        max_tool_tokens (int): Budget for the content of each tool result.
+        summarizer (BaseChatModel): If given, summarizes the messages that
+            fall out of the window in the background.
+        token_counter (Callable): Counts the tokens in a list of messages.
+        max_summaries (int): Threads whose summary is kept, dropping the
+            least recently used first.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 8_000,
+        max_tool_tokens: int = 1_000,
+        summarizer: Optional[BaseChatModel] = None,
+        token_counter: Callable[[Sequence[BaseMessage]], int] = count_tokens_approximately,
+        max_summaries: int = 1_000,
+    ):
+        self.max_tokens = max_tokens
+        self.max_tool_tokens = max_tool_tokens
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self.max_summaries = max_summaries
+        self.stats = CompactionStats()
+        self._lock = threading.Lock()
+        # Rolling summary per thread, with the number of messages it covers
+        self._summaries: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+        self._pending: set = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    def compact(
+        self, messages: Sequence[BaseMessage], config: Optional[RunnableConfig] = None
+    ) -> List[BaseMessage]:
+        """Return the messages to send to the LLM for this turn."""
+        return self.compact_with_savings(messages, config)[0]
+
+    def compact_with_savings(
+        self, messages: Sequence[BaseMessage], config: Optional[RunnableConfig] = None
+    ) -> Tuple[List[BaseMessage], int]:
+        """Return the messages to send to the LLM for this turn, and the tokens saved."""
+        original = messages
+        messages = [self._truncate_tool_result(m) for m in messages]
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        summary, covered = self._summary(thread_id) if thread_id else ("", 0)
+
+        prefix: List[BaseMessage] = []
+        if summary:
+            prefix.append(SystemMessage(content="Summary of the earlier conversation:\n" + summary))
+        budget = self.max_tokens - (self.token_counter(prefix) if prefix else 0)
+        window = trim_messages(
+            messages,
+            max_tokens=max(budget, 0),
+            token_counter=self.token_counter,
+            strategy="last",
+            start_on="human",
+            include_system=True,
+        )
+        if not window:
+            # Even the latest exchange is over budget: send it from its human message
+            last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+            window = messages[last_human:]
+        dropped = len(messages) - len(window)
+        compacted = prefix + window if dropped else window
+
+        if self.summarizer is not None and thread_id and dropped > covered:
+            self._summarize_later(thread_id, messages, covered, dropped)
+
+        return compacted, self._record(original, compacted)
+
+    def _summary(self, thread_id: str) -> Tuple[str, int]:
+        with self._lock:
+            if thread_id not in self._summaries:
+                return "", 0
+            self._summaries.move_to_end(thread_id)
+            return self._summaries[thread_id]
+
+    def _truncate_tool_result(self, message: BaseMessage) -> BaseMessage:
+        if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+            return message
+        if self.token_counter([message]) <= self.max_tool_tokens:
+            return message
+        # Approximate tokens as 4 characters, as count_tokens_approximately does
+        keep = self.max_tool_tokens * 4
+        content = message.content
+        return message.model_copy(update={
+            "content": "{}\n[... {} characters truncated ...]".format(content[:keep], len(content) - keep)
+        })
+
+    def _record(self, original: Sequence[BaseMessage], compacted: Sequence[BaseMessage]) -> int:
+        tokens_in = self.token_counter(original)
+        tokens_sent = self.token_counter(compacted)
+        with self._lock:
+            self.stats.turns += 1
+            self.stats.tokens_in += tokens_in
+            self.stats.tokens_sent += tokens_sent
+        logger.debug("Compaction saved %d tokens (%d -> %d)", tokens_in - tokens_sent, tokens_in, tokens_sent)
+        return tokens_in - tokens_sent
+
+    def _summarize_later(self, thread_id: str, messages: List[BaseMessage], covered: int, dropped: int) -> None:
+        with self._lock:
+            if thread_id in self._pending:
+                return
+            self._pending.add(thread_id)
+        self._executor.submit(self._summarize, thread_id, messages[covered:dropped], dropped)
+
+    def _summarize(self, thread_id: str, new_messages: List[BaseMessage], covered: int) -> None:
+        try:
+            summary, _ = self._summary(thread_id)
+            prompt = SUMMARY_PROMPT.format(
+                summary=summary or "(empty)",
+                messages=get_buffer_string(new_messages),
+            )
+            response = self.summarizer.invoke([HumanMessage(content=prompt)])
+            with self._lock:
+                self._summaries[thread_id] = (response.text(), covered)
+                self._summaries.move_to_end(thread_id)
+                while len(self._summaries) > self.max_summaries:
+                    self._summaries.popitem(last=False)
+                self.stats.summaries += 1
+        except Exception:
+            logger.exception("Could not summarize thread %s", thread_id)
+        finally:
+            with self._lock:
+                self._pending.discard(thread_id)
@@ -0,0 +1,177 @@
+"""In-memory checkpointer that stores list channels as deltas.
+
+With ``InMemorySaver``, every checkpoint of a ``MessagesState`` graph
+serializes the whole message list again, so the bytes written grow
+quadratically with the length of the conversation. This subclass stores
+a new version of a list channel (such as ``messages``) as the items
+appended since the parent checkpoint's version, and rebuilds the full list
+on read. If an earlier item changed (e.g. a message replaced by ID), the
+new version is stored as a full snapshot instead. Every
+``snapshot_interval`` deltas it stores the full list again, to bound the
+length of the chains replayed on read.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
+from langgraph.checkpoint.memory import InMemorySaver
+
+DELTA_PREFIX = "delta:"
+
+BlobKey = Tuple[str, str, str, Any]
+
+
+def _is_prefix(prefix: List[Any], items: List[Any]) -> bool:
+    # Compare whole items, not only message IDs: add_messages replaces a
+    # message with the same ID in place, which needs a full snapshot
+    return len(prefix) <= len(items) and all(
+        a is b or a == b for a, b in zip(prefix, items)
+    )
+
+
+class DeltaInMemorySaver(InMemorySaver):
+    """``InMemorySaver`` which writes list channels as appended items only.
+
+    Args:
+        snapshot_interval (int): Maximum number of deltas chained after a
+            full snapshot of a channel.
+        decoded_cache_size (int): Number of rebuilt channel values kept in
+            memory, so consecutive steps do not replay their chains.
+    """
+
+    def __init__(self, *, snapshot_interval: int = 20, decoded_cache_size: int = 256, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.snapshot_interval = snapshot_interval
+        self.decoded_cache_size = decoded_cache_size
+        self.full_snapshots = 0
+        self.deltas = 0
+        self._lock = threading.Lock()
+        # Rebuilt values of recent blobs, with the length of their delta chain
+        self._decoded: OrderedDict[BlobKey, Tuple[List[Any], int]] = OrderedDict()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_versions = self._parent_versions(config)
+        values = checkpoint["channel_values"]
+
+        # Let InMemorySaver write everything but the list channels we can diff
+        deltas: Dict[str, Tuple[List[Any], Any, int]] = {}
+        for channel, version in new_versions.items():
+            value = values.get(channel)
+            base_version = parent_versions.get(channel)
+            if not isinstance(value, list) or base_version is None:
+                continue
+            base = self._decode((thread_id, checkpoint_ns, channel, base_version))
+            if base is None:
+                continue
+            base_items, depth = base
+            if depth + 1 < self.snapshot_interval and _is_prefix(base_items, value):
+                deltas[channel] = (value[len(base_items):], base_version, depth + 1)
+
+        full = {**checkpoint, "channel_values": {k: v for k, v in values.items() if k not in deltas}}
+        result = super().put(config, full, metadata, {k: v for k, v in new_versions.items() if k not in deltas})
+
+        for channel, (appended, base_version, depth) in deltas.items():
+            key = (thread_id, checkpoint_ns, channel, new_versions[channel])
+            kind, data = self.serde.dumps_typed(
+                {"base": base_version, "depth": depth, "items": appended}
+            )
+            self.blobs[key] = (DELTA_PREFIX + kind, data)
+            self._remember(key, list(values[channel]), depth)
+            self.deltas += 1
+        for channel, version in new_versions.items():
+            if channel not in deltas and isinstance(values.get(channel), list):
+                self._remember((thread_id, checkpoint_ns, channel, version), list(values[channel]), 0)
+                self.full_snapshots += 1
+        return result
+
+    def _load_blobs(
+        self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions
+    ) -> Dict[str, Any]:
+        channel_values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            key = (thread_id, checkpoint_ns, channel, version)
+            blob = self.blobs.get(key)
+            if blob is None or blob[0] == "empty":
+                continue
+            if blob[0].startswith(DELTA_PREFIX):
+                decoded = self._decode(key)
+                if decoded is not None:
+                    channel_values[channel] = list(decoded[0])
+            else:
+                channel_values[channel] = self.serde.loads_typed(blob)
+        return channel_values
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self._lock:
+            for key in [k for k in self._decoded if k[0] == thread_id]:
+                del self._decoded[key]
+
+    def _parent_versions(self, config: RunnableConfig) -> ChannelVersions:
+        parent_id = config["configurable"].get("checkpoint_id")
+        if not parent_id:
+            return {}
+        saved = self.storage[config["configurable"]["thread_id"]][
+            config["configurable"]["checkpoint_ns"]
+        ].get(parent_id)
+        if saved is None:
+            return {}
+        return self.serde.loads_typed(saved[0])["channel_versions"]
+
+    def _decode(self, key: BlobKey) -> Optional[Tuple[List[Any], int]]:
+        """Rebuild a list channel value, returning it with its delta chain length."""
+        with self._lock:
+            if key in self._decoded:
+                self._decoded.move_to_end(key)
+                return self._decoded[key]
+
+        # Walk back to the nearest full snapshot (or remembered value)
+        suffixes: List[List[Any]] = []
+        current: Optional[BlobKey] = key
+        items: Optional[List[Any]] = None
+        depth = 0
+        while current is not None:
+            with self._lock:
+                known = self._decoded.get(current)
+            if known is not None:
+                items, depth = list(known[0]), known[1]
+                break
+            blob = self.blobs.get(current)
+            if blob is None or blob[0] == "empty":
+                return None
+            if not blob[0].startswith(DELTA_PREFIX):
+                value = self.serde.loads_typed(blob)
+                if not isinstance(value, list):
+                    return None
+                items, depth = value, 0
+                break
+            delta = self.serde.loads_typed((blob[0][len(DELTA_PREFIX):], blob[1]))
+            suffixes.append(delta["items"])
+            current = (*current[:3], delta["base"])
+
+        if items is None:
+            return None
+        for suffix in reversed(suffixes):
+            items.extend(suffix)
+            depth += 1
+        self._remember(key, items, depth)
+        return items, depth
+
+    def _remember(self, key: BlobKey, items: List[Any], depth: int) -> None:
+        with self._lock:
+            self._decoded[key] = (items, depth)
+            self._decoded.move_to_end(key)
+            while len(self._decoded) > self.decoded_cache_size:
+                self._decoded.popitem(last=False)
@@ -0,0 +1,456 @@
+"""Pool of pre-started code executors for smolagents' CodeAgent.
+
+With ``executor_type="docker"`` (as in ``04-docker.py``), every agent starts
+its own container and Jupyter kernel, which takes seconds before the first
+line of code runs. ``ExecutorPool`` starts its executors ahead of time, and
+``PooledCodeAgent`` checks one out when it is created and returns it on
+cleanup, so the agent can run code right away.
+
+Executors are scrubbed when they are returned (the variables and tools of
+the previous task are removed from the kernel), checked with a quick ping
+when they are checked out, and replaced if they fail either step. Since
+scrubbing does not undo everything (e.g. imported modules or files written
+to disk), executors are also recycled after ``max_uses`` tasks. The pool
+keeps ``size`` executors warm, and can grow up to ``max_size`` under load.
+
+``DockerExecutorFactory`` starts containers from the ``jupyter-kernel-custom``
+image of ``build-docker.sh``. ``SubprocessExecutorFactory`` runs each kernel in
+a local Python subprocess instead, which is handy for trying the pool without
+Docker, but is not isolated from the host. Run the example with:
+
+    uv run executor_pool.py [--local] [--tasks 3]
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import logging
+import os
+import pickle
+import queue
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from smolagents import CodeAgent, OpenAIServerModel
+from smolagents.default_tools import DuckDuckGoSearchTool, VisitWebpageTool
+from smolagents.local_python_executor import CodeOutput
+from smolagents.monitoring import AgentLogger, LogLevel
+from smolagents.remote_executors import DockerExecutor, RemotePythonExecutor
+from smolagents.utils import AgentError
+
+logger = logging.getLogger(__name__)
+
+# Removes the variables and tools of the previous task from an IPython kernel
+SCRUB_CODE = """
+%reset -f
+import os
+os.chdir(os.path.expanduser("~"))
+"""
+
+# Kernel of SubprocessExecutor: runs the code of each JSON line it reads, in the same namespace
+SUBPROCESS_KERNEL = r"""
+import ast, contextlib, io, json, os, sys, traceback
+
+requests = sys.stdin
+sys.stdin = open(os.devnull)
+replies = os.fdopen(os.dup(1), "w")
+os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+namespace = {}
+
+for line in requests:
+    request = json.loads(line)
+    reply = {"output": None, "logs": "", "error": None, "final_answer": None}
+    if request.get("reset"):
+        namespace.clear()
+        os.chdir(os.path.expanduser("~"))
+    else:
+        logs = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(logs), contextlib.redirect_stderr(logs):
+                tree = ast.parse(request["code"])
+                last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+                exec(compile(tree, "<code>", "exec"), namespace)
+                if last is not None:
+                    value = eval(compile(ast.Expression(last.value), "<code>", "eval"), namespace)
+                    reply["output"] = None if value is None else repr(value)
+        except Exception as e:
+            if type(e).__name__ == "FinalAnswerException":
+                reply["final_answer"] = e.args[0]
+            else:
+                reply["error"] = traceback.format_exc()
+        reply["logs"] = logs.getvalue()
+    replies.write(json.dumps(reply) + "\n")
+    replies.flush()
+"""
+
+
+class PooledDockerExecutor(DockerExecutor):
+    """DockerExecutor that can be scrubbed and pinged, for ``ExecutorPool``."""
+
+    def _run_with_timeout(self, code: str, timeout: float) -> None:
+        self.ws.settimeout(timeout)
+        try:
+            self.run_code_raise_errors(code)
+        finally:
+            self.ws.settimeout(None)
+
+    def reset(self, timeout: float) -> None:
+        self._run_with_timeout(SCRUB_CODE, timeout)
+
+    def ping(self, timeout: float) -> None:
+        self._run_with_timeout("1", timeout)
+
+
+class SubprocessExecutor(RemotePythonExecutor):
+    """Runs the code of an agent in a local Python subprocess, which keeps its variables between steps.
+
+    This is a stand-in for ``PooledDockerExecutor`` with the same protocol for
+    final answers, but the code has the same access to the host as the agent.
+
+    Args:
+        additional_imports (list[str]): Not installed: the subprocess uses the packages of this environment.
+        logger (AgentLogger): Logger for the executor.
+        timeout (float): Seconds that a piece of code may run before the kernel is considered stuck.
+    """
+
+    def __init__(self, additional_imports: List[str], logger: AgentLogger, timeout: float = 300.0):
+        super().__init__(additional_imports, logger)
+        self.timeout = timeout
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "-c", SUBPROCESS_KERNEL],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.process.stdout, selectors.EVENT_READ)
+
+    def install_packages(self, additional_imports: List[str]) -> List[str]:
+        return additional_imports
+
+    def _request(self, request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        if not self._selector.select(timeout):
+            # Its answer would come after the next request's, so the kernel cannot be used again
+            self.process.kill()
+            raise TimeoutError("The kernel did not answer in {}s".format(timeout))
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("The kernel exited with status {}".format(self.process.wait()))
+        return json.loads(line)
+
+    def run_code_raise_errors(self, code: str) -> CodeOutput:
+        reply = self._request({"code": code}, self.timeout)
+        if reply["final_answer"] is not None:
+            output = pickle.loads(base64.b64decode(reply["final_answer"]))
+            return CodeOutput(output=output, logs=reply["logs"], is_final_answer=True)
+        if reply["error"] is not None:
+            raise AgentError(reply["logs"] + reply["error"], self.logger)
+        return CodeOutput(output=reply["output"], logs=reply["logs"], is_final_answer=False)
+
+    def reset(self, timeout: float) -> None:
+        self._request({"reset": True}, timeout)
+
+    def ping(self, timeout: float) -> None:
+        self._request({"code": "1"}, timeout)
+
+    def cleanup(self) -> None:
+        self._selector.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class DockerExecutorFactory:
+    """Starts a ``PooledDockerExecutor`` on a free local port.
+
+    Args:
+        image_name (str): Image with the Jupyter Kernel Gateway, built beforehand.
+        additional_imports (list[str]): Packages to install in each new container.
+        logger (AgentLogger): Logger for the executors.
+        host (str): Address to publish the ports of the containers on.
+    """
+
+    def __init__(self, image_name: str = "jupyter-kernel-custom", additional_imports: Optional[List[str]] = None,
+                 logger: Optional[AgentLogger] = None, host: str = "127.0.0.1"):
+        self.image_name = image_name
+        self.additional_imports = additional_imports or []
+        self.logger = logger or AgentLogger(LogLevel.ERROR)
+        self.host = host
+
+    def _free_port(self) -> int:
+        with socket.socket() as s:
+            s.bind((self.host, 0))
+            return s.getsockname()[1]
+
+    def __call__(self) -> PooledDockerExecutor:
+        return PooledDockerExecutor(
+            self.additional_imports, self.logger, host=self.host, port=self._free_port(),
+            image_name=self.image_name, build_new_image=False,
+        )
+
+
+class SubprocessExecutorFactory:
+    """Starts a ``SubprocessExecutor``, as a stand-in for ``DockerExecutorFactory``."""
+
+    def __init__(self, logger: Optional[AgentLogger] = None):
+        self.logger = logger or AgentLogger(LogLevel.ERROR)
+
+    def __call__(self) -> SubprocessExecutor:
+        return SubprocessExecutor([], self.logger)
+
+
+@dataclass
+class PoolStats:
+    started: int = 0
+    # Executors that failed a ping or could not be scrubbed
+    replaced: int = 0
+    # Executors retired after max_uses tasks
+    recycled: int = 0
+    # Executors retired because the pool had grown past its size
+    shrunk: int = 0
+    checkouts: int = 0
+    # Checkouts that waited for an executor to be returned or started
+    waits: int = 0
+    checkout_seconds: float = 0.0
+    scrub_seconds: float = 0.0
+
+
+class ExecutorPool:
+    """Keeps code executors started, and lends them to one agent at a time.
+
+    Args:
+        factory: Starts a new executor, which must offer ``reset``, ``ping`` and ``cleanup``.
+        size (int): Executors kept started, even when idle.
+        max_size (int): Executors that may exist at once, when more agents need one.
+        max_uses (int): Tasks an executor runs before it is replaced by a fresh one.
+        health_timeout (float): Seconds for scrubbing an executor, or for its health check on checkout.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 2, max_size: Optional[int] = None,
+                 max_uses: int = 20, health_timeout: float = 5.0):
+        self.factory = factory
+        self.size = size
+        self.max_size = max(max_size or size, size)
+        self.max_uses = max_uses
+        self.health_timeout = health_timeout
+        self.stats = PoolStats()
+        self._idle: queue.Queue = queue.Queue()
+        self._uses: Dict[Any, int] = {}
+        self._starting = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> Any:
+        try:
+            executor = self.factory()
+        except BaseException:
+            with self._lock:
+                self._starting -= 1
+            raise
+        with self._lock:
+            self._starting -= 1
+            self._uses[executor] = 0
+            self.stats.started += 1
+        return executor
+
+    def _reserve(self) -> bool:
+        """Reserves room for a new executor, if the pool is below ``max_size``."""
+        with self._lock:
+            if self._closed or len(self._uses) + self._starting >= self.max_size:
+                return False
+            self._starting += 1
+            return True
+
+    def _replenish(self) -> None:
+        """Starts executors in the background until ``size`` of them exist again."""
+        with self._lock:
+            missing = 0 if self._closed else self.size - len(self._uses) - self._starting
+            self._starting += max(missing, 0)
+        for _ in range(missing):
+            threading.Thread(target=self._spawn_idle, daemon=True).start()
+
+    def _spawn_idle(self) -> None:
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            logger.warning("Could not start an executor: %s", e)
+
+    def _retire(self, executor: Any) -> None:
+        with self._lock:
+            self._uses.pop(executor, None)
+        try:
+            executor.cleanup()
+        except Exception as e:
+            logger.warning("Could not clean up an executor: %s", e)
+
+    def start(self) -> None:
+        """Starts the missing executors in parallel, and waits for them."""
+        with self._lock:
+            missing = max(self.size - len(self._uses) - self._starting, 0)
+            self._starting += missing
+        if missing:
+            with ThreadPoolExecutor(missing) as pool:
+                for executor in pool.map(lambda _: self._spawn(), range(missing)):
+                    self._idle.put(executor)
+
+    def checkout(self, timeout: Optional[float] = None) -> Any:
+        """
+        Returns a healthy executor, starting a new one if none is idle and
+        the pool may grow, or else waiting for one to be returned.
+        Args:
+            timeout (float): Seconds to wait for an executor, or forever if None.
+        """
+        start = time.perf_counter()
+        waited = False
+        while True:
+            try:
+                executor = self._idle.get_nowait()
+            except queue.Empty:
+                waited = True
+                if self._reserve():
+                    executor = self._spawn()
+                else:
+                    remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No executor was available in {}s".format(timeout))
+                    try:
+                        executor = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        raise TimeoutError("No executor was available in {}s".format(timeout)) from None
+            try:
+                executor.ping(self.health_timeout)
+            except Exception as e:
+                logger.warning("Replacing an executor that failed its health check: %s", e)
+                self._retire(executor)
+                with self._lock:
+                    self.stats.replaced += 1
+                self._replenish()
+                continue
+            with self._lock:
+                self._uses[executor] += 1
+                self.stats.checkouts += 1
+                self.stats.waits += waited
+                self.stats.checkout_seconds += time.perf_counter() - start
+            return executor
+
+    def checkin(self, executor: Any) -> None:
+        """Scrubs an executor for the next task and makes it idle again, or retires it."""
+        with self._lock:
+            uses = self._uses.get(executor)
+            surplus = len(self._uses) > self.size
+        if uses is None or self._closed:
+            self._retire(executor)
+            return
+        if uses >= self.max_uses or surplus:
+            self._retire(executor)
+            with self._lock:
+                if surplus:
+                    self.stats.shrunk += 1
+                else:
+                    self.stats.recycled += 1
+            self._replenish()
+            return
+
+        start = time.perf_counter()
+        try:
+            executor.reset(self.health_timeout)
+        except Exception as e:
+            logger.warning("Replacing an executor that could not be scrubbed: %s", e)
+            self._retire(executor)
+            with self._lock:
+                self.stats.replaced += 1
+            self._replenish()
+            return
+        with self._lock:
+            self.stats.scrub_seconds += time.perf_counter() - start
+        self._idle.put(executor)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            executors = list(self._uses)
+        for executor in executors:
+            self._retire(executor)
+        self._idle = queue.Queue()
+
+    def __enter__(self) -> "ExecutorPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class PooledCodeAgent(CodeAgent):
+    """CodeAgent which borrows its executor from an ``ExecutorPool``, and returns it on cleanup.
+
+    Use it as a context manager (or call ``cleanup``) to return the executor.
+
+    Args:
+        pool (ExecutorPool): Pool to check out the executor from.
+        checkout_timeout (float): Seconds to wait for an executor, or forever if None.
+    """
+
+    def __init__(self, *args, pool: ExecutorPool, checkout_timeout: Optional[float] = None, **kwargs):
+        self.pool = pool
+        self.checkout_timeout = checkout_timeout
+        super().__init__(*args, **kwargs)
+
+    def create_python_executor(self) -> Any:
+        return self.pool.checkout(self.checkout_timeout)
+
+    def cleanup(self) -> None:
+        executor, self.python_executor = self.python_executor, None
+        if executor is not None:
+            self.pool.checkin(executor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a few agent tasks on a pool of pre-started executors.")
+    parser.add_argument("--local", action="store_true", help="use local subprocesses instead of Docker")
+    parser.add_argument("--tasks", type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    model = OpenAIServerModel(
+        model_id="gpt-4o-mini",
+        api_key=os.environ["OPENAI_API_KEY"]
+    )
+    factory = SubprocessExecutorFactory() if args.local else DockerExecutorFactory()
+
+    with ExecutorPool(factory, size=1) as pool:
+        start = time.perf_counter()
+        pool.start()
+        print("Started the pool in {:.2f}s".format(time.perf_counter() - start))
+        for _ in range(args.tasks):
+            with PooledCodeAgent(
+                tools=[DuckDuckGoSearchTool(), VisitWebpageTool()],
+                model=model,
+                max_steps=10,
+                pool=pool
+            ) as agent:
+                agent.run(
+                    """
+                    I have these dates:
+
+                    * 28 January 2023
+                    * 2025/11/06
+                    * February 23rd, 2024
+
+                    Sort them from earliest to oldest, and format them as YYYY/MM/DD.
+                    """)
+        print(pool.stats)
+
+
+if __name__ == "__main__":
+    main()
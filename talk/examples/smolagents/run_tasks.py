@@ -0,0 +1,265 @@
+"""Runs many CodeAgent tasks concurrently, streaming their results to a JSONL file.
+
+The other examples run a single ``agent.run`` per process, with their own
+model client and MCP server. This runner reads the tasks from a JSONL file
+(one ``{"id": ..., "task": ...}`` object per line, optionally with its own
+``max_steps``), and runs up to ``--concurrency`` of them at once. All agents
+share the same model client and tools (and the same MCP client, with
+``--search mcp``), while each task gets its own agent, as agents keep the
+memory of their run.
+
+Each result is appended to the output file as soon as its task finishes,
+with the number of steps, tokens and seconds it took. Tasks whose id is
+already in the output file are skipped, so an interrupted run can be
+resumed by running the same command again. Run it with:
+
+    uv run run_tasks.py tasks.jsonl --output results.jsonl --concurrency 4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from mcp import StdioServerParameters
+from smolagents import CodeAgent, MCPClient, OpenAIServerModel
+from smolagents.default_tools import DuckDuckGoSearchTool, VisitWebpageTool
+from smolagents.memory import ActionStep, PlanningStep
+from smolagents.monitoring import AgentLogger, LogLevel
+from smolagents.utils import AgentMaxStepsError
+
+from executor_pool import DockerExecutorFactory, ExecutorPool, PooledCodeAgent, SubprocessExecutorFactory
+
+
+@dataclass
+class TaskResult:
+    id: str
+    # "success", "max_steps_error" or "error"
+    status: str
+    output: Any = None
+    error: Optional[str] = None
+    steps: int = 0
+    # Steps whose code or tool calls failed (the final answer forced at max_steps counts as a step)
+    failed_steps: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class RunSummary:
+    tasks: int = 0
+    skipped: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+    steps: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Sum of the seconds of the tasks, and seconds of the whole run
+    task_seconds: float = 0.0
+    seconds: float = 0.0
+
+    def add(self, result: TaskResult) -> None:
+        self.tasks += 1
+        self.statuses[result.status] = self.statuses.get(result.status, 0) + 1
+        self.steps += result.steps
+        self.input_tokens += result.input_tokens
+        self.output_tokens += result.output_tokens
+        self.task_seconds += result.seconds
+
+
+def read_tasks(path: str) -> List[Dict[str, Any]]:
+    """Reads the tasks of a JSONL file, using their line number as the id of those without one."""
+    tasks = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if line.strip():
+                task = json.loads(line)
+                task.setdefault("id", str(number))
+                tasks.append(task)
+    return tasks
+
+
+def finished_ids(path: str, retry_errors: bool) -> set:
+    """Returns the ids of the tasks with a result in the output file, if it exists."""
+    statuses = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short when the previous run was killed
+                    continue
+                statuses[result["id"]] = result["status"]
+    return {i for i, status in statuses.items() if not (retry_errors and status == "error")}
+
+
+def collect_result(task_id: str, agent: CodeAgent, output: Any, error: Optional[BaseException],
+                   seconds: float) -> TaskResult:
+    result = TaskResult(id=task_id, status="success", output=output, seconds=seconds)
+    for step in agent.memory.steps:
+        if isinstance(step, (ActionStep, PlanningStep)) and step.token_usage is not None:
+            result.input_tokens += step.token_usage.input_tokens
+            result.output_tokens += step.token_usage.output_tokens
+        if isinstance(step, ActionStep):
+            result.steps += 1
+            result.failed_steps += step.error is not None and not isinstance(step.error, AgentMaxStepsError)
+    last_error = getattr(agent.memory.steps[-1], "error", None) if agent.memory.steps else None
+    if error is not None:
+        result.status, result.error = "error", "{}: {}".format(type(error).__name__, error)
+    elif isinstance(last_error, AgentMaxStepsError):
+        result.status = "max_steps_error"
+    return result
+
+
+class TaskRunner:
+    """Runs tasks on agents that share the same model and tools.
+
+    Args:
+        model: Chat model shared by all agents.
+        tools (list): Tools shared by all agents.
+        max_steps (int): Steps of each task, unless the task sets its own ``max_steps``.
+        pool (ExecutorPool): Pool to borrow remote executors from, or None to run code locally.
+        verbosity_level (LogLevel): Verbosity of the agents.
+    """
+
+    def __init__(self, model, tools: List[Any], max_steps: int = 10, pool: Optional[ExecutorPool] = None,
+                 verbosity_level: LogLevel = LogLevel.OFF):
+        self.model = model
+        self.tools = tools
+        self.max_steps = max_steps
+        self.pool = pool
+        self.verbosity_level = verbosity_level
+        self._running: Dict[str, CodeAgent] = {}
+        self._interrupted = False
+        self._lock = threading.Lock()
+
+    def _agent(self, max_steps: int) -> CodeAgent:
+        kwargs = dict(tools=self.tools, model=self.model, max_steps=max_steps, verbosity_level=self.verbosity_level)
+        if self.pool is not None:
+            return PooledCodeAgent(pool=self.pool, **kwargs)
+        return CodeAgent(**kwargs)
+
+    def run(self, task: Dict[str, Any]) -> Optional[TaskResult]:
+        """Runs a task, returning its result, or None if the runner was interrupted."""
+        start = time.perf_counter()
+        with self._agent(task.get("max_steps", self.max_steps)) as agent:
+            with self._lock:
+                if self._interrupted:
+                    return None
+                self._running[task["id"]] = agent
+            output, error = None, None
+            try:
+                output = agent.run(task["task"])
+            except Exception as e:
+                error = e
+            finally:
+                with self._lock:
+                    del self._running[task["id"]]
+            if self._interrupted:
+                return None
+            return collect_result(task["id"], agent, output, error, time.perf_counter() - start)
+
+    def interrupt(self) -> None:
+        """Stops the running agents after their current step."""
+        with self._lock:
+            self._interrupted = True
+            for agent in self._running.values():
+                agent.interrupt()
+
+
+def run_all(runner: TaskRunner, tasks: List[Dict[str, Any]], output_path: str, concurrency: int,
+            summary: RunSummary) -> None:
+    """Runs the tasks, appending each result to the output file as soon as it is ready."""
+    start = time.perf_counter()
+    with open(output_path, "a") as output, ThreadPoolExecutor(concurrency) as executor:
+        futures = [executor.submit(runner.run, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue
+                output.write(json.dumps(asdict(result), default=str) + "\n")
+                output.flush()
+                summary.add(result)
+                print("{}: {} in {} steps and {:.1f}s ({} input and {} output tokens)".format(
+                    result.id, result.status, result.steps, result.seconds,
+                    result.input_tokens, result.output_tokens))
+        except KeyboardInterrupt:
+            print("Interrupted: waiting for the running tasks to stop, which will run again when resumed")
+            runner.interrupt()
+            executor.shutdown(cancel_futures=True)
+        finally:
+            summary.seconds = time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the CodeAgent tasks of a JSONL file concurrently.")
+    parser.add_argument("tasks", help="JSONL file with one {\"id\": ..., \"task\": ...} object per line")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file to append the results to")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-steps", type=int, default=10)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--search", choices=["mcp", "duckduckgo"], default="mcp",
+                        help="search through the DuckDuckGo MCP server (as in 01-searcher.py) or the built-in tool")
+    parser.add_argument("--executor", choices=["local", "docker", "subprocess"], default="local",
+                        help="run the code of the agents locally, or in a pool of executors (see executor_pool.py)")
+    parser.add_argument("--retry-errors", action="store_true", help="run again the tasks that ended in an error")
+    parser.add_argument("--verbose", action="store_true", help="show the steps of the agents")
+    args = parser.parse_args()
+
+    load_dotenv()
+    done = finished_ids(args.output, args.retry_errors)
+    tasks = read_tasks(args.tasks)
+    pending = [task for task in tasks if task["id"] not in done]
+    summary = RunSummary(skipped=len(tasks) - len(pending))
+    if summary.skipped:
+        print("Skipping {} tasks with results in {}".format(summary.skipped, args.output))
+    if not pending:
+        return
+
+    model = OpenAIServerModel(
+        model_id=args.model,
+        api_key=os.environ["OPENAI_API_KEY"]
+    )
+
+    with ExitStack() as stack:
+        if args.search == "mcp":
+            mcp_client = MCPClient(StdioServerParameters(
+                command='uvx',
+                args=['duckduckgo-mcp-server']
+            ))
+            stack.callback(mcp_client.disconnect)
+            search_tool = mcp_client.get_tools()[0]
+        else:
+            search_tool = DuckDuckGoSearchTool()
+
+        verbosity_level = LogLevel.INFO if args.verbose else LogLevel.OFF
+        pool = None
+        if args.executor != "local":
+            logger = AgentLogger(verbosity_level)
+            if args.executor == "docker":
+                factory = DockerExecutorFactory(logger=logger)
+            else:
+                factory = SubprocessExecutorFactory(logger=logger)
+            pool = stack.enter_context(ExecutorPool(factory, size=args.concurrency))
+            pool.start()
+
+        runner = TaskRunner(
+            model, [search_tool, VisitWebpageTool()], max_steps=args.max_steps, pool=pool,
+            verbosity_level=verbosity_level,
+        )
+        run_all(runner, pending, args.output, args.concurrency, summary)
+
+    print(json.dumps(asdict(summary), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Copies the shared modules into the example projects that vendor them.
+
+Each example is a uv project of its own (and the LangGraph Server one is
+deployed from its own folder), so they cannot import each other's modules.
+The modules below are kept as verbatim copies of a single source instead:
+edit the source, and then run this script from the repository root. With
+``--check``, it only reports the copies that differ from their source.
+
+    python talk/examples/sync_shared.py [--check]
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Source of each shared module, and the copies made from it (relative to the repository root)
+SHARED = {
+    "talk/examples/lg-llm-with_server/src/agent/compaction.py": [
+        "talk/examples/lg-llm-without_server/compaction.py",
+    ],
+    "workshop/solutions/src/agent_runtime/metrics.py": [
+        "talk/examples/lg-llm-with_server/src/agent/metrics.py",
+    ],
+    "workshop/solutions/src/agent_runtime/rate_limits.py": [
+        "talk/examples/lg-llm-with_server/src/agent/rate_limits.py",
+    ],
+    "workshop/solutions/src/agent_runtime/tool_cache.py": [
+        "talk/examples/lg-llm-with_server/src/agent/tool_cache.py",
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copies the shared modules into the example projects.")
+    parser.add_argument("--check", action="store_true", help="only report the copies that differ")
+    args = parser.parse_args()
+
+    stale = []
+    for source, copies in SHARED.items():
+        for copy in copies:
+            if not filecmp.cmp(os.path.join(ROOT, source), os.path.join(ROOT, copy), shallow=False):
+                stale.append(copy)
+                if not args.check:
+                    shutil.copyfile(os.path.join(ROOT, source), os.path.join(ROOT, copy))
+    for copy in stale:
+        sys.stdout.write("{} {}\n".format("Differs:" if args.check else "Updated:", copy))
+    if args.check and stale:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Measures the tail latency of the travel planner with and without hedging.
+
+Uses a fake chat model whose calls are sometimes much slower than usual,
+as happens with a loaded provider, and runs the travel planner with
+``hedging`` disabled and enabled (for ``identify_destination`` and
+``summary_report``). Reports the end-to-end p50/p99 latency of the runs,
+and the hedge rate and latency of each hedged node. No API keys are needed.
+Run it from the ``solutions`` folder with:
+
+    uv run python benchmarks/hedging.py --runs 200 --tail-probability 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, List
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+
+import travel_planner.graph as planner
+from agent_runtime.hedging import hedger, percentile
+from agent_runtime.models import model_registry
+from agent_runtime.testing import FakeChatModel, StubSearchTool
+from travel_planner.context import ContextSchema
+
+TRIP = {
+    "departure_city": "Madrid",
+    "departure_country": "Spain",
+    "destination_city": "Lisbon",
+    "destination_country": "Portugal",
+}
+
+
+class TailLatencyChatModel(FakeChatModel):
+    """Fake chat model where a fraction of the calls take ``tail_latency`` more seconds."""
+
+    tail_probability: float = 0.0
+    tail_latency: float = 0.0
+
+    async def _delay(self) -> None:
+        if random.random() < self.tail_probability:
+            await asyncio.sleep(self.tail_latency)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await self._delay()
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        await self._delay()
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+async def measure(graph, runs: int, concurrency: int, context: ContextSchema) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int) -> float:
+        config = {"configurable": {"thread_id": "hedging-{}-{}".format(context.hedging, i)}}
+        async with semaphore:
+            start = time.perf_counter()
+            # A different query on each run, so the structured output cache always misses
+            query = "Trip {} (hedging: {}): Madrid to Lisbon".format(i, context.hedging)
+            await graph.ainvoke({"messages": [("user", query)]}, config, context=context)
+            await graph.ainvoke(Command(resume=""), config, context=context)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(run(i) for i in range(runs)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="usual seconds per model or tool call")
+    parser.add_argument("--tail-probability", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="extra seconds of slow calls")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    model_registry.set_factory(lambda model, **kwargs: TailLatencyChatModel(
+        latency=args.latency,
+        tail_probability=args.tail_probability,
+        tail_latency=args.tail_latency,
+        structured={"TripDetails": TRIP},
+    ))
+    planner.get_search_tools = lambda: (StubSearchTool(latency=args.latency),)
+    graph = planner.graph.builder.compile(checkpointer=InMemorySaver())
+    # Hedge as soon as there are a few latencies to go by
+    hedger.min_samples = 10
+    hedger.initial_delay = 10 * args.latency
+
+    sys.stdout.write("{:>10} {:>10} {:>10}\n".format("hedging", "p50 (s)", "p99 (s)"))
+    for hedging in (False, True):
+        latencies = await measure(graph, args.runs, args.concurrency, ContextSchema(hedging=hedging))
+        sys.stdout.write("{:>10} {:>10.3f} {:>10.3f}\n".format(
+            str(hedging), percentile(latencies, 50), percentile(latencies, 99)))
+    sys.stdout.write(json.dumps(hedger.report(), indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""Measures the per-run cost of building the travel planner research subgraphs.
+
+Compares compiling a fresh ReAct subgraph on every run against reusing the
+cached one, using a fake chat model and a stub search tool (no API keys are
+needed). Run it from the ``solutions`` folder with:
+
+    uv run python benchmarks/research_subgraphs.py --runs 200
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from langgraph.constants import START
+from langgraph.graph import StateGraph
+
+import travel_planner.graph as planner
+from agent_runtime.models import model_registry
+from agent_runtime.testing import FakeChatModel, StubSearchTool
+from travel_planner.context import ContextSchema
+from travel_planner.state import State
+
+TRIP = {
+    "messages": [],
+    "departure_city": "Madrid",
+    "departure_country": "Spain",
+    "destination_city": "Lisbon",
+    "destination_country": "Portugal",
+}
+
+
+def make_runner():
+    node = planner.subgraph_for_prompt_template("instructions", planner.TRIP_INSTRUCTIONS_TEMPLATE)
+    return (
+        StateGraph(State, context_schema=ContextSchema)
+        .add_node("find_travel_instructions", node)
+        .add_edge(START, "find_travel_instructions")
+        .compile()
+    )
+
+
+async def measure(runner, runs: int, cached: bool):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    allocated = 0
+    for _ in range(runs):
+        if not cached:
+            planner.research_subgraphs.clear()
+        before, _ = tracemalloc.get_traced_memory()
+        await runner.ainvoke(TRIP, context=ContextSchema())
+        after, peak = tracemalloc.get_traced_memory()
+        allocated += max(peak - before, 0)
+        tracemalloc.reset_peak()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    tracemalloc.stop()
+    return {
+        "cpu_ms_per_run": 1000 * cpu / runs,
+        "wall_ms_per_run": 1000 * wall / runs,
+        "peak_kib_per_run": allocated / runs / 1024,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    model_registry.set_factory(lambda model, **kwargs: FakeChatModel(
+        tool_calls=[{"name": "tavily_search", "args": {"query": "Madrid to Lisbon"}}]
+    ))
+    planner.get_search_tools = lambda: (StubSearchTool(),)
+    runner = make_runner()
+
+    # Warm up imports and lazily-built objects before measuring
+    await measure(runner, 5, cached=True)
+    for label, cached in (("compile per run", False), ("cached subgraph", True)):
+        result = await measure(runner, args.runs, cached)
+        sys.stdout.write("{:>16}: {cpu_ms_per_run:8.2f} ms CPU, {wall_ms_per_run:8.2f} ms wall, "
+                         "{peak_kib_per_run:8.1f} KiB peak allocations per run\n".format(label, **result))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
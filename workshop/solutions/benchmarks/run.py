@@ -0,0 +1,296 @@
+"""Throughput and latency benchmarks of all the graphs, using fake models and tools.
+
+Runs the ``travel_planner``, ``tdd`` and ``prebuilt_searcher`` graphs from
+this project, and the ``chatbot`` and ``searcher`` graphs from the talk's
+``lg-llm-with_server`` example, with the fake chat model and stub tools in
+``agent_runtime.testing`` (no API keys or network access are needed). For
+each graph, it reports:
+
+* the framework overhead per superstep, from runs with instant fakes,
+* p50/p99 latency and throughput of concurrent runs with slow fakes,
+* the peak RSS of the process that ran the graph (each graph runs in its
+  own process).
+
+Results can be compared with a baseline JSON file to spot regressions.
+Run it from the ``solutions`` folder with:
+
+    uv run python benchmarks/run.py
+    uv run python benchmarks/run.py --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TALK_SRC = os.path.join(HERE, "..", "..", "..", "talk", "examples", "lg-llm-with_server", "src")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+# Metrics where higher values are regressions (the rest are throughputs)
+LOWER_IS_BETTER = ("overhead_ms_per_superstep", "p50_ms", "p99_ms", "peak_rss_mib")
+
+TRIP = {
+    "departure_city": "Madrid",
+    "departure_country": "Spain",
+    "destination_city": "Lisbon",
+    "destination_country": "Portugal",
+}
+
+Run = Callable[[int, Optional[List[int]]], Awaitable[None]]
+
+
+async def drive(graph, input: Any, config: dict, steps: Optional[List[int]], **kwargs: Any) -> None:
+    """Run a graph, counting its supersteps into ``steps`` if given."""
+    if steps is None:
+        await graph.ainvoke(input, config, **kwargs)
+        return
+    seen = set()
+    async for event in graph.astream(input, config, stream_mode="debug", **kwargs):
+        if event["type"] == "task":
+            seen.add(event["step"])
+    steps.append(len(seen))
+
+
+def thread(i: int) -> dict:
+    return {"configurable": {"thread_id": "bench-{}".format(i)}}
+
+
+async def setup_travel_planner(latency: float) -> Run:
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.types import Command
+
+    import travel_planner.graph as planner
+    from agent_runtime.models import model_registry
+    from agent_runtime.testing import FakeChatModel, StubSearchTool
+    from travel_planner.context import ContextSchema
+
+    model_registry.set_factory(lambda model, **kwargs: FakeChatModel(
+        latency=latency,
+        structured={"TripDetails": TRIP},
+        tool_calls=[{"name": "tavily_search", "args": {"query": "Madrid to Lisbon"}}],
+    ))
+    planner.get_search_tools = lambda: (StubSearchTool(latency=latency),)
+    graph = planner.graph.builder.compile(checkpointer=InMemorySaver())
+
+    async def run(i: int, steps: Optional[List[int]]) -> None:
+        # A different query on each run, so the structured output cache always misses
+        query = {"messages": [("user", "Trip {}: from Madrid to Lisbon".format(i))]}
+        await drive(graph, query, thread(i), steps, context=ContextSchema())
+        await drive(graph, Command(resume=""), thread(i), steps, context=ContextSchema())
+
+    return run
+
+
+async def setup_tdd(latency: float) -> Run:
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.types import Command
+
+    import tdd.graph as tdd
+    from agent_runtime.models import model_registry
+    from agent_runtime.testing import FakeChatModel
+    from tdd.context import ContextSchema
+
+    model_registry.set_factory(lambda model, **kwargs: FakeChatModel(
+        latency=latency,
+        structured={"ProgramSpecification": {"programming_language": "Python"}},
+    ))
+    graph = tdd.graph.builder.compile(checkpointer=InMemorySaver())
+
+    async def run(i: int, steps: Optional[List[int]]) -> None:
+        request = {"messages": [("user", "Program {}: a Python function that adds two numbers".format(i))]}
+        await drive(graph, request, thread(i), steps, context=ContextSchema())
+        await drive(graph, Command(resume=""), thread(i), steps, context=ContextSchema())
+
+    return run
+
+
+async def setup_prebuilt_searcher(latency: float) -> Run:
+    from langgraph.prebuilt import create_react_agent
+
+    from agent_runtime.testing import FakeChatModel, StubSearchTool
+
+    # The module builds its model and tools on import, so we rebuild the
+    # graph in the same way with the fakes
+    graph = create_react_agent(
+        model=FakeChatModel(
+            latency=latency,
+            tool_calls=[{"name": "tavily_search", "args": {"query": "LangGraph"}}],
+        ),
+        tools=[StubSearchTool(latency=latency)],
+    )
+
+    async def run(i: int, steps: Optional[List[int]]) -> None:
+        await drive(graph, {"messages": [("user", "Question {}".format(i))]}, thread(i), steps)
+
+    return run
+
+
+async def setup_chatbot(latency: float) -> Run:
+    sys.path.insert(0, TALK_SRC)
+    import agent  # noqa: F401 (the package replaces the chatbot attribute with its graph)
+
+    from agent_runtime.testing import FakeChatModel
+
+    chatbot = sys.modules["agent.chatbot"]
+    chatbot.llm = FakeChatModel(latency=latency)
+
+    async def run(i: int, steps: Optional[List[int]]) -> None:
+        await drive(chatbot.graph, {"messages": [("user", "Hello {}".format(i))]}, thread(i), steps)
+
+    return run
+
+
+async def setup_searcher(latency: float) -> Run:
+    sys.path.insert(0, TALK_SRC)
+    import agent  # noqa: F401
+    from agent.tool_cache import ToolCache
+
+    from agent_runtime.testing import FakeChatModel, stub_mcp_tools
+
+    searcher = sys.modules["agent.searcher"]
+    searcher.llm = FakeChatModel(
+        latency=latency,
+        tool_calls=[{"name": "search", "args": {"query": "LangGraph", "max_results": 3}}],
+    )
+    # Expire every entry at once, so each run calls the tools
+    searcher.tool_cache = ToolCache(ttl=0)
+    tools = stub_mcp_tools(latency=latency)
+
+    async def get_tools():
+        return tools
+
+    searcher.ddg_pool.get_tools = get_tools
+    graph = await searcher.make_graph().__aenter__()
+
+    async def run(i: int, steps: Optional[List[int]]) -> None:
+        await drive(graph, {"messages": [("user", "Search {}".format(i))]}, thread(i), steps)
+
+    return run
+
+
+SCENARIOS: Dict[str, Callable[[float], Awaitable[Run]]] = {
+    "travel_planner": setup_travel_planner,
+    "tdd": setup_tdd,
+    "prebuilt_searcher": setup_prebuilt_searcher,
+    "chatbot": setup_chatbot,
+    "searcher": setup_searcher,
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def measure(name: str, runs: int, concurrency: int, latency: float) -> Dict[str, float]:
+    # Overhead: sequential runs with instant fakes, so nearly all time is spent in the framework
+    run = await SCENARIOS[name](0.0)
+    for i in range(5):
+        await run(-i - 1, None)
+    steps: List[int] = []
+    await run(-100, steps)
+    start = time.perf_counter()
+    for i in range(runs):
+        await run(i, None)
+    overhead = (time.perf_counter() - start) / runs / sum(steps)
+
+    # Latency and throughput: concurrent runs with slow fakes
+    run = await SCENARIOS[name](latency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await run(runs + i, None)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(i) for i in range(runs)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "supersteps": sum(steps),
+        "overhead_ms_per_superstep": 1000 * overhead,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "throughput_runs_per_s": runs / elapsed,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def measure_in_process(name: str, runs: int, concurrency: int, latency: float) -> Dict[str, float]:
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+    os.environ.setdefault("TAVILY_API_KEY", "fake-key")
+    return asyncio.run(measure(name, runs, concurrency, latency))
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Return a description of each metric that got worse than the baseline by more than ``tolerance``."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old or metric == "supersteps":
+                continue
+            change = (value - old) / old if metric in LOWER_IS_BETTER else (old - value) / old
+            if change > tolerance:
+                regressions.append("{} {}: {:.2f} -> {:.2f} ({:+.0%})".format(name, metric, old, value, (value - old) / old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("graphs", nargs="*", help="graphs to benchmark: {} (all by default)".format(", ".join(SCENARIOS)))
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake model or tool call")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+    unknown = set(args.graphs) - set(SCENARIOS)
+    if unknown:
+        parser.error("unknown graphs: {}".format(", ".join(sorted(unknown))))
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in args.graphs or SCENARIOS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(measure_in_process, name, args.runs, args.concurrency, args.latency).result()
+
+    columns = ["supersteps", "overhead_ms_per_superstep", "p50_ms", "p99_ms", "throughput_runs_per_s", "peak_rss_mib"]
+    headers = ["steps", "overhead/step (ms)", "p50 (ms)", "p99 (ms)", "runs/s", "peak RSS (MiB)"]
+    sys.stdout.write("{:>18}".format("") + "".join("{:>20}".format(h) for h in headers) + "\n")
+    for name, metrics in results.items():
+        sys.stdout.write("{:>18}".format(name) + "".join("{:>20.2f}".format(metrics[c]) for c in columns) + "\n")
+
+    settings = {"runs": args.runs, "concurrency": args.concurrency, "latency": args.latency}
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        sys.stdout.write("Saved baseline to {}\n".format(args.baseline))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            # Throughput and latency depend on these, so the results are not comparable
+            sys.stdout.write("Not comparing with {}, which was recorded with {} instead of {}\n".format(
+                args.baseline, baseline.get("settings"), settings))
+            return
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            sys.stdout.write("Regression: {}\n".format(regression))
+        if regressions:
+            sys.exit(1)
+        sys.stdout.write("No regressions over {:.0%} against {}\n".format(args.tolerance, args.baseline))
+
+
+if __name__ == "__main__":
+    main()
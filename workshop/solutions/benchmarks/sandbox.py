@@ -0,0 +1,80 @@
+"""Compares the latency of test runs in the warm sandbox pool against a new interpreter per run.
+
+Runs a small program against its unittest module many times, first by
+starting a new interpreter for every run (as a plain ``subprocess.run`` would),
+and then through ``tdd.sandbox.SandboxPool``, whose workers fork each run
+from an interpreter that is already warm. Reports the p50/p99 latency of a
+run with each approach. Run it from the ``solutions`` folder with:
+
+    uv run python benchmarks/sandbox.py --runs 200
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+from agent_runtime.hedging import percentile
+from tdd.sandbox import SandboxPool
+
+PROGRAM = """
+def add(a, b):
+    return a + b
+"""
+
+TESTS = """
+import unittest
+from program import add
+
+class TestAdd(unittest.TestCase):
+    def test_T1_adds_two_numbers(self):
+        self.assertEqual(add(1, 2), 3)
+
+    def test_T2_adds_negative_numbers(self):
+        self.assertEqual(add(-1, -2), -3)
+"""
+
+
+def cold_runs(runs: int) -> List[float]:
+    latencies = []
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+        with open(os.path.join(workdir, "test_program.py"), "w") as f:
+            f.write(TESTS)
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-E", "-s", "-m", "unittest", "-q", "test_program"],
+                           cwd=workdir, capture_output=True, check=True)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def warm_runs(runs: int) -> List[float]:
+    pool = SandboxPool(size=1)
+    pool.start()
+    latencies = []
+    for _ in range(runs):
+        result = pool.run(PROGRAM, TESTS)
+        assert result["status"] == "passed", result
+        latencies.append(result["seconds"])
+    pool.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    sys.stdout.write("{:>12} {:>10} {:>10}\n".format("runs", "p50 (ms)", "p99 (ms)"))
+    for name, measure in (("cold", cold_runs), ("warm pool", warm_runs)):
+        latencies = measure(args.runs)
+        sys.stdout.write("{:>12} {:>10.2f} {:>10.2f}\n".format(
+            name, 1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+__all__ = ["batch_api", "hedging", "llm_cache", "metrics", "models", "prompts", "rate_limits", "routing", "subgraphs", "testing", "tool_cache"]
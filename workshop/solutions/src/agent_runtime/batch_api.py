@@ -0,0 +1,325 @@
+"""Structured output calls through the OpenAI Batch API.
+
+Offline workloads, such as extracting the trip details of thousands of
+queued requests, do not need their answers right away. The Batch API takes
+a JSONL file of requests and answers all of them within a completion
+window, at half the price and outside of the usual rate limits.
+
+``BatchAPIBackend`` collects the structured output calls made by many
+concurrent graph runs for a short while, submits them together as one
+batch, polls the batch until it finishes, and then resumes each waiting
+run with its answer. Calls to models that are not served by OpenAI are
+made directly instead. The ``FakeBatchServer`` in ``agent_runtime.testing``
+implements the relevant endpoints for trying this out offline.
+
+Batches can take hours, so the backend can record each submitted batch in a
+journal file, with the custom IDs of its requests. These IDs are derived
+from the request bodies, so after a restart the same calls find the batch
+they were submitted in, and wait for it instead of submitting it again.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple, Type, TypeVar, cast
+
+from langchain_core.language_models import BaseChatModel
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+# request_body builds the same request as BaseChatOpenAI through private
+# APIs, last checked with openai 1.102 and langchain-openai 0.3.32 (as in
+# uv.lock). They are only used in _private_request_payload.
+try:
+    from openai.lib._parsing._completions import type_to_response_format_param
+except ImportError:  # pragma: no cover
+    type_to_response_format_param = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequestError(RuntimeError):
+    """A request in a batch did not produce an answer."""
+
+
+@dataclass
+class BatchAPIStats:
+    batches: int = 0
+    requests: int = 0
+    answered: int = 0
+    failed: int = 0
+    # Calls to non-OpenAI models, which were made directly
+    direct_calls: int = 0
+    # Calls answered by a batch submitted before a restart, found in the journal
+    reattached: int = 0
+    # Seconds from submitting each batch until its results were read
+    wait_seconds: float = 0.0
+
+
+class _Pending:
+    def __init__(self, custom_id: str, body: Dict[str, Any], schema: Type[BaseModel]):
+        self.custom_id = custom_id
+        self.body = body
+        self.schema = schema
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+def _private_request_payload(model: BaseChatOpenAI, prompt: Any, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        messages = model._convert_input(prompt).to_messages()
+        body = model._get_request_payload(messages, **kwargs)
+    except AttributeError as e:
+        raise NotImplementedError(
+            "This version of langchain-openai cannot build Batch API requests (tested with 0.3.32)") from e
+    if isinstance(body.get("response_format"), type):
+        if type_to_response_format_param is None:
+            raise NotImplementedError(
+                "This version of openai cannot build Batch API requests (tested with 1.102)")
+        # The client converts Pydantic classes into a strict JSON schema when parsing
+        body["response_format"] = type_to_response_format_param(body["response_format"])
+    return body
+
+
+def request_body(model: BaseChatOpenAI, schema: Type[BaseModel], prompt: Any) -> Dict[str, Any]:
+    """
+    Returns the body of the chat completions request that
+    ``model.with_structured_output(schema).ainvoke(prompt)`` would send.
+    Args:
+        model (BaseChatOpenAI): The OpenAI chat model.
+        schema (Type[BaseModel]): The schema of the structured output.
+        prompt: The prompt, as a string or a list of messages.
+    """
+    structured = model.with_structured_output(schema)
+    kwargs = dict(structured.first.kwargs)
+    kwargs.pop("ls_structured_output_format", None)
+    body = _private_request_payload(model, prompt, kwargs)
+    body.pop("stream", None)
+    return body
+
+
+def custom_id(body: Dict[str, Any]) -> str:
+    """Returns the custom ID of a request, which is the same for the same body in every process."""
+    return "request-" + hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def parse_answer(schema: Type[T], response: Dict[str, Any]) -> T:
+    """Returns the structured output in a chat completion from the Batch API."""
+    message = response["choices"][0]["message"]
+    if message.get("refusal"):
+        raise BatchRequestError("The model refused to answer: {}".format(message["refusal"]))
+    if message.get("tool_calls"):
+        return schema.model_validate_json(message["tool_calls"][0]["function"]["arguments"])
+    return schema.model_validate_json(message["content"])
+
+
+class BatchAPIBackend:
+    """Answers structured output calls in batches through the OpenAI Batch API.
+
+    Args:
+        client (AsyncOpenAI): Client for the Batch API. Defaults to one
+            configured from the environment, with ``OPENAI_BATCH_BASE_URL``
+            overriding the base URL (e.g. to use a ``FakeBatchServer``).
+        max_wait (float): Seconds to keep collecting calls after the first
+            one arrives, before submitting them.
+        max_batch_size (int): Calls that are submitted as soon as they are
+            collected, without waiting any longer.
+        poll_interval (float): Seconds between checks of a submitted batch.
+        completion_window (str): Time the provider has to finish a batch.
+        journal_path (str): JSONL file where submitted batches are
+            recorded, to reattach to them after a restart. Batches are not
+            recorded if None.
+    """
+
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        max_wait: float = 2.0,
+        max_batch_size: int = 10_000,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+        journal_path: Optional[str] = None,
+    ):
+        self._client = client
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.journal_path = journal_path
+        self.stats = BatchAPIStats()
+        self._queue: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Batch of each custom ID in the journal, read on first use
+        self._journal: Optional[Dict[str, str]] = None
+        # Status and results of each batch waited for, shared by its calls
+        self._waits: Dict[str, asyncio.Task] = {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(base_url=os.environ.get("OPENAI_BATCH_BASE_URL") or None)
+        return self._client
+
+    async def ainvoke(self, model: BaseChatModel, schema: Type[T], prompt: Any) -> T:
+        """Returns the structured output for the prompt, once the batch it joined has finished."""
+        if not isinstance(model, BaseChatOpenAI):
+            self.stats.direct_calls += 1
+            return cast(T, await model.with_structured_output(schema).ainvoke(prompt))
+
+        body = request_body(model, schema, prompt)
+        pending = _Pending(custom_id(body), body, schema)
+        batch_id = self._journaled_batch(pending.custom_id)
+        if batch_id is not None:
+            try:
+                batch, results = await asyncio.shield(self._wait(batch_id))
+                answer = self._answer(batch, results, pending)
+                self.stats.reattached += 1
+                return cast(T, answer)
+            except Exception as e:
+                logger.warning("Could not get %s from batch %s, submitting it again: %s",
+                               pending.custom_id, batch_id, e)
+
+        self._queue.append(pending)
+        if len(self._queue) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        return await pending.future
+
+    def flush(self) -> None:
+        """Submits the calls collected so far as a batch, without waiting any longer."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        queue, self._queue = self._queue, []
+        # Runs cancelled while waiting for the timer do not need an answer
+        queue = [p for p in queue if not p.future.done()]
+        if queue:
+            task = asyncio.get_running_loop().create_task(self._run(queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, queue: List[_Pending]) -> None:
+        try:
+            await self._submit(queue)
+        except Exception as e:
+            logger.exception("Batch of %d requests failed", len(queue))
+            for pending in queue:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+                    self.stats.failed += 1
+
+    async def _submit(self, queue: List[_Pending]) -> None:
+        # Identical calls are sent once, as custom IDs must be unique in a batch
+        bodies = {p.custom_id: p.body for p in queue}
+        lines = [
+            json.dumps({"custom_id": i, "method": "POST", "url": ENDPOINT, "body": body})
+            for i, body in bodies.items()
+        ]
+        start = time.monotonic()
+        upload = await self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=upload.id, endpoint=ENDPOINT, completion_window=self.completion_window)
+        self.stats.batches += 1
+        self.stats.requests += len(queue)
+        logger.info("Submitted batch %s with %d requests", batch.id, len(lines))
+        self._record(batch.id, list(bodies))
+
+        batch, results = await asyncio.shield(self._wait(batch.id, batch))
+        self.stats.wait_seconds += time.monotonic() - start
+
+        for pending in queue:
+            if pending.future.done():
+                continue
+            try:
+                pending.future.set_result(self._answer(batch, results, pending))
+                self.stats.answered += 1
+            except Exception as e:
+                pending.future.set_exception(e)
+                self.stats.failed += 1
+
+    def _wait(self, batch_id: str, batch: Any = None) -> asyncio.Task:
+        """Returns the task polling a batch until it finishes, and then reading its results."""
+        if batch_id not in self._waits:
+            self._waits[batch_id] = asyncio.get_running_loop().create_task(self._poll(batch_id, batch))
+        return self._waits[batch_id]
+
+    async def _poll(self, batch_id: str, batch: Any = None) -> Tuple[Any, Dict[str, Dict[str, Any]]]:
+        if batch is None:
+            batch = await self.client.batches.retrieve(batch_id)
+        while batch.status not in FINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch_id)
+
+        # Expired and cancelled batches may still have answered some requests
+        results: Dict[str, Dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self.client.files.content(file_id)
+                for line in content.text.splitlines():
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["custom_id"]] = result
+        logger.info("Batch %s is %s with %d results", batch.id, batch.status, len(results))
+        return batch, results
+
+    @staticmethod
+    def _answer(batch: Any, results: Dict[str, Dict[str, Any]], pending: _Pending) -> BaseModel:
+        result = results.get(pending.custom_id)
+        if result is None:
+            raise BatchRequestError("Batch {} is {} without an answer for {}".format(
+                batch.id, batch.status, pending.custom_id))
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            raise BatchRequestError("Request {} failed: {}".format(
+                pending.custom_id, result.get("error") or response.get("body")))
+        return parse_answer(pending.schema, response["body"])
+
+    def _journaled_batch(self, custom_id: str) -> Optional[str]:
+        if self.journal_path is None:
+            return None
+        if self._journal is None:
+            self._journal = {}
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Last line of a process that was killed while writing
+                            continue
+                        self._journal.update(dict.fromkeys(entry["custom_ids"], entry["batch_id"]))
+        return self._journal.get(custom_id)
+
+    def _record(self, batch_id: str, custom_ids: List[str]) -> None:
+        if self.journal_path is None:
+            return
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps({"batch_id": batch_id, "custom_ids": custom_ids}) + "\n")
+        if self._journal is not None:
+            self._journal.update(dict.fromkeys(custom_ids, batch_id))
+
+    async def aclose(self) -> None:
+        """Submits any collected calls and waits for all the batches to finish."""
+        self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Shared by all graphs, so that calls from any of them can join the same batch
+batch_api = BatchAPIBackend(
+    poll_interval=float(os.environ.get("OPENAI_BATCH_POLL_INTERVAL", "30")),
+    journal_path=os.environ.get("OPENAI_BATCH_JOURNAL") or None,
+)
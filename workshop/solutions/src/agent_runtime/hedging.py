@@ -0,0 +1,299 @@
+"""Hedged model requests, with an ordered chain of fallback models.
+
+A few slow requests set the end-to-end latency of a run, and waiting longer
+for them rarely helps. ``Hedger`` sends a request to the first model of a
+chain, and if it has not answered after the usual latency of that model
+(its 95th percentile, by default), sends a duplicate: to the next model of
+the chain, or to the same model if there is no other one. The first answer
+wins, and the other request is cancelled (or, if it already answered, its
+answer is discarded, e.g. closing a stream). If a request fails or times
+out, the next model of the chain is tried instead.
+
+``HedgedModel`` applies this to the ``with_structured_output`` and
+``astream`` calls made by the graph nodes. Streams are hedged on their
+first token, and then the winning stream is followed to its end.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableLambda
+from langgraph.config import get_config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+Attempt = Tuple[str, Callable[[], Awaitable[T]]]
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    # Calls that sent a second request because the first one was slow
+    hedged: int = 0
+    # Hedged calls which were answered by the second request
+    hedge_wins: int = 0
+    # Requests sent because the previous one failed or timed out
+    fallbacks: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    # Seconds until the answer of recent calls, including any hedge delay
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "p50": percentile(self.latencies, 50),
+            "p99": percentile(self.latencies, 99),
+        }
+
+
+class Hedger:
+    """Runs requests with hedging and fallbacks, tracking the latency of each model.
+
+    Args:
+        delay_percentile (float): Percentile of the latency of the first
+            model after which the hedge is sent.
+        initial_delay (float): Hedge delay in seconds until ``min_samples``
+            latencies have been seen for a model.
+        min_delay (float): Lower bound of the hedge delay, so that fast
+            models are not hedged all the time.
+        timeout (float): Seconds after which a request is given up, and
+            the next model in the chain is tried.
+        min_samples (int): Latencies needed before using the percentile.
+        window (int): Number of recent latencies kept per model.
+    """
+
+    def __init__(
+        self,
+        delay_percentile: float = 95,
+        initial_delay: float = 10.0,
+        min_delay: float = 0.2,
+        timeout: float = 60.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.delay_percentile = delay_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.timeout = timeout
+        self.min_samples = min_samples
+        self.window = window
+        self.stats: Dict[str, HedgeStats] = {}
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        # Tasks discarding the answers of losing requests
+        self._discards: Set[asyncio.Future] = set()
+
+    def hedge_delay(self, operation: str, model_name: str) -> float:
+        """Returns the seconds to wait for a request to ``model_name`` before hedging it."""
+        latencies = self._latencies.get((operation, model_name), ())
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, percentile(latencies, self.delay_percentile))
+
+    def _record(self, operation: str, model_name: str, latency: float) -> None:
+        self._latencies.setdefault((operation, model_name), deque(maxlen=self.window)).append(latency)
+
+    def _discard_when_done(self, task: asyncio.Future, discard: Callable[[Any], Awaitable[None]]) -> None:
+        def done(task: asyncio.Future) -> None:
+            # Also marks the exceptions of losing requests as retrieved
+            if task.cancelled() or task.exception() is not None:
+                return
+            cleanup = asyncio.ensure_future(discard(task.result()))
+            self._discards.add(cleanup)
+            cleanup.add_done_callback(self._discards.discard)
+
+        task.add_done_callback(done)
+
+    async def run(
+        self, operation: str, attempts: Sequence[Attempt], hedge: bool = True,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """
+        Returns the first answer from a chain of attempts, hedging the first
+        one if it is slow and falling back to the next ones if they fail.
+        Args:
+            operation (str): Name of the kind of request, as latencies differ
+                between operations (e.g. the time to first token of a stream).
+            attempts: Pairs of model name and function that starts a request
+                to that model, in order of preference.
+            hedge (bool): Whether to hedge, or only to fall back on failures.
+            discard: Releases the answer of a request that lost the race,
+                such as a stream that is not followed.
+        """
+        stats = self.stats.setdefault(operation, HedgeStats())
+        stats.calls += 1
+        start = time.monotonic()
+        delay = self.hedge_delay(operation, attempts[0][0])
+        tasks: Dict[asyncio.Future, Tuple[str, float]] = {}
+
+        def launch(index: int) -> asyncio.Future:
+            name, factory = attempts[index]
+            task = asyncio.ensure_future(asyncio.wait_for(factory(), self.timeout))
+            tasks[task] = (name, time.monotonic())
+            return task
+
+        launch(0)
+        next_attempt = 1
+        hedged = not hedge
+        hedge_task: Optional[asyncio.Future] = None
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                wait = None if hedged else max(0.0, start + delay - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    stats.hedged += 1
+                    if next_attempt < len(attempts):
+                        hedge_task = launch(next_attempt)
+                        next_attempt += 1
+                    else:
+                        hedge_task = launch(0)
+                    logger.debug("Hedged %s after %.2fs", operation, delay)
+                    continue
+
+                for task in done:
+                    name, started = tasks.pop(task)
+                    latency = time.monotonic() - started
+                    if task.exception() is None:
+                        self._record(operation, name, latency)
+                        stats.latencies.append(time.monotonic() - start)
+                        if task is hedge_task:
+                            stats.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                    if isinstance(error, asyncio.TimeoutError):
+                        stats.timeouts += 1
+                        # Timeouts are latencies too, so the hedge delay reflects them
+                        self._record(operation, name, latency)
+                    logger.warning("Request to %s for %s failed: %r", name, operation, error)
+
+                if not tasks and next_attempt < len(attempts):
+                    stats.fallbacks += 1
+                    launch(next_attempt)
+                    next_attempt += 1
+            stats.failures += 1
+            assert error is not None
+            raise error
+        finally:
+            # Requests that lost the race, including those that answered at the same time as the winner
+            for task in tasks:
+                task.cancel()
+                if discard is not None:
+                    self._discard_when_done(task, discard)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the hedge rate and latency percentiles of each operation."""
+        return {operation: stats.report() for operation, stats in self.stats.items()}
+
+
+async def _start_stream(model: BaseChatModel, input: Any, **kwargs: Any) -> Tuple[Any, AsyncIterator]:
+    stream = model.astream(input, **kwargs).__aiter__()
+    return await stream.__anext__(), stream
+
+
+async def _close_stream(started: Tuple[Any, AsyncIterator]) -> None:
+    aclose = getattr(started[1], "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+class HedgedModel:
+    """Stands in for a chat model in the graph nodes, hedging its calls with ``hedger``.
+
+    Args:
+        hedger (Hedger): Runs the hedged requests.
+        operation (str): Name of the calls, e.g. the node that makes them.
+        models: Pairs of model name and chat model, in order of preference.
+        hedge (bool): Whether to hedge, or only to fall back on failures.
+    """
+
+    def __init__(self, hedger: Hedger, operation: str, models: Sequence[Tuple[str, BaseChatModel]],
+                 hedge: bool = True):
+        self.hedger = hedger
+        self.operation = operation
+        self.models = list(models)
+        self.hedge = hedge
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        structured = [(name, model.with_structured_output(schema, **kwargs)) for name, model in self.models]
+
+        async def ainvoke(input: Any) -> Any:
+            return await self.hedger.run(
+                self.operation, [(name, partial(runnable.ainvoke, input)) for name, runnable in structured],
+                hedge=self.hedge)
+
+        return RunnableLambda(ainvoke, name="HedgedStructuredOutput")
+
+    async def ainvoke(self, input: Any, **kwargs: Any) -> Any:
+        return await self.hedger.run(
+            self.operation, [(name, partial(model.ainvoke, input, **kwargs)) for name, model in self.models],
+            hedge=self.hedge)
+
+    async def astream(self, input: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        first, stream = await self.hedger.run(
+            self.operation + ":first_token",
+            [(name, partial(_start_stream, model, input, **kwargs)) for name, model in self.models],
+            hedge=self.hedge, discard=_close_stream,
+        )
+        yield first
+        async for chunk in stream:
+            yield chunk
+
+
+# Shared by all graphs, so that the latencies of each model are learned once
+hedger = Hedger()
+
+
+def node_model(registry: Any, context: Any, model_name: Optional[str] = None) -> Any:
+    """
+    Returns the chat model for the current node. If the context enables
+    ``hedging`` or has ``fallback_models``, it is a ``HedgedModel`` over
+    the chain of models, with the node name as operation. Calls through the
+    Batch API are not hedged, as they are not expected to be fast.
+    Args:
+        registry (ModelRegistry): Provides the chat models.
+        context: The ``ContextSchema`` of the current run.
+        model_name (str): First model of the chain, if not the ``model_name``
+            of the context (e.g. the one picked by ``agent_runtime.routing``).
+    """
+    model_name = model_name or context.model_name
+    if context.batch_api or not (context.hedging or context.fallback_models):
+        return registry.get_model(model_name)
+    operation = get_config().get("metadata", {}).get("langgraph_node", "model")
+    names = (model_name,) + tuple(name for name in context.fallback_models if name != model_name)
+    models = [(name, registry.get_model(name)) for name in names]
+    return HedgedModel(hedger, operation, models, hedge=context.hedging)
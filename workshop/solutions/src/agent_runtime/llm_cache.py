@@ -0,0 +1,275 @@
+"""Response cache for structured-output model calls.
+
+Extraction nodes such as ``identify_destination`` render deterministic
+templates, so identical prompts always deserve the same answer. The cache
+is keyed on (model, output schema, rendered prompt) and returns the cached
+Pydantic object without calling the model.
+
+It has two tiers:
+
+* An exact-match tier, kept in any ``tool_cache`` backend (in memory, or
+  persisted to SQLite).
+* An optional similarity tier, which embeds the variable part of the prompt
+  (its request, without the system messages of the instructions) and reuses
+  the answer to the most similar previous request for the same model,
+  schema and instructions, if their cosine similarity is above a threshold.
+  Embedding the long static instructions as well would make every request
+  look alike. The similarity index is kept in memory, bounded per partition,
+  and falls back to calling the model if the embeddings cannot be computed.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar, cast
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage
+from pydantic import BaseModel
+
+from agent_runtime.batch_api import BatchAPIBackend
+from agent_runtime.tool_cache import CacheBackend, default_backend
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+
+@dataclass
+class StructuredCacheStats:
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    # Lookups in the similarity tier that failed to embed the request
+    embedding_errors: int = 0
+
+
+def render_prompt(prompt: Any) -> str:
+    """Return the text of a prompt, given as a string or a list of messages."""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(
+        "{}: {}".format(m.type, m.content) if isinstance(m, BaseMessage) else str(m)
+        for m in prompt
+    )
+
+
+def split_prompt(prompt: Any) -> Tuple[str, str]:
+    """Return the text of the system messages of a prompt (its static instructions), and of the rest."""
+    if isinstance(prompt, str):
+        return "", prompt
+    static = [m for m in prompt if isinstance(m, SystemMessage)]
+    variable = [m for m in prompt if not isinstance(m, SystemMessage)]
+    return render_prompt(static), render_prompt(variable)
+
+
+def _schema_id(schema: Type[BaseModel]) -> str:
+    # Changing the fields of a schema should invalidate its cached objects
+    fields = json.dumps(schema.model_json_schema(), sort_keys=True)
+    return "{}.{}:{}".format(
+        schema.__module__, schema.__qualname__,
+        hashlib.sha256(fields.encode("utf-8")).hexdigest()[:16],
+    )
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norms = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norms if norms else 0.0
+
+
+class StructuredOutputCache:
+    """Caches the results of ``with_structured_output(schema).ainvoke(prompt)``.
+
+    Args:
+        backend (CacheBackend): Store for the exact-match tier.
+        embeddings (Embeddings): Enables the similarity tier if provided.
+        similarity_threshold (float): Minimum cosine similarity for the
+            similarity tier to reuse an answer.
+        max_similar_entries (int): Requests kept in the similarity index for
+            each model, schema and instructions. The oldest are dropped first.
+        ttl (float): Seconds before an entry expires, or ``None`` to keep
+            entries until they are evicted.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        embeddings: Optional[Embeddings] = None,
+        similarity_threshold: float = 0.97,
+        ttl: Optional[float] = None,
+        max_similar_entries: int = 1000,
+    ):
+        self.backend = backend if backend is not None else default_backend("LLM_CACHE_PATH")
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_similar_entries = max_similar_entries
+        self.stats = StructuredCacheStats()
+        self._lock = threading.Lock()
+        # Embedding of the request of each exact-match key, by partition
+        self._index: Dict[str, OrderedDict[str, List[float]]] = {}
+        # Futures of the calls running for each key, from any thread or event loop
+        self._inflight: Dict[str, Future] = {}
+
+    def key(self, model_name: str, schema: Type[BaseModel], prompt: Any) -> str:
+        payload = json.dumps({
+            "model": model_name,
+            "schema": _schema_id(schema),
+            "prompt": render_prompt(prompt),
+        })
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str, schema: Type[T]) -> Optional[T]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self.backend.delete(key)
+            return None
+        return schema.model_validate_json(value)
+
+    def _join(self, key: str, schema: Type[T]) -> Tuple[Optional[T], Optional[Future], Optional[Future]]:
+        """
+        Return ``(answer, None, None)`` on a hit. Otherwise, return the future
+        of the identical call already running, or claim the call for this
+        caller (with a new future in ``_inflight``, which it must ``_settle``).
+        """
+        with self._lock:
+            cached = self._get(key, schema)
+            if cached is not None:
+                return cached, None, None
+            running = self._inflight.get(key)
+            if running is not None:
+                return None, running, None
+            claimed = self._inflight[key] = Future()
+            return None, None, claimed
+
+    def _settle(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            del self._inflight[key]
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, (CancelledError, asyncio.CancelledError)):
+            # Those waiting try again, rather than being cancelled with this caller
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+    async def _find_similar(
+        self, partition: str, prompt: Any, schema: Type[T]
+    ) -> Tuple[Optional[T], Optional[List[float]]]:
+        if self.embeddings is None:
+            return None, None
+        try:
+            vector = await self.embeddings.aembed_query(split_prompt(prompt)[1])
+        except Exception as e:
+            # The similarity tier is an optimization: ask the model instead
+            logger.warning("Could not embed the prompt for the similarity cache: %s", e)
+            self.stats.embedding_errors += 1
+            return None, None
+        with self._lock:
+            candidates = list(self._index.get(partition, {}).items())
+        scored = sorted(
+            ((score, key) for key, other in candidates
+             if (score := _cosine(vector, other)) >= self.similarity_threshold),
+            reverse=True,
+        )
+        for _, key in scored:
+            result = self._get(key, schema)
+            if result is not None:
+                return result, vector
+            # The exact-match entry expired or was evicted
+            with self._lock:
+                self._index.get(partition, {}).pop(key, None)
+        return None, vector
+
+    async def ainvoke(
+        self, model: BaseChatModel, schema: Type[T], prompt: Any, model_name: str,
+        batch: Optional[BatchAPIBackend] = None,
+    ) -> T:
+        """
+        Return the cached answer for the prompt, or ask the model otherwise.
+        If ``batch`` is given, the model is asked through the Batch API.
+        """
+        key = self.key(model_name, schema, prompt)
+        while True:
+            cached, pending, claimed = self._join(key, schema)
+            if cached is not None:
+                self.stats.exact_hits += 1
+                return cached
+            if claimed is not None:
+                break
+            # Identical concurrent prompts wait for the first one to be answered
+            try:
+                result = await asyncio.shield(asyncio.wrap_future(pending))
+            except (CancelledError, asyncio.CancelledError):
+                if pending.cancelled():
+                    # The first caller was cancelled: try again
+                    continue
+                raise
+            self.stats.exact_hits += 1
+            return cast(T, result)
+
+        try:
+            instructions = hashlib.sha256(split_prompt(prompt)[0].encode("utf-8")).hexdigest()[:16]
+            partition = "{}|{}|{}".format(model_name, _schema_id(schema), instructions)
+            result, vector = await self._find_similar(partition, prompt, schema)
+            if result is not None:
+                self.stats.similar_hits += 1
+                self._store(key, result, partition, None)
+            else:
+                self.stats.misses += 1
+                if batch is not None:
+                    output = await batch.ainvoke(model, schema, prompt)
+                else:
+                    output = await model.with_structured_output(schema).ainvoke(prompt)
+                result = cast(T, output)
+                self._store(key, result, partition, vector)
+        except BaseException as e:
+            self._settle(key, claimed, error=e)
+            raise
+        self._settle(key, claimed, result)
+        return result
+
+    def _store(
+        self, key: str, result: BaseModel, partition: str, vector: Optional[List[float]]
+    ) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self.backend.set(key, result.model_dump_json(), expires_at)
+        if vector is not None:
+            with self._lock:
+                index = self._index.setdefault(partition, OrderedDict())
+                index[key] = vector
+                index.move_to_end(key)
+                while len(index) > self.max_similar_entries:
+                    index.popitem(last=False)
+
+
+def default_structured_output_cache() -> StructuredOutputCache:
+    """Build the cache from environment variables.
+
+    ``LLM_CACHE_PATH`` persists the exact-match tier to SQLite, and
+    ``LLM_CACHE_EMBEDDINGS`` (e.g. ``openai:text-embedding-3-small``)
+    enables the similarity tier, with ``LLM_CACHE_SIMILARITY`` as threshold.
+    """
+    embeddings = None
+    embeddings_model = os.environ.get("LLM_CACHE_EMBEDDINGS")
+    if embeddings_model:
+        from langchain.embeddings import init_embeddings
+        embeddings = cast(Embeddings, init_embeddings(embeddings_model))
+    return StructuredOutputCache(
+        embeddings=embeddings,
+        similarity_threshold=float(os.environ.get("LLM_CACHE_SIMILARITY", "0.97")),
+    )
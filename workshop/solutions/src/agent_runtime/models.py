@@ -0,0 +1,200 @@
+"""Process-wide registry of chat models shared by all graph nodes.
+
+Calling ``init_chat_model`` from every node builds a new client, with its
+own HTTP connection pool and TLS sessions, on every step of every thread.
+The registry builds each model once per model name and hands all of them
+the same pooled ``httpx`` clients, so connections are reused across nodes,
+threads and models. Requests made through those clients also go through a
+shared ``RateLimiter``, which keeps them within the provider's rate limits.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Type, get_args, get_type_hints
+
+import httpx
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models import BaseChatModel
+
+from agent_runtime.rate_limits import (
+    RateLimitedAsyncTransport,
+    RateLimitedTransport,
+    RateLimiter,
+    rate_limiter,
+)
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL_PREFIXES = ("openai:", "gpt-", "chatgpt-", "o1", "o3", "o4")
+
+
+@dataclass
+class RegistryStats:
+    hits: int = 0
+    misses: int = 0
+    requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+
+
+class _ConnectionTracker:
+    """Tells apart requests served by a fresh connection from reused ones."""
+
+    def __init__(self, stats: RegistryStats, lock: threading.Lock):
+        self._stats = stats
+        self._lock = lock
+        self._seen: weakref.WeakSet = weakref.WeakSet()
+
+    def record(self, response: httpx.Response) -> None:
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self._stats.requests += 1
+            if stream is None:
+                return
+            if stream in self._seen:
+                self._stats.reused_connections += 1
+            else:
+                self._seen.add(stream)
+                self._stats.new_connections += 1
+
+
+class _TrackingTransport(httpx.HTTPTransport):
+    def __init__(self, tracker: _ConnectionTracker, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._tracker = tracker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        self._tracker.record(response)
+        return response
+
+
+class _TrackingAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, tracker: _ConnectionTracker, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._tracker = tracker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        self._tracker.record(response)
+        return response
+
+
+def is_openai_model(model_name: str) -> bool:
+    return model_name.startswith(OPENAI_MODEL_PREFIXES)
+
+
+class ModelRegistry:
+    """Caches chat models by model name.
+
+    Args:
+        max_connections (int): Size of the shared HTTP connection pool.
+        max_keepalive_connections (int): Idle connections kept open for reuse.
+        timeout (float): Default HTTP timeout for model requests, in seconds.
+        factory (Callable): Builds a chat model from a model name and keyword
+            arguments. Defaults to ``init_chat_model``.
+        limiter (RateLimiter): Schedules the requests of all models, or
+            ``None`` to send them right away.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 60.0,
+        factory: Callable[..., BaseChatModel] = init_chat_model,
+        limiter: Optional[RateLimiter] = rate_limiter,
+    ):
+        self.factory = factory
+        self.limiter = limiter
+        self.stats = RegistryStats()
+        self._lock = threading.Lock()
+        self._models: Dict[str, BaseChatModel] = {}
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._timeout = timeout
+        self._tracker = _ConnectionTracker(self.stats, self._lock)
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            transport: httpx.BaseTransport = _TrackingTransport(self._tracker, limits=self._limits)
+            if self.limiter is not None:
+                transport = RateLimitedTransport(self.limiter, transport)
+            self._http_client = httpx.Client(transport=transport, timeout=self._timeout)
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            transport: httpx.AsyncBaseTransport = _TrackingAsyncTransport(self._tracker, limits=self._limits)
+            if self.limiter is not None:
+                transport = RateLimitedAsyncTransport(self.limiter, transport)
+            self._http_async_client = httpx.AsyncClient(transport=transport, timeout=self._timeout)
+        return self._http_async_client
+
+    def get(self, context: Any) -> BaseChatModel:
+        """Return the shared chat model for the ``model_name`` of a ``ContextSchema`` instance."""
+        return self.get_model(context.model_name)
+
+    def get_model(self, model_name: str) -> BaseChatModel:
+        """Return the shared chat model for a model name, building it on first use."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                self.stats.hits += 1
+                return model
+            self.stats.misses += 1
+
+        model = self._create(model_name)
+        with self._lock:
+            # Another thread may have won the race: keep the first model
+            return self._models.setdefault(model_name, model)
+
+    def _create(self, model_name: str) -> BaseChatModel:
+        kwargs: Dict[str, Any] = {}
+        if is_openai_model(model_name):
+            kwargs["http_client"] = self.http_client
+            kwargs["http_async_client"] = self.http_async_client
+        return self.factory(model=model_name, **kwargs)
+
+    def warm_up(self, context_schema: Type[Any]) -> None:
+        """Build the models for every ``model_name`` allowed by a context schema.
+
+        Warming up is best effort: a missing API key should not stop the graph
+        from loading, so failures are only logged.
+        """
+        hint = get_type_hints(context_schema).get("model_name")
+        for model_name in get_args(hint) or (context_schema().model_name,):
+            try:
+                self.get_model(model_name)
+            except Exception as e:
+                logger.warning("Could not warm up model %s: %s", model_name, e)
+
+    def set_factory(self, factory: Callable[..., BaseChatModel]) -> None:
+        """Replace the model factory (e.g. with a fake model), dropping cached models."""
+        self.factory = factory
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    async def aclose(self) -> None:
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self.clear()
+
+
+model_registry = ModelRegistry()
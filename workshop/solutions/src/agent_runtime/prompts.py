@@ -0,0 +1,70 @@
+"""Prompt templates split into a static prefix and a variable suffix.
+
+Providers cache the longest prompt prefix they have recently seen (OpenAI
+does so for prompts of 1024 tokens or more), and bill cached tokens at a
+discount. A template that puts the state in the middle of its instructions
+breaks that prefix on every call. ``PromptTemplate`` keeps the instructions
+static, in a system message that is identical across calls, and only puts
+the variable values in the human message that follows it.
+
+Templates are compiled when they are defined: the placeholders of the
+request are parsed once, and checked against the variables that will be
+available (e.g. the keys of the graph state), so a typo fails at import
+rather than on the first call. Rendering only reads the values of those
+placeholders, instead of formatting the whole state.
+
+The tokens served from the provider cache are reported by
+``agent_runtime.metrics``, as ``agent_llm_tokens_total{kind="cache_read"}``.
+"""
+from __future__ import annotations
+
+from string import Formatter
+from textwrap import dedent
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+
+class PromptTemplate:
+    """A prompt with static instructions and a request with ``{name}`` placeholders.
+
+    Args:
+        instructions (str): Static text, sent as the system message. It
+            cannot have placeholders, as it must be the same on every call.
+        request (str): Text sent as the human message, with a placeholder
+            for each variable value.
+        variables: Names allowed as placeholders, if they should be checked.
+    """
+
+    def __init__(self, instructions: str, request: str, variables: Optional[Iterable[str]] = None):
+        self.instructions = dedent(instructions).strip()
+        self.request = dedent(request).strip()
+        if any(name is not None for _, name, _, _ in Formatter().parse(self.instructions)):
+            raise ValueError("Instructions must be static, but have placeholders: {!r}".format(self.instructions))
+
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, name, spec, conversion in Formatter().parse(self.request):
+            if name is not None and (not name.isidentifier() or spec or conversion):
+                raise ValueError("Placeholder {{{}}} must be a plain name".format(name))
+            self._parts.append((literal, name))
+        self.fields = tuple(dict.fromkeys(name for _, name in self._parts if name is not None))
+
+        if variables is not None:
+            unknown = set(self.fields) - set(variables)
+            if unknown:
+                raise ValueError("Unknown placeholders {} in {!r}".format(sorted(unknown), self.request))
+
+    def format(self, values: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> str:
+        """Renders the request from a mapping (e.g. the state) and keyword arguments."""
+        values = values or {}
+        try:
+            return "".join(
+                literal if name is None else literal + str(kwargs[name] if name in kwargs else values[name])
+                for literal, name in self._parts
+            )
+        except KeyError as e:
+            raise KeyError("Missing value for placeholder {{{}}}".format(e.args[0])) from None
+
+    def messages(self, values: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> List[BaseMessage]:
+        """Returns the system message with the instructions, and the human message with the request."""
+        return [SystemMessage(self.instructions), HumanMessage(self.format(values, **kwargs))]
@@ -0,0 +1,400 @@
+"""Process-wide rate limiting of model requests, shared by all graph runs.
+
+When many runs call the same model at once, they exceed its requests per
+minute (RPM) or tokens per minute (TPM) limits together. The provider then
+answers with 429 errors, and the client's retries make things worse.
+``RateLimiter`` keeps a pair of token buckets per model, and delays each
+request until both of them can pay for it:
+
+* Tokens are estimated from the request body, as the provider does: the
+  length of the prompt plus ``max_tokens``. OpenAI counts ``max_tokens``
+  even if the answer is shorter, so the estimate is not corrected with the
+  actual usage, only with the remaining tokens reported by the provider.
+* Waiting requests are served in order of priority, and then of arrival.
+  The priority comes from ``request_priority``, so batch runs can step
+  aside for interactive ones.
+* The limits adapt to the ``x-ratelimit-*`` headers of each response, and
+  a 429 response pauses all requests to that model until its
+  ``retry-after`` time. Until the first response arrives, only one request
+  is sent to each model, so that a burst of runs does not exceed limits
+  lower than the defaults.
+
+The limiter sits at the HTTP level, as a ``httpx`` transport wrapping the
+one that sends the requests, so it covers every call made by a model client
+(including the client's own retries).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelLimit:
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# OpenAI usage tier 1 limits, until the response headers tell the actual ones
+DEFAULT_LIMITS: Dict[str, ModelLimit] = {
+    "gpt-4o-mini": ModelLimit(500, 200_000),
+    "gpt-4o": ModelLimit(500, 30_000),
+    "gpt-4.1-nano": ModelLimit(500, 200_000),
+    "gpt-4.1-mini": ModelLimit(500, 200_000),
+    "gpt-4.1": ModelLimit(500, 30_000),
+}
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 10
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+# Paths of the requests that count against the limits
+LIMITED_PATHS = ("/chat/completions", "/embeddings", "/responses")
+
+
+@contextmanager
+def request_priority(priority: int) -> Iterator[None]:
+    """Sets the priority of the model requests made within the block (and the tasks it starts)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@dataclass
+class RateLimitStats:
+    requests: int = 0
+    # Requests that had to wait for their buckets
+    queued: int = 0
+    wait_seconds: float = 0.0
+    # 429 responses from the provider
+    throttled: int = 0
+    limit_updates: int = 0
+
+
+class TokenBucket:
+    """Bucket holding up to ``per_minute`` units, refilled at ``per_minute / 60`` units per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Requests larger than the whole bucket only wait for it to be full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def set_limit(self, per_minute: float, remaining: Optional[float], now: float) -> None:
+        self._refill(now)
+        self.capacity = per_minute
+        self.level = min(self.level, per_minute if remaining is None else remaining)
+
+
+class _LoopQueue:
+    """Requests to a model waiting in one event loop, with the task that lets them through."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self.wakeup = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+
+
+class _ModelState:
+    def __init__(self, limit: ModelLimit):
+        self.requests = TokenBucket(limit.requests_per_minute)
+        self.tokens = TokenBucket(limit.tokens_per_minute)
+        self.paused_until = 0.0
+        # Whether a response has told the actual limits, or the first request is still out
+        self.known = False
+        self.probing = False
+        # Futures and tasks belong to an event loop (e.g. each asyncio.run, or
+        # each thread running one), so each loop has its own queue
+        self.queues: Dict[asyncio.AbstractEventLoop, _LoopQueue] = {}
+
+    def queue(self, loop: asyncio.AbstractEventLoop) -> _LoopQueue:
+        if loop not in self.queues:
+            for closed in [other for other in self.queues if other.is_closed()]:
+                del self.queues[closed]
+            self.queues[loop] = _LoopQueue(loop)
+        return self.queues[loop]
+
+    def has_waiters(self) -> bool:
+        return any(q.waiters for q in self.queues.values() if not q.loop.is_closed())
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        if self.probing:
+            # Checked again when the first response arrives
+            return 1.0
+        return max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def take(self, tokens: float, now: float) -> None:
+        self.probing = not self.known
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parses durations such as ``1s``, ``20ms`` or ``6m0s`` from rate limit headers, in seconds."""
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def retry_delay(headers: httpx.Headers) -> Optional[float]:
+    """Returns the seconds to wait after a 429 response, according to its headers."""
+    if "retry-after-ms" in headers:
+        return float(headers["retry-after-ms"]) / 1000
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    resets = [parse_duration(headers.get(h, "")) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def estimate_tokens(body: Dict[str, Any]) -> int:
+    """Estimates the tokens counted against the TPM limit for a request body."""
+    text = json.dumps(body.get("messages") or body.get("input") or "") + json.dumps(body.get("tools") or "")
+    max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or body.get("max_output_tokens") or 0
+    # About 4 characters per token, as in langchain's count_tokens_approximately
+    return len(text) // 4 + max_tokens
+
+
+class RateLimiter:
+    """Delays model requests to stay within the RPM and TPM limits of each model.
+
+    Args:
+        limits (dict): Limits for each model name prefix (the longest
+            matching prefix is used).
+        default (ModelLimit): Limits for models without a matching prefix.
+        pause (float): Seconds to pause a model after a 429 response that
+            does not say how long to wait.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ModelLimit]] = None,
+        default: ModelLimit = ModelLimit(500, 200_000),
+        pause: float = 1.0,
+    ):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.default = default
+        self.pause = pause
+        self.stats = RateLimitStats()
+        self._lock = threading.Lock()
+        self._models: Dict[str, _ModelState] = {}
+        self._arrivals = itertools.count()
+
+    def _state(self, model: str) -> _ModelState:
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                prefixes = [p for p in self.limits if model.startswith(p)]
+                limit = self.limits[max(prefixes, key=len)] if prefixes else self.default
+                state = self._models[model] = _ModelState(limit)
+            return state
+
+    async def acquire(self, model: str, tokens: float, priority: Optional[int] = None) -> None:
+        """Waits until a request to ``model`` for ``tokens`` tokens fits in its limits."""
+        state = self._state(model)
+        self.stats.requests += 1
+        loop = asyncio.get_running_loop()
+        priority = _priority.get() if priority is None else priority
+        with self._lock:
+            if not state.has_waiters() and state.wait_time(tokens, time.monotonic()) <= 0:
+                state.take(tokens, time.monotonic())
+                return
+            queue = state.queue(loop)
+            future = loop.create_future()
+            heapq.heappush(queue.waiters, (priority, next(self._arrivals), tokens, future))
+        queue.wakeup.set()
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = loop.create_task(self._dispatch(state, queue))
+
+        self.stats.queued += 1
+        start = time.monotonic()
+        try:
+            await future
+        finally:
+            self.stats.wait_seconds += time.monotonic() - start
+
+    def acquire_blocking(self, model: str, tokens: float) -> None:
+        """
+        Waits in the current thread until a request fits in the limits.
+        Blocking requests are not queued by priority: they go ahead as
+        soon as the buckets allow it.
+        """
+        state = self._state(model)
+        self.stats.requests += 1
+        start = time.monotonic()
+        queued = False
+        while True:
+            with self._lock:
+                wait = state.wait_time(tokens, time.monotonic())
+                if wait <= 0:
+                    state.take(tokens, time.monotonic())
+                    break
+            queued = True
+            time.sleep(wait)
+        if queued:
+            self.stats.queued += 1
+            self.stats.wait_seconds += time.monotonic() - start
+
+    async def _dispatch(self, state: _ModelState, queue: _LoopQueue) -> None:
+        while True:
+            with self._lock:
+                # Skip the waiting requests that were cancelled
+                while queue.waiters and queue.waiters[0][3].done():
+                    heapq.heappop(queue.waiters)
+                if not queue.waiters:
+                    return
+                priority, arrival, tokens, future = queue.waiters[0]
+                now = time.monotonic()
+                wait = state.wait_time(tokens, now)
+                if wait <= 0:
+                    state.take(tokens, now)
+                    heapq.heappop(queue.waiters)
+            if wait <= 0:
+                future.set_result(None)
+                continue
+            # New arrivals may have a higher priority, and new limits may shorten the wait
+            queue.wakeup.clear()
+            try:
+                await asyncio.wait_for(queue.wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def observe(self, model: str, response: httpx.Response) -> None:
+        """Adapts the limits of ``model`` to the rate limit headers of a response."""
+        state = self._state(model)
+        headers = response.headers
+        now = time.monotonic()
+        raised = False
+        with self._lock:
+            for kind, bucket in (("requests", state.requests), ("tokens", state.tokens)):
+                limit = headers.get("x-ratelimit-limit-" + kind)
+                if limit is None:
+                    continue
+                remaining = headers.get("x-ratelimit-remaining-" + kind)
+                if float(limit) != bucket.capacity:
+                    self.stats.limit_updates += 1
+                    raised = raised or float(limit) > bucket.capacity
+                    logger.info("%s limit for %s is now %s per minute", kind.capitalize(), model, limit)
+                bucket.set_limit(float(limit), float(remaining) if remaining is not None else None, now)
+            if response.status_code == 429:
+                self.stats.throttled += 1
+                delay = retry_delay(headers)
+                state.paused_until = max(state.paused_until, now + (self.pause if delay is None else delay))
+                logger.info("Rate limited by the provider for %s, pausing it for %.2fs", model, state.paused_until - now)
+        if raised:
+            # Waiting requests may go ahead sooner with the new limits
+            self._wake(state)
+
+    def release(self, model: str) -> None:
+        """Records that a request to ``model`` has finished, successfully or not."""
+        state = self._state(model)
+        with self._lock:
+            probing, state.probing, state.known = state.probing, False, True
+        if probing:
+            self._wake(state)
+
+    def _wake(self, state: _ModelState) -> None:
+        with self._lock:
+            queues = list(state.queues.values())
+        for queue in queues:
+            if not queue.loop.is_closed():
+                queue.loop.call_soon_threadsafe(queue.wakeup.set)
+
+
+def _limited_request(request: httpx.Request) -> Optional[Tuple[str, int]]:
+    if request.method != "POST" or not request.url.path.endswith(LIMITED_PATHS):
+        return None
+    try:
+        body = json.loads(request.content)
+    except (httpx.RequestNotRead, ValueError):
+        return None
+    return body.get("model", ""), estimate_tokens(body)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Sends requests through ``transport`` once the limiter allows them."""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limited = _limited_request(request)
+        if limited is None:
+            return self.transport.handle_request(request)
+        model, tokens = limited
+        self.limiter.acquire_blocking(model, tokens)
+        try:
+            response = self.transport.handle_request(request)
+            self.limiter.observe(model, response)
+        finally:
+            self.limiter.release(model)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """Sends requests through ``transport`` once the limiter allows them."""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limited = _limited_request(request)
+        if limited is None:
+            return await self.transport.handle_async_request(request)
+        model, tokens = limited
+        await self.limiter.acquire(model, tokens)
+        try:
+            response = await self.transport.handle_async_request(request)
+            self.limiter.observe(model, response)
+        finally:
+            self.limiter.release(model)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# Shared by all models, as the provider limits apply to the whole organization
+rate_limiter = RateLimiter()
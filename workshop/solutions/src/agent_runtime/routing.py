@@ -0,0 +1,260 @@
+"""Routing of model calls by node, prompt size and difficulty.
+
+Extracting a few trip details does not need the same model as writing a
+program, but every node used to call ``model_name``. With ``routing``
+enabled in the context, ``Router.choose`` picks the model for each call from
+the ``routes`` of the context: the ``Route`` of the current node names a
+model, and optionally a larger model to upgrade to when the prompt is long
+or looks difficult (it mentions one of the ``hard_keywords``). Nodes without
+a route keep using ``model_name``. Routes given as JSON objects (e.g. in
+the context of a run sent to a LangGraph Server) are converted with
+``as_route``.
+
+``Router.run`` records the outcome of each routed call (latency, estimated
+tokens and cost, and whether it failed) per node and model, so the routes
+can be tuned from real runs. Setting ``ROUTING_OUTCOMES_FILE`` also appends
+each outcome to that JSONL file, which can be summarized with:
+
+    uv run python -m agent_runtime.routing routing_outcomes.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from langchain_core.messages import BaseMessage, HumanMessage, get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.config import get_config
+from pydantic import BaseModel
+
+from agent_runtime.hedging import percentile
+from agent_runtime.metrics import estimate_cost
+
+T = TypeVar("T")
+
+# Latencies kept per node and model for the percentiles, as a uniform sample of all calls
+LATENCY_SAMPLE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Route:
+    """Model choice for the calls made by a node.
+
+    Args:
+        model (str): Model for the calls of the node.
+        upgrade_to (str): Model for long or difficult prompts, if any.
+        max_prompt_tokens (int): Prompts with more (estimated) tokens than
+            this are sent to ``upgrade_to``.
+        hard_keywords: Prompts which mention any of these words (ignoring
+            case) are sent to ``upgrade_to``.
+    """
+
+    model: str
+    upgrade_to: Optional[str] = None
+    max_prompt_tokens: Optional[int] = None
+    hard_keywords: Tuple[str, ...] = ()
+
+
+def as_route(value: Any) -> Route:
+    """Returns a ``Route`` given as is, as a model name, or as a dict of its fields (as in JSON)."""
+    if isinstance(value, Route):
+        return value
+    if isinstance(value, str):
+        return Route(value)
+    fields = dict(value)
+    if "hard_keywords" in fields:
+        fields["hard_keywords"] = tuple(fields["hard_keywords"])
+    return Route(**fields)
+
+
+@dataclass(frozen=True)
+class Decision:
+    node: str
+    model: str
+    # Why the model was picked: "default", "route", "prompt_tokens", "keyword" or "candidate"
+    reason: str
+    prompt_tokens: int
+
+
+@dataclass
+class OutcomeStats:
+    calls: int = 0
+    failures: int = 0
+    # Calls sent to the upgrade model of the route
+    upgraded: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    # Reservoir sample of the call latencies, of at most LATENCY_SAMPLE_SIZE
+    seconds: List[float] = field(default_factory=list)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failure_rate": self.failures / self.calls if self.calls else 0.0,
+            "upgraded": self.upgraded,
+            "mean_prompt_tokens": self.prompt_tokens / self.calls if self.calls else 0.0,
+            "mean_output_tokens": self.output_tokens / self.calls if self.calls else 0.0,
+            "mean_cost": self.cost / self.calls if self.calls else 0.0,
+            "p50": percentile(self.seconds, 50),
+            "p90": percentile(self.seconds, 90),
+        }
+
+
+def current_node() -> str:
+    """Returns the name of the graph node being run, or ``"model"`` outside of a graph."""
+    try:
+        return get_config().get("metadata", {}).get("langgraph_node", "model")
+    except RuntimeError:
+        return "model"
+
+
+def _messages(prompt: Any) -> List[BaseMessage]:
+    if isinstance(prompt, str):
+        return [HumanMessage(prompt)]
+    return list(prompt)
+
+
+def output_tokens(result: Any) -> int:
+    """Returns the output tokens reported for a model answer, or an estimate from its size."""
+    if isinstance(result, dict) and "raw" in result:
+        # Answer of with_structured_output(..., include_raw=True)
+        result = result["raw"]
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("output_tokens", 0)
+    if isinstance(result, BaseModel):
+        return len(result.model_dump_json()) // 4
+    if isinstance(result, BaseMessage):
+        return count_tokens_approximately([result])
+    return 0
+
+
+class Router:
+    """Picks a model for each call from the routes in the context, and records how the calls went.
+
+    Args:
+        outcomes_file (str): JSONL file where each outcome is appended, if any.
+    """
+
+    def __init__(self, outcomes_file: Optional[str] = None):
+        self.outcomes_file = outcomes_file
+        self.stats: Dict[Tuple[str, str], OutcomeStats] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, context: Any, prompt: Any = None, node: Optional[str] = None) -> Decision:
+        """
+        Returns the model for a call of the current node.
+        Args:
+            context: The ``ContextSchema`` of the current run.
+            prompt: The prompt of the call, as a string or list of messages.
+            node (str): The node making the call, if not the current one.
+        """
+        node = node or current_node()
+        messages = _messages(prompt) if prompt is not None else []
+        tokens = count_tokens_approximately(messages) if messages else 0
+        route = context.routes.get(node) if context.routing else None
+        if route is None:
+            return Decision(node, context.model_name, "default", tokens)
+        if route.upgrade_to:
+            if route.max_prompt_tokens is not None and tokens > route.max_prompt_tokens:
+                return Decision(node, route.upgrade_to, "prompt_tokens", tokens)
+            text = get_buffer_string(messages).casefold()
+            if any(keyword.casefold() in text for keyword in route.hard_keywords):
+                return Decision(node, route.upgrade_to, "keyword", tokens)
+        return Decision(node, route.model, "route", tokens)
+
+    async def run(self, decision: Decision, call: Awaitable[T]) -> T:
+        """Awaits a model call made for ``decision``, recording its outcome."""
+        start = time.perf_counter()
+        try:
+            result = await call
+        except BaseException:
+            self.record(decision, time.perf_counter() - start, ok=False)
+            raise
+        self.record(decision, time.perf_counter() - start, ok=True, output_tokens=output_tokens(result))
+        return result
+
+    def record(self, decision: Decision, seconds: float, ok: bool, output_tokens: int = 0) -> None:
+        cost = estimate_cost(decision.model, decision.prompt_tokens, output_tokens)
+        with self._lock:
+            stats = self.stats.setdefault((decision.node, decision.model), OutcomeStats())
+            _add(stats, decision, seconds, ok, output_tokens, cost)
+            if self.outcomes_file:
+                with open(self.outcomes_file, "a") as f:
+                    f.write(json.dumps({
+                        "time": time.time(),
+                        "node": decision.node,
+                        "model": decision.model,
+                        "reason": decision.reason,
+                        "prompt_tokens": decision.prompt_tokens,
+                        "output_tokens": output_tokens,
+                        "cost": cost,
+                        "seconds": seconds,
+                        "ok": ok,
+                    }) + "\n")
+
+    def report(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Returns the outcomes of the calls of each node, by model."""
+        with self._lock:
+            return _report(self.stats)
+
+
+def _add(stats: OutcomeStats, decision: Decision, seconds: float, ok: bool, output_tokens: int,
+         cost: float) -> None:
+    stats.calls += 1
+    stats.failures += 0 if ok else 1
+    stats.upgraded += decision.reason in ("prompt_tokens", "keyword")
+    stats.prompt_tokens += decision.prompt_tokens
+    stats.output_tokens += output_tokens
+    stats.cost += cost
+    if len(stats.seconds) < LATENCY_SAMPLE_SIZE:
+        stats.seconds.append(seconds)
+    else:
+        # Each of the calls so far stays in the sample with the same probability
+        index = random.randrange(stats.calls)
+        if index < LATENCY_SAMPLE_SIZE:
+            stats.seconds[index] = seconds
+
+
+def _report(stats: Dict[Tuple[str, str], OutcomeStats]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    report: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (node, model), outcome in sorted(stats.items()):
+        report.setdefault(node, {})[model] = outcome.report()
+    return report
+
+
+def summarize(lines: Iterable[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Returns the outcomes by node and model from the lines of a ``ROUTING_OUTCOMES_FILE``."""
+    stats: Dict[Tuple[str, str], OutcomeStats] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        o = json.loads(line)
+        decision = Decision(o["node"], o["model"], o["reason"], o["prompt_tokens"])
+        _add(stats.setdefault((o["node"], o["model"]), OutcomeStats()),
+             decision, o["seconds"], o["ok"], o["output_tokens"], o["cost"])
+    return _report(stats)
+
+
+# Shared by all graphs, so their outcomes end up in the same report and file
+router = Router(outcomes_file=os.environ.get("ROUTING_OUTCOMES_FILE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarizes the outcomes of routed model calls.")
+    parser.add_argument("outcomes", help="JSONL file written through ROUTING_OUTCOMES_FILE")
+    args = parser.parse_args()
+    with open(args.outcomes) as f:
+        sys.stdout.write(json.dumps(summarize(f), indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Cache of compiled subgraphs shared across concurrent graph runs.
+
+Compiled LangGraph graphs hold no per-run state (that lives in the config
+and checkpointer passed to each invocation), so one compiled instance can
+safely serve any number of concurrent runs.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Hashable, Sequence, Tuple
+
+from langchain_core.tools import BaseTool
+from langgraph.pregel import Pregel
+
+
+def tool_set_key(tools: Sequence[BaseTool]) -> Tuple[Tuple[str, str], ...]:
+    """Return a hashable key identifying a set of tools by type and name."""
+    return tuple(sorted((type(t).__qualname__, t.name) for t in tools))
+
+
+class SubgraphCache:
+    """Thread-safe store of compiled subgraphs, built on first use."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._graphs: Dict[Hashable, Pregel] = {}
+
+    def get(self, key: Hashable, factory: Callable[[], Pregel]) -> Pregel:
+        """Return the subgraph for ``key``, compiling it with ``factory`` if needed."""
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                self.misses += 1
+                graph = self._graphs[key] = factory()
+            else:
+                self.hits += 1
+            return graph
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graphs.clear()
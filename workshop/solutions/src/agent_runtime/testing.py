@@ -0,0 +1,389 @@
+"""Offline stand-ins for chat models, search tools and the OpenAI Batch API.
+
+These allow running the graphs without OpenAI, Tavily or DuckDuckGo, e.g.
+from the scripts in the ``benchmarks`` folder. Their answers only depend
+on their settings and the messages they are given, so runs are repeatable.
+"""
+from __future__ import annotations
+
+import asyncio
+import email.parser
+import itertools
+import json
+import time
+import typing
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import BaseModel
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model for running graphs offline.
+
+    If ``tool_calls`` is set and the last message is not a tool result, the
+    model asks for those tool calls. Otherwise, it answers with ``reply``.
+
+    ``with_structured_output`` returns an instance of the schema, with the
+    values in ``structured`` for that schema's class name. Required fields
+    without a value get a default for their type (``reply`` for strings).
+
+    Answers take ``latency`` seconds until the first token, plus
+    ``token_latency`` seconds for each further token when streamed (or in
+    total, when not streamed). Their usage metadata reports
+    ``input_tokens`` and ``output_tokens``, or approximate counts if unset.
+    """
+
+    reply: str = "This is a canned answer."
+    tool_calls: List[Dict[str, Any]] = []
+    structured: Dict[str, Dict[str, Any]] = {}
+    latency: float = 0.0
+    token_latency: float = 0.0
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        return self
+
+    def with_structured_output(self, schema: Type[BaseModel], *, include_raw: bool = False,
+                               **kwargs: Any) -> Runnable:
+        if include_raw:
+            return self | RunnableLambda(
+                lambda raw: {"raw": raw, "parsed": self._structured_value(schema), "parsing_error": None})
+        return self | RunnableLambda(lambda _: self._structured_value(schema))
+
+    def _structured_value(self, schema: Type[BaseModel]) -> BaseModel:
+        values = dict(self.structured.get(schema.__name__, {}))
+        for name, field in schema.model_fields.items():
+            if name not in values and field.is_required():
+                values[name] = self._default_for(field.annotation)
+        return schema.model_validate(values)
+
+    def _default_for(self, annotation: Any) -> Any:
+        origin = typing.get_origin(annotation) or annotation
+        if isinstance(origin, type) and issubclass(origin, BaseModel):
+            return self._structured_value(origin).model_dump()
+        if origin in (list, tuple, set, Sequence):
+            return []
+        if origin is dict:
+            return {}
+        if origin is bool:
+            return False
+        if origin in (int, float):
+            return 0
+        if origin is str:
+            return self.reply
+        return None
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        if self.tool_calls and not isinstance(messages[-1], ToolMessage):
+            calls = [
+                {**call, "id": call.get("id", "call_{}".format(i))}
+                for i, call in enumerate(self.tool_calls)
+            ]
+            message = AIMessage(content="", tool_calls=calls)
+        else:
+            message = AIMessage(content=self.reply)
+        input_tokens = self.input_tokens if self.input_tokens is not None else count_tokens_approximately(messages)
+        output_tokens = self.output_tokens if self.output_tokens is not None else count_tokens_approximately([message])
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+    def _tokens(self, message: AIMessage) -> List[str]:
+        words = message.content.split(" ") if message.content else [""]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._message(messages)
+        delay = self.latency + self.token_latency * (len(self._tokens(message)) - 1)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._message(messages)
+        delay = self.latency + self.token_latency * (len(self._tokens(message)) - 1)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> List[ChatGenerationChunk]:
+        tokens = self._tokens(message)
+        chunks = [AIMessageChunk(content=token, id=message.id) for token in tokens]
+        # Tool calls and usage arrive with the last chunk, as with OpenAI
+        chunks[-1] = AIMessageChunk(
+            content=tokens[-1],
+            id=message.id,
+            tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ],
+            usage_metadata=message.usage_metadata,
+        )
+        return [ChatGenerationChunk(message=chunk) for chunk in chunks]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._chunks(self._message(messages))):
+            delay = self.latency if i == 0 else self.token_latency
+            if delay:
+                time.sleep(delay)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for i, chunk in enumerate(self._chunks(self._message(messages))):
+            delay = self.latency if i == 0 else self.token_latency
+            if delay:
+                await asyncio.sleep(delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class StubSearchTool(BaseTool):
+    """Stand-in for ``TavilySearch`` which returns canned results."""
+
+    name: str = "tavily_search"
+    description: str = "Searches the web for the given query."
+    results: str = "No relevant results were found."
+    latency: float = 0.0
+
+    def _run(self, query: str, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.results
+
+    async def _arun(self, query: str, **kwargs: Any) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.results
+
+
+def stub_mcp_tools(latency: float = 0.0) -> List[BaseTool]:
+    """
+    Returns stand-ins for the ``search`` and ``fetch_content`` tools of the
+    DuckDuckGo MCP server, as loaded by ``langchain-mcp-adapters`` (async
+    only, with a content and artifact response format).
+    Args:
+        latency (float): Seconds taken by each tool call.
+    """
+    async def search(query: str, max_results: int = 10):
+        await asyncio.sleep(latency)
+        return "\n".join(
+            "{}. Result for {}\n   URL: https://example.com/{}".format(i + 1, query, i)
+            for i in range(max_results)
+        ), None
+
+    async def fetch_content(url: str):
+        await asyncio.sleep(latency)
+        return "Content of {}".format(url), None
+
+    return [
+        StructuredTool.from_function(
+            coroutine=search,
+            name="search",
+            description="Search DuckDuckGo and return formatted results.",
+            response_format="content_and_artifact",
+        ),
+        StructuredTool.from_function(
+            coroutine=fetch_content,
+            name="fetch_content",
+            description="Fetch and parse content from a webpage URL.",
+            response_format="content_and_artifact",
+        ),
+    ]
+
+
+class FakeBatchServer:
+    """Serves the OpenAI file and batch endpoints used by ``agent_runtime.batch_api``.
+
+    Batches finish ``latency`` seconds after they are created. Each chat
+    completion in them answers with the values in ``structured`` for the
+    name of the requested JSON schema, defaulting to ``null`` for nullable
+    fields and to empty values (``reply`` for strings) for the rest.
+    Point the backend at it with ``OPENAI_BATCH_BASE_URL=<base_url>``.
+
+    Args:
+        latency (float): Seconds taken by each batch.
+        structured (dict): Field values for each schema name.
+        reply (str): Value of string fields without a value.
+        host (str): Interface to listen on.
+        port (int): Port to listen on, or 0 to pick a free one.
+    """
+
+    def __init__(self, latency: float = 0.5, structured: Optional[Dict[str, Dict[str, Any]]] = None,
+                 reply: str = "This is a canned answer.", host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.structured = structured or {}
+        self.reply = reply
+        self.host = host
+        self.port = port
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: List[asyncio.Task] = []
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    @property
+    def base_url(self) -> str:
+        return "http://{}:{}/v1".format(self.host, self.port)
+
+    async def start(self) -> "FakeBatchServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            # Closing idle keep-alive connections lets their handlers finish
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, content_type, payload = self._route(method, path.split("?")[0], headers, body)
+                writer.write(
+                    "HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n"
+                    .format(status, content_type, len(payload)).encode("latin-1") + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[str, str, bytes]:
+        parts = path.strip("/").split("/")[1:]
+        if method == "POST" and parts == ["files"]:
+            return self._json(self._upload(headers["content-type"], body))
+        if method == "GET" and len(parts) == 3 and parts[0] == "files" and parts[2] == "content":
+            if parts[1] in self.files:
+                return "200 OK", "application/octet-stream", self.files[parts[1]]
+        if method == "POST" and parts == ["batches"]:
+            return self._json(self._create_batch(json.loads(body)))
+        if method == "GET" and len(parts) == 2 and parts[0] == "batches" and parts[1] in self.batches:
+            return self._json(self.batches[parts[1]])
+        return "404 Not Found", "application/json", json.dumps({"error": {"message": "Not found"}}).encode()
+
+    def _json(self, value: Any) -> Tuple[str, str, bytes]:
+        return "200 OK", "application/json", json.dumps(value).encode("utf-8")
+
+    def _upload(self, content_type: str, body: bytes) -> Dict[str, Any]:
+        form = email.parser.BytesParser().parsebytes(
+            "Content-Type: {}\r\n\r\n".format(content_type).encode("latin-1") + body)
+        file_id = "file-{}".format(next(self._ids))
+        for part in form.get_payload():
+            if part.get_param("name", header="content-disposition") == "file":
+                self.files[file_id] = part.get_payload(decode=True)
+        return {"id": file_id, "object": "file", "bytes": len(self.files[file_id]),
+                "created_at": int(time.time()), "filename": "batch.jsonl", "purpose": "batch"}
+
+    def _create_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = "batch-{}".format(next(self._ids))
+        batch = self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+            "status": "in_progress", "created_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None,
+        }
+        self._tasks.append(asyncio.create_task(self._complete(batch)))
+        return batch
+
+    async def _complete(self, batch: Dict[str, Any]) -> None:
+        await asyncio.sleep(self.latency)
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": "response-{}".format(next(self._ids)),
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": self._completion(request["body"])},
+                "error": None,
+            }))
+        output_id = "file-{}".format(next(self._ids))
+        self.files[output_id] = "\n".join(lines).encode("utf-8")
+        batch.update(status="completed", output_file_id=output_id, completed_at=int(time.time()))
+
+    def _completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        schema = body["response_format"]["json_schema"]
+        values = dict(self.structured.get(schema["name"], {}))
+        for name, field in schema["schema"].get("properties", {}).items():
+            values.setdefault(name, self._default_for(field))
+        return {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(values)}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }
+
+    def _default_for(self, field: Dict[str, Any]) -> Any:
+        types = [f.get("type") for f in field.get("anyOf", [field])]
+        if "null" in types:
+            return None
+        return {"string": self.reply, "array": [], "object": {}, "boolean": False,
+                "integer": 0, "number": 0}.get(types[0])
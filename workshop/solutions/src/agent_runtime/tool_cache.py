@@ -0,0 +1,333 @@
+"""Content-addressed response cache for LangChain and MCP tools.
+
+Tool calls are keyed on a hash of the normalised tool name and arguments,
+so that e.g. two branches searching for the same city pair only hit the
+network once. Identical calls made while the first one is still running
+wait for its result instead of calling the tool again. Entries expire
+after a TTL, and the backends evict the least recently used entries once
+they reach their size bound.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+# Cached values are (value, expiry timestamp) pairs
+Entry = Tuple[Any, Optional[float]]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    # Misses answered by an identical call that was already running
+    shared: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[Entry]: ...
+
+    def set(self, key: str, value: Any, expires_at: Optional[float]) -> int:
+        """Store an entry, and return how many entries were evicted to make room."""
+        ...
+
+    def delete(self, key: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+    def __len__(self) -> int: ...
+
+
+class InMemoryCacheBackend:
+    """LRU cache held in a dictionary, bounded by number of entries."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, expires_at: Optional[float]) -> int:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """LRU cache persisted in a SQLite database, bounded by number of entries."""
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: Optional[float]) -> int:
+        blob = pickle.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, blob, expires_at, time.time()),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+            return evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def cache_key(tool_name: str, args: dict) -> str:
+    """Return the content address of a call to a tool."""
+    payload = json.dumps(
+        {"tool": tool_name.strip().lower(), "args": _normalize(args)},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def default_backend(env_var: str = "TOOL_CACHE_PATH") -> CacheBackend:
+    """Use SQLite if the given environment variable has a path, or memory otherwise."""
+    path = os.environ.get(env_var)
+    return SqliteCacheBackend(path) if path else InMemoryCacheBackend()
+
+
+class ToolCache:
+    """Caches the results of tool calls.
+
+    Args:
+        backend (CacheBackend): Where to keep the entries. Defaults to
+            ``default_backend()``.
+        ttl (float): Seconds before an entry expires, or ``None`` to keep
+            entries until they are evicted.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, ttl: Optional[float] = 3600):
+        self.backend = backend if backend is not None else default_backend()
+        self.ttl = ttl
+        self.stats = CacheStats()
+        # Calls running for each key, which can be awaited from any thread or event loop
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > time.time():
+                self.stats.hits += 1
+                return True, value
+            self.backend.delete(key)
+            self.stats.expirations += 1
+        self.stats.misses += 1
+        return False, None
+
+    def store(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self.stats.evictions += self.backend.set(key, value, expires_at)
+
+    def _join(self, key: str) -> Tuple[bool, Any, Optional[Future]]:
+        """
+        Return ``(True, value)`` on a hit. Otherwise, return the future of the
+        identical call already running, or claim the call for this caller
+        (with a new future in ``_inflight``, which it must ``_settle``).
+        """
+        with self._lock:
+            found, value = self.lookup(key)
+            if found:
+                return True, value, None
+            running = self._inflight.get(key)
+            if running is not None:
+                self.stats.shared += 1
+                return False, running, None
+            claimed = self._inflight[key] = Future()
+            return False, None, claimed
+
+    def _settle(self, key: str, future: Future, value: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is None:
+                self.store(key, value)
+            del self._inflight[key]
+        if error is None:
+            future.set_result(value)
+        elif isinstance(error, (CancelledError, asyncio.CancelledError)):
+            # Those waiting try again, rather than being cancelled with this caller
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+    def get_or_call(self, key: str, call: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, or the result of ``call()`` (stored for next time)."""
+        while True:
+            found, value, claimed = self._join(key)
+            if found:
+                return value
+            if claimed is None:
+                try:
+                    return value.result()
+                except CancelledError:
+                    continue
+            try:
+                value = call()
+            except BaseException as e:
+                self._settle(key, claimed, error=e)
+                raise
+            self._settle(key, claimed, value)
+            return value
+
+    async def aget_or_call(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Same as ``get_or_call``, awaiting the result of ``call()``."""
+        while True:
+            found, value, claimed = self._join(key)
+            if found:
+                return value
+            if claimed is None:
+                try:
+                    # Shielded, so cancelling this caller does not cancel the shared call
+                    return await asyncio.shield(asyncio.wrap_future(value))
+                except (CancelledError, asyncio.CancelledError):
+                    if value.cancelled():
+                        continue
+                    raise
+            try:
+                value = await call()
+            except BaseException as e:
+                self._settle(key, claimed, error=e)
+                raise
+            self._settle(key, claimed, value)
+            return value
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Return a tool with the same name and schema that goes through the cache.
+
+        The wrapped tool keeps both the content and the artifact of the
+        original tool's results (as MCP tools use artifacts). Failed calls
+        are not cached.
+        """
+        def as_tool_call(args: dict) -> dict:
+            return {"type": "tool_call", "name": tool.name, "args": args, "id": str(uuid.uuid4())}
+
+        def unpack(message: ToolMessage) -> Tuple[Any, Any]:
+            if message.status == "error":
+                raise ToolException(message.content)
+            return message.content, message.artifact
+
+        def call(config: RunnableConfig, **kwargs: Any) -> Tuple[Any, Any]:
+            return self.get_or_call(
+                cache_key(tool.name, kwargs),
+                lambda: unpack(tool.invoke(as_tool_call(kwargs), config)),
+            )
+
+        async def acall(config: RunnableConfig, **kwargs: Any) -> Tuple[Any, Any]:
+            async def invoke() -> Tuple[Any, Any]:
+                return unpack(await tool.ainvoke(as_tool_call(kwargs), config))
+
+            return await self.aget_or_call(cache_key(tool.name, kwargs), invoke)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            func=call,
+            coroutine=acall,
+            response_format="content_and_artifact",
+            handle_tool_error=True,
+        )
+
+
+# Shared by all graphs of a process, as threads often repeat the same searches and fetches
+tool_cache = ToolCache(ttl=60 * 60)
@@ -1 +1 @@
-__all__ = ["graph", "context", "state"]
+__all__ = ["graph", "candidates", "context", "refinement", "sandbox", "state"]
@@ -0,0 +1,78 @@
+"""Best-of-N selection with early exit, for generating programs in parallel.
+
+A single generation may fail its tests and need several rounds of repair,
+each one a sequential model call and sandbox run. ``first_passing`` starts N
+candidates at once instead (each of them, e.g., a generation followed by
+its test run), returns the first one that passes, and cancels the others,
+so the extra tokens are bounded by the generations still in flight. If no
+candidate passes, the one with the best score is returned.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class SelectionStats:
+    candidates: int = 0
+    finished: int = 0
+    failed: int = 0
+    # Candidates cancelled after another one passed
+    cancelled: int = 0
+    # Index of the returned candidate, in order of creation
+    winner: Optional[int] = None
+    seconds: float = 0.0
+
+
+async def first_passing(
+    candidates: Sequence[Awaitable[T]],
+    passed: Callable[[T], bool],
+    score: Callable[[T], float],
+) -> Tuple[T, SelectionStats]:
+    """
+    Runs the candidates concurrently, and returns the first one that passes.
+    Candidates that raise an exception are logged and left out. Raises the
+    last exception if every candidate raised one.
+    Args:
+        candidates: Awaitables that produce each candidate.
+        passed: Whether a candidate is good enough to stop the others.
+        score: Ranks the candidates if none of them passes (higher is better).
+    """
+    stats = SelectionStats(candidates=len(candidates))
+    start = time.perf_counter()
+    tasks = {asyncio.ensure_future(c): i for i, c in enumerate(candidates)}
+    best: Optional[Tuple[float, int, T]] = None
+    error: Optional[BaseException] = None
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    stats.failed += 1
+                    logger.warning("Candidate %d failed: %r", tasks[task], error)
+                    continue
+                stats.finished += 1
+                result = task.result()
+                if passed(result):
+                    stats.winner = tasks[task]
+                    stats.cancelled = len(pending)
+                    return result, stats
+                if best is None or score(result) > best[0]:
+                    best = (score(result), tasks[task], result)
+        if best is None:
+            assert error is not None
+            raise error
+        stats.winner = best[1]
+        return best[2], stats
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats.seconds = time.perf_counter() - start
@@ -1,5 +1,10 @@
-from dataclasses import dataclass
-from typing import Literal, TypedDict
+from dataclasses import dataclass, field
+from typing import Dict, Literal, Tuple, TypedDict
+
+from agent_runtime.routing import Route, as_route
+
+# Specifications mentioning these are sent to the larger model, if routing is enabled
+HARD_KEYWORDS = ("concurren", "thread", "async", "parser", "grammar", "regular expression", "optimi")
 
 @dataclass
 class ContextSchema:
@@ -7,3 +12,39 @@ class ContextSchema:
         'gpt-4o',
         'gpt-4o-mini'
     ] = 'gpt-4o-mini'
+    # Ask for structured outputs through the Batch API, for offline runs
+    batch_api: bool = False
+    # Send a second request when a call to the model is slower than usual
+    hedging: bool = False
+    # Models to hedge with, and to fall back to when a call fails or times out
+    fallback_models: Tuple[str, ...] = ()
+    # Refine the test suite through edits to its test cases, instead of regenerating it
+    incremental_refinement: bool = False
+    # Run Python programs against their tests in tdd.sandbox, and repair them if they fail
+    execute_tests: bool = False
+    # Repairs tried after the first run, before giving up
+    max_repair_attempts: int = 3
+    # Programs generated at once when running the tests, keeping the first one that passes
+    program_candidates: int = 1
+    # Models and temperatures of the candidates, cycled through (by default, the
+    # model of generate_program and its default temperature)
+    candidate_models: Tuple[str, ...] = ()
+    candidate_temperatures: Tuple[float, ...] = ()
+    # Pick the model of each call from the routes of its node, instead of always using model_name
+    routing: bool = False
+    routes: Dict[str, Route] = field(default_factory=lambda: {
+        "get_program_spec": Route("gpt-4o-mini"),
+        "generate_tests": Route("gpt-4o-mini", upgrade_to="gpt-4o", max_prompt_tokens=1500,
+                                hard_keywords=HARD_KEYWORDS),
+        "test_refinement": Route("gpt-4o-mini", upgrade_to="gpt-4o", max_prompt_tokens=3000,
+                                 hard_keywords=HARD_KEYWORDS),
+        # Programs that fail their tests cost repairs, so they come from the larger model
+        "generate_program": Route("gpt-4o"),
+        "generate_test_code": Route("gpt-4o-mini"),
+        "repair_program": Route("gpt-4o-mini", upgrade_to="gpt-4o", max_prompt_tokens=3000,
+                                hard_keywords=HARD_KEYWORDS),
+    })
+
+    def __post_init__(self):
+        # Routes in the JSON context of a run arrive as dicts
+        self.routes = {node: as_route(route) for node, route in self.routes.items()}
@@ -1,18 +1,53 @@
-from typing import Literal, cast
+import asyncio
+import dataclasses
+import logging
+from typing import Any, Dict, List, Literal, cast
 from langgraph.graph import StateGraph, START, END, MessagesState
 from langgraph.runtime import get_runtime
 from langgraph.types import Command, interrupt
-from langchain.chat_models import init_chat_model
 from langchain_core.messages import AIMessage
 from pydantic import BaseModel
 
+from agent_runtime.batch_api import batch_api
+from agent_runtime.hedging import node_model
+from agent_runtime.llm_cache import default_structured_output_cache
+from agent_runtime.metrics import instrument
+from agent_runtime.models import model_registry
+from agent_runtime.prompts import PromptTemplate
+from agent_runtime.routing import Decision, router
+from tdd.candidates import first_passing
+from tdd.refinement import TestSuiteEdits, apply_edits, number_test_cases, render_test_cases
+from tdd.sandbox import describe_failures, sandbox_pool
 from tdd.state import State
 from tdd.context import ContextSchema
 
+logger = logging.getLogger(__name__)
 
-def get_chat_model():
+
+def get_node_model(model_name: str):
+    """
+    Returns the chat model for the current node, hedging its calls and
+    falling back to other models as configured in the context.
+    Args:
+        model_name (str): The model picked by the router for the call.
+    """
+    return node_model(model_registry, get_runtime(context_schema=ContextSchema).context, model_name)
+
+
+structured_output_cache = default_structured_output_cache()
+
+
+async def invoke_structured(schema, prompt):
+    """
+    Asks the model routed for the current node and prompt for structured
+    output, reusing any cached answer to the same prompt.
+    """
     runtime = get_runtime(context_schema=ContextSchema)
-    return init_chat_model(runtime.context.model_name)
+    decision = router.choose(runtime.context, prompt)
+    return await router.run(decision, structured_output_cache.ainvoke(
+        get_node_model(decision.model), schema, prompt, decision.model,
+        batch=batch_api if runtime.context.batch_api else None,
+    ))
 
 
 class ProgramSpecification(BaseModel):
@@ -20,7 +55,7 @@ class ProgramSpecification(BaseModel):
     program_specification: str
 
 class TestSuite(BaseModel):
-    test_suite: str
+    test_cases: List[str]
     summary: str
 
 class ProgramCode(BaseModel):
@@ -28,83 +63,202 @@ class ProgramCode(BaseModel):
     programming_language: str
     explanation: str
 
+class TestCode(BaseModel):
+    code: str
 
-PROMPT_GET_SPEC = """"
-You are a software developer with knowledge of test-driven development.
-
-Your customer has sent you this request for a program:
-
-<request>
-{request}
-</request>
-
-Extract the desired programming language and the program specification.
-"""
-
-PROMPT_GENERATE_TESTS = """
-You are a software developer with knowledge of test-driven development.
-
-You have been given this specification for a program:
-
-<specification>
-{spec}
-</specification>
-
-Produce a list of test cases in natural language (English). There
-should be tests for success scenarios (with expected inputs and outputs),
-and tests for failure scenarios (with expected errors).
-"""
-
-PROMPT_REFINE_TESTS = """
-You are a software developer with knowledge of test-driven development.
-
-You have been given this specification for a program:
-
-<specification>
-{spec}
-</specification>
 
-You have designed the following test suite:
+# Placeholders allowed in the templates that are filled from the state
+STATE_KEYS = tuple(State.__annotations__)
 
-<test_suite>
-{test_suite}
-</test_suite>
+PROMPT_GET_SPEC = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
 
-Your testing lead has provided the following feedback:
+    Your customer will send you a request for a program. Extract the desired
+    programming language and the program specification.
+    """,
+    request="""
+    <request>
+    {request}
+    </request>
+    """,
+    variables=("request",),
+)
 
-<feedback>
-{feedback}
-</feedback>
+PROMPT_GENERATE_TESTS = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program. Produce a list of
+    test cases in natural language (English). There should be tests for
+    success scenarios (with expected inputs and outputs), and tests for
+    failure scenarios (with expected errors).
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+    """,
+    variables=STATE_KEYS,
+)
 
-Revise your test suite based on the above feedback.
-"""
+PROMPT_REFINE_TESTS = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program, the test suite you
+    have designed for it, and feedback from your testing lead. Revise your
+    test suite based on the feedback.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <test_suite>
+    {test_suite}
+    </test_suite>
+
+    <feedback>
+    {feedback}
+    </feedback>
+    """,
+    variables=STATE_KEYS + ("feedback",),
+)
 
-PROMPT_GENERATE_PROGRAM = """"
-You are a software developer with knowledge of test-driven development.
+PROMPT_EDIT_TESTS = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program, the test suite you
+    have designed for it (with the id of each test case in brackets), and
+    feedback from your testing lead. Revise your test suite based on the
+    feedback, answering only with the edits it needs: test cases to add,
+    and test cases to remove or modify by their id. Do not include the test
+    cases that do not change.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <test_suite>
+    {test_suite}
+    </test_suite>
+
+    <feedback>
+    {feedback}
+    </feedback>
+    """,
+    variables=STATE_KEYS + ("feedback",),
+)
 
-You have been given this specification for a program:
+PROMPT_GENERATE_PROGRAM = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program, the test suite you
+    have designed for it, and the programming language to use. Write the
+    code for the program that can pass the tests.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <test_suite>
+    {test_suite}
+    </test_suite>
+
+    Write the program in {programming_language}.
+    """,
+    variables=STATE_KEYS,
+)
 
-<specification>
-{spec}
-</specification>
+PROMPT_GENERATE_PROGRAM_FOR_TESTS = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program, and the Python
+    unittest module that tests it, where the program is imported as the
+    module "program". Write the Python code for the program, so that it
+    passes the tests.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <tests>
+    {test_code}
+    </tests>
+    """,
+    variables=STATE_KEYS,
+)
 
-You have designed the following test suite:
+PROMPT_GENERATE_TEST_CODE = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program and its test suite in
+    natural language (with the id of each test case in brackets). The program
+    has not been written yet: it will be written in Python afterwards, so that
+    it passes your tests. Write a Python unittest module with one test method
+    per test case, named after the id of the test case (for example,
+    test_T1_adds_two_numbers for test case T1). Import the program as the
+    module "program", and name its functions and classes after the concepts
+    in the specification. Only use the Python standard library.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <test_suite>
+    {test_suite}
+    </test_suite>
+    """,
+    variables=STATE_KEYS,
+)
 
-<test_suite>
-{test_suite}
-</test_suite>
+PROMPT_REPAIR_PROGRAM = PromptTemplate(
+    instructions="""
+    You are a software developer with knowledge of test-driven development.
+
+    You will be given the specification for a program, its Python code, the
+    unittest module it was tested with, and the errors and failed tests of
+    that run. Fix the program so that it passes the tests, keeping the same
+    public interface. If a test contradicts the specification, follow the
+    specification.
+    """,
+    request="""
+    <specification>
+    {spec}
+    </specification>
+
+    <program>
+    {program}
+    </program>
+
+    <tests>
+    {test_code}
+    </tests>
+
+    <failures>
+    {failures}
+    </failures>
+    """,
+    variables=STATE_KEYS + ("failures",),
+)
 
-Write the {programming_language} code for the program
-that can pass the above tests.
-"""
+# Results of a sandbox run that a new version of the program may fix
+REPAIRABLE_STATUSES = ("failed", "program_error", "timeout")
 
 
 async def get_program_spec(state: State) -> State:
-    model = get_chat_model()
-    model_with_output = model.with_structured_output(ProgramSpecification)
-    prompt = PROMPT_GET_SPEC.format(request=state['messages'][0].content)
+    prompt = PROMPT_GET_SPEC.messages(request=state['messages'][0].content)
 
-    response = await model_with_output.ainvoke(prompt)
+    response = await invoke_structured(ProgramSpecification, prompt)
     prog_spec = cast(ProgramSpecification, response)
     return {
         "programming_language": prog_spec.programming_language,
@@ -120,14 +274,15 @@ def is_spec_complete(state: State) -> bool:
 
 
 async def generate_tests(state: State) -> State:
-    model = get_chat_model()
-    model_with_output = model.with_structured_output(TestSuite)
-    prompt = PROMPT_GENERATE_TESTS.format(**state)
-    response = await model_with_output.ainvoke(prompt)
+    prompt = PROMPT_GENERATE_TESTS.messages(state)
+    response = await invoke_structured(TestSuite, prompt)
     new_ts = cast(TestSuite, response)
+    test_cases = number_test_cases(new_ts.test_cases)
+    test_suite = render_test_cases(test_cases)
     return {
-        "test_suite": new_ts.test_suite,
-        "messages": [AIMessage(content=new_ts.test_suite)]
+        "test_cases": test_cases,
+        "test_suite": test_suite,
+        "messages": [AIMessage(content=test_suite)]
     }
 
 
@@ -140,36 +295,70 @@ async def ask_for_spec(state: State) -> State:
     return { "messages": [AIMessage(content=message)] }
 
 
-async def test_refinement(state: State) -> Command[Literal["test_refinement", "generate_program"]]:
+async def test_refinement(state: State) -> Command[Literal["test_refinement", "generate_test_code", "generate_program"]]:
     feedback = interrupt({
         "question": "If you are happy with the above tests, enter an empty string. Otherwise, provide feedback:"
     })
 
-    if feedback:
-        model = get_chat_model()
-        model_with_output = model.with_structured_output(TestSuite)
-        prompt = PROMPT_REFINE_TESTS.format(
-            feedback=feedback, **state
-        )
-        response = await model_with_output.ainvoke(prompt)
-        new_test_suite = cast(TestSuite, response)
-        return Command(
-            goto="test_refinement",
-            update={
-                "test_suite": new_test_suite.test_suite,
-                "messages": [AIMessage(content=new_test_suite.test_suite)]
-            }
-        )
+    if not feedback:
+        # Programs that will be run are written for the test code, so it goes first
+        return Command(goto="generate_test_code" if should_execute(state) else "generate_program")
+
+    context = get_runtime(context_schema=ContextSchema).context
+    if context.incremental_refinement:
+        schema, prompt = TestSuiteEdits, PROMPT_EDIT_TESTS.messages(state, feedback=feedback)
+    else:
+        schema, prompt = TestSuite, PROMPT_REFINE_TESTS.messages(state, feedback=feedback)
+    decision = router.choose(context, prompt)
+    # With the raw answer, to report the tokens used by the round
+    model_with_output = get_node_model(decision.model).with_structured_output(schema, include_raw=True)
+    response = await router.run(decision, model_with_output.ainvoke(prompt))
+    if response["parsed"] is None:
+        raise response["parsing_error"] or ValueError("The model did not answer with a {}".format(schema.__name__))
+
+    if context.incremental_refinement:
+        edits = cast(TestSuiteEdits, response["parsed"])
+        test_cases, changes = apply_edits(state.get("test_cases", []), edits.edits)
+        content = "\n".join(changes or ["The test suite has not changed."])
     else:
-        return Command(goto="generate_program")
+        new_test_suite = cast(TestSuite, response["parsed"])
+        test_cases = number_test_cases(new_test_suite.test_cases)
+        content = render_test_cases(test_cases)
+
+    usage = response["raw"].usage_metadata or {}
+    refinement_round = {
+        "round": len(state.get("refinement_rounds", [])) + 1,
+        "mode": "incremental" if context.incremental_refinement else "full",
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "test_cases": len(test_cases),
+    }
+    logger.info("Test refinement round %(round)d (%(mode)s): %(input_tokens)d input tokens, "
+                "%(output_tokens)d output tokens", refinement_round)
+    test_suite = render_test_cases(test_cases)
+    return Command(
+        goto="test_refinement",
+        update={
+            "test_cases": test_cases,
+            "test_suite": test_suite,
+            "refinement_rounds": [refinement_round],
+            "messages": [AIMessage(content=content)]
+        }
+    )
 
 
 async def generate_program(state: State) -> State:
-    model = get_chat_model()
-    model_with_output = model.with_structured_output(ProgramCode)
-    prompt = PROMPT_GENERATE_PROGRAM.format(**state)
+    context = get_runtime(context_schema=ContextSchema).context
+    if state.get("test_code"):
+        prompt = PROMPT_GENERATE_PROGRAM_FOR_TESTS.messages(state)
+    else:
+        prompt = PROMPT_GENERATE_PROGRAM.messages(state)
+    decision = router.choose(context, prompt)
+    if state.get("test_code") and context.program_candidates > 1:
+        return await generate_candidates(state, context, prompt, decision)
 
-    output = await model_with_output.ainvoke(prompt)
+    model_with_output = get_node_model(decision.model).with_structured_output(ProgramCode)
+    output = await router.run(decision, model_with_output.ainvoke(prompt))
     code = cast(ProgramCode, output)
     return {
         "program": code.code,
@@ -178,14 +367,150 @@ async def generate_program(state: State) -> State:
     }
 
 
-graph = (
+async def generate_candidates(state: State, context: ContextSchema, prompt, decision: Decision) -> State:
+    """
+    Generates ``program_candidates`` programs at once, cycling through the
+    candidate models and temperatures, and runs each one against the tests
+    as soon as it is ready. Keeps the first program that passes, or the one
+    that passes the most tests if none of them does.
+    """
+    models = context.candidate_models or (decision.model,)
+    temperatures = context.candidate_temperatures or (None,)
+
+    async def candidate(i: int) -> Dict[str, Any]:
+        model_name, temperature = models[i % len(models)], temperatures[i % len(temperatures)]
+        model = model_registry.get_model(model_name)
+        if temperature is not None and "temperature" in type(model).model_fields:
+            # A shallow copy, which shares the HTTP clients of the registry's model
+            model = model.model_copy(update={"temperature": temperature})
+        output = await router.run(
+            dataclasses.replace(decision, model=model_name, reason="candidate"),
+            model.with_structured_output(ProgramCode).ainvoke(prompt),
+        )
+        code = cast(ProgramCode, output)
+        result = await sandbox_pool.arun(code.code, state["test_code"])
+        return {"code": code, "result": result, "model": model_name, "temperature": temperature}
+
+    best, stats = await first_passing(
+        [candidate(i) for i in range(context.program_candidates)],
+        passed=lambda c: c["result"]["status"] == "passed",
+        score=lambda c: sum(1 for t in c["result"]["tests"] if t["outcome"] == "passed"),
+    )
+    code, result = best["code"], best["result"]
+    attempt = {
+        **attempt_summary(state, result),
+        "seconds": stats.seconds,
+        "candidates": stats.candidates,
+        "evaluated": stats.finished,
+        "cancelled": stats.cancelled,
+        "winner": stats.winner,
+        "model": best["model"],
+        "temperature": best["temperature"],
+    }
+    logger.info("Candidate %(winner)d of %(candidates)d (%(model)s): %(status)s, with %(evaluated)d evaluated "
+                "and %(cancelled)d cancelled in %(seconds).3fs", attempt)
+    return {
+        "program": code.code,
+        "programming_language": code.programming_language,
+        "execution": result,
+        "attempts": [attempt],
+        "messages": [AIMessage(content=code.explanation), attempt_message(attempt, result)]
+    }
+
+
+def should_execute(state: State) -> bool:
+    context = get_runtime(context_schema=ContextSchema).context
+    return context.execute_tests and state.get("programming_language", "").strip().lower() == "python"
+
+
+async def generate_test_code(state: State) -> State:
+    # The sandbox workers start while the model writes the tests
+    warm_up = asyncio.create_task(asyncio.to_thread(sandbox_pool.start))
+    try:
+        response = await invoke_structured(TestCode, PROMPT_GENERATE_TEST_CODE.messages(state))
+    except BaseException:
+        # Any workers already starting in the thread are kept, and the pool starts the rest when needed
+        warm_up.cancel()
+        raise
+    await warm_up
+    return {"test_code": cast(TestCode, response).code}
+
+
+def attempt_summary(state: State, result: Dict[str, Any]) -> Dict[str, Any]:
+    tests = result["tests"]
+    return {
+        "attempt": len(state.get("attempts", [])) + 1,
+        "status": result["status"],
+        "passed": sum(1 for t in tests if t["outcome"] == "passed"),
+        "failed": sum(1 for t in tests if t["outcome"] in ("failed", "error")),
+        "seconds": result["seconds"],
+        "run_seconds": result.get("run_seconds"),
+    }
+
+
+def attempt_message(attempt: Dict[str, Any], result: Dict[str, Any]) -> AIMessage:
+    return AIMessage(content="Attempt {attempt}: {passed} of {total} tests passed ({status}).".format(
+        total=len(result["tests"]), **attempt))
+
+
+async def execute_program(state: State) -> State:
+    result = await sandbox_pool.arun(state["program"], state["test_code"])
+    attempt = attempt_summary(state, result)
+    logger.info("Attempt %(attempt)d: %(status)s, %(passed)d passed and %(failed)d failed "
+                "in %(seconds).3fs", attempt)
+    return {
+        "execution": result,
+        "attempts": [attempt],
+        "messages": [attempt_message(attempt, result)]
+    }
+
+
+def should_repair(state: State) -> bool:
+    context = get_runtime(context_schema=ContextSchema).context
+    repairs = len(state["attempts"]) - 1
+    return state["execution"]["status"] in REPAIRABLE_STATUSES and repairs < context.max_repair_attempts
+
+
+def after_program(state: State) -> str:
+    if not state.get("test_code"):
+        return END
+    if get_runtime(context_schema=ContextSchema).context.program_candidates > 1:
+        # The candidates were already run against the tests
+        return "repair_program" if should_repair(state) else END
+    return "execute_program"
+
+
+async def repair_program(state: State) -> State:
+    prompt = PROMPT_REPAIR_PROGRAM.messages(state, failures=describe_failures(state["execution"]))
+    decision = router.choose(get_runtime(context_schema=ContextSchema).context, prompt)
+    model_with_output = get_node_model(decision.model).with_structured_output(ProgramCode)
+
+    output = await router.run(decision, model_with_output.ainvoke(prompt))
+    code = cast(ProgramCode, output)
+    return {
+        "program": code.code,
+        "messages": [AIMessage(content=code.explanation)]
+    }
+
+
+graph = instrument(
     StateGraph(State, input_schema=MessagesState, context_schema=ContextSchema)
     .add_node(get_program_spec)
     .add_node(generate_tests)
     .add_node(ask_for_spec)
     .add_node(test_refinement)
     .add_node(generate_program)
+    .add_node(generate_test_code)
+    .add_node(execute_program)
+    .add_node(repair_program)
     .add_edge(START, "get_program_spec")
     .add_conditional_edges("get_program_spec", is_spec_complete, {False: "ask_for_spec", True: "generate_tests"})
     .add_edge("generate_tests", "test_refinement")
+    .add_edge("generate_test_code", "generate_program")
+    .add_conditional_edges("generate_program", after_program, ["execute_program", "repair_program", END])
+    .add_conditional_edges("execute_program", should_repair, {True: "repair_program", False: END})
+    .add_edge("repair_program", "execute_program")
+    .compile(name="TDD")
 )
+
+model_registry.warm_up(ContextSchema)
@@ -0,0 +1,79 @@
+"""Incremental refinement of a test suite through structured edits.
+
+Asking the model for a whole new test suite on every round of feedback
+makes each round slower and more expensive as the suite grows, even if
+the feedback only touches one test case. In incremental mode, the model
+answers with ``TestSuiteEdits`` instead: test cases to add, and test cases
+to remove or modify by their id. The edits are applied locally by
+``apply_edits``, and only the changes are sent back to the user.
+"""
+import logging
+from typing import List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from tdd.state import TestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestCaseEdit(BaseModel):
+    action: Literal["add", "remove", "modify"]
+    id: Optional[str] = Field(default=None, description="Id of the test case to remove or modify")
+    description: Optional[str] = Field(default=None, description="New text of the added or modified test case")
+
+
+class TestSuiteEdits(BaseModel):
+    edits: List[TestCaseEdit]
+    summary: str
+
+
+def number_test_cases(descriptions: Sequence[str]) -> List[TestCase]:
+    """Gives ids ``T1``, ``T2``... to the test cases of a new suite."""
+    return [{"id": "T{}".format(i), "description": d} for i, d in enumerate(descriptions, start=1)]
+
+
+def render_test_cases(test_cases: Sequence[TestCase]) -> str:
+    return "\n".join("[{}] {}".format(case["id"], case["description"]) for case in test_cases)
+
+
+def _next_id(test_cases: Sequence[TestCase]) -> int:
+    numbers = [int(case["id"][1:]) for case in test_cases if case["id"][1:].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def apply_edits(test_cases: Sequence[TestCase], edits: Sequence[TestCaseEdit]) -> Tuple[List[TestCase], List[str]]:
+    """
+    Applies the edits to a list of test cases, keeping their order. New test
+    cases get fresh ids, so removed ids are never reused. Edits that refer
+    to unknown ids or have no description are skipped.
+    Returns the new list of test cases, and a description of each change.
+    Args:
+        test_cases: The current test cases.
+        edits: The edits proposed by the model, in order.
+    """
+    cases = [TestCase(**case) for case in test_cases]
+    by_id = {case["id"]: case for case in cases}
+    next_id = _next_id(test_cases)
+    changes: List[str] = []
+    for edit in edits:
+        if edit.action == "add":
+            if not edit.description:
+                logger.warning("Skipping test case addition without a description")
+                continue
+            case = TestCase(id="T{}".format(next_id), description=edit.description)
+            next_id += 1
+            cases.append(case)
+            by_id[case["id"]] = case
+            changes.append("Added [{id}] {description}".format(**case))
+        elif edit.id not in by_id:
+            logger.warning("Skipping %s of unknown test case %r", edit.action, edit.id)
+        elif edit.action == "remove":
+            cases.remove(by_id.pop(edit.id))
+            changes.append("Removed [{}]".format(edit.id))
+        elif edit.description:
+            by_id[edit.id]["description"] = edit.description
+            changes.append("Modified [{}] {}".format(edit.id, edit.description))
+        else:
+            logger.warning("Skipping modification of test case %r without a description", edit.id)
+    return cases, changes
@@ -0,0 +1,306 @@
+"""Pool of warm, resource-limited subprocesses that run generated programs against their tests.
+
+Starting a Python interpreter for every attempt of the repair loop costs
+tens of milliseconds before any test runs. ``SandboxPool`` starts its
+workers ahead of time (see ``tdd.sandbox_worker``), and each worker forks a
+fresh child from its warm interpreter for every attempt, so the programs
+of different attempts cannot see each other.
+
+Workers run with ``python -I``, a minimal environment, limits on memory,
+file size and open files, and no network (through a network namespace
+where the kernel allows it, or by disabling sockets in Python otherwise).
+Each attempt is limited in CPU and wall-clock time, and a worker that stops
+answering is killed and replaced, as is the worker of an attempt started
+with ``arun`` that gets cancelled (the thread waiting for it cannot be).
+These limits keep mistakes in generated code from hurting the host, but
+they are not meant to contain hostile code.
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+@dataclass
+class SandboxLimits:
+    memory_mb: int = 512
+    file_size_mb: int = 16
+    open_files: int = 64
+    # Seconds of CPU and wall-clock time for each attempt
+    timeout: float = 10.0
+
+
+@dataclass
+class SandboxStats:
+    workers_started: int = 0
+    # Workers killed because they stopped answering or exited
+    workers_replaced: int = 0
+    runs: int = 0
+    timeouts: int = 0
+    # Runs cancelled through arun, whose worker was killed
+    cancelled: int = 0
+    # Seconds that runs waited for an idle worker
+    wait_seconds: float = 0.0
+
+
+class SandboxError(RuntimeError):
+    """Raised when a worker cannot be started or stops answering."""
+
+
+class _Worker:
+    def __init__(self, limits: SandboxLimits, startup_timeout: float):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_PATH, json.dumps(asdict(limits))],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env={"PATH": os.defpath, "LANG": "C.UTF-8"},
+            text=True,
+            start_new_session=True,
+        )
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.process.stdout, selectors.EVENT_READ)
+        ready = self._read(startup_timeout)
+        self.network_isolated = ready["network_isolated"]
+
+    def _read(self, timeout: float) -> Dict[str, Any]:
+        if not self._selector.select(timeout):
+            raise SandboxError("Sandbox worker did not answer in {}s".format(timeout))
+        line = self.process.stdout.readline()
+        if not line:
+            raise SandboxError("Sandbox worker exited with status {}".format(self.process.wait()))
+        return json.loads(line)
+
+    def run(self, job: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        return self._read(timeout)
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            try:
+                # With any attempt still running, which is in the worker's session
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def close(self) -> None:
+        self._selector.close()
+        self.kill()
+        self.process.wait()
+
+
+class _Cancellation:
+    """Lets ``arun`` kill the worker of an attempt running in another thread."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.worker: Optional[_Worker] = None
+        self._lock = threading.Lock()
+
+    def attach(self, worker: _Worker) -> bool:
+        """Records the worker of the attempt, unless it was already cancelled."""
+        with self._lock:
+            self.worker = worker
+            return not self.cancelled
+
+    def detach(self) -> bool:
+        """Forgets the worker of the finished attempt, returning whether it was cancelled."""
+        with self._lock:
+            self.worker = None
+            return self.cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            worker = self.worker
+        if worker is not None:
+            # The worker stops answering, and run() replaces it
+            worker.kill()
+
+
+class SandboxPool:
+    """Runs programs against ``unittest`` modules in a pool of warm sandbox workers.
+
+    Args:
+        size (int): Number of workers, i.e. attempts that can run at once.
+        limits (SandboxLimits): Resource limits of the workers and attempts.
+        startup_timeout (float): Seconds to wait for a new worker to be ready.
+    """
+
+    def __init__(self, size: int = 4, limits: SandboxLimits = SandboxLimits(), startup_timeout: float = 10.0):
+        self.size = size
+        self.limits = limits
+        self.startup_timeout = startup_timeout
+        self.stats = SandboxStats()
+        self.network_isolated: Optional[bool] = None
+        self._idle: queue.Queue[Optional[_Worker]] = queue.Queue()
+        self._workers: List[_Worker] = []
+        # Workers being started, which count towards size
+        self._starting = 0
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> _Worker:
+        """Starts a worker, in a slot reserved by ``_reserve`` or ``start``."""
+        try:
+            worker = _Worker(self.limits, self.startup_timeout)
+        except BaseException:
+            with self._lock:
+                self._starting -= 1
+            raise
+        with self._lock:
+            self._starting -= 1
+            self._workers.append(worker)
+            self.stats.workers_started += 1
+            if self.network_isolated is None:
+                self.network_isolated = worker.network_isolated
+                if not worker.network_isolated:
+                    logger.warning("No network namespace for the sandbox: disabling sockets in Python instead")
+        return worker
+
+    def _reserve(self) -> bool:
+        """Reserves room for a new worker, if the pool is below ``size``."""
+        with self._lock:
+            if len(self._workers) + self._starting >= self.size:
+                return False
+            self._starting += 1
+            return True
+
+    def start(self) -> None:
+        """Starts the missing workers in parallel, so that the first attempts do not wait for them."""
+        with self._lock:
+            missing = max(self.size - len(self._workers) - self._starting, 0)
+            self._starting += missing
+        if not missing:
+            return
+        with ThreadPoolExecutor(missing) as executor:
+            for worker in executor.map(lambda _: self._spawn(), range(missing)):
+                self._idle.put(worker)
+
+    def _checkout(self) -> _Worker:
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = None
+        if worker is not None:
+            return worker
+        if self._reserve():
+            return self._spawn()
+        start = time.perf_counter()
+        # None is put by _discard, for the room it made for a new worker
+        while worker is None and not self._reserve():
+            worker = self._idle.get()
+        with self._lock:
+            self.stats.wait_seconds += time.perf_counter() - start
+        return worker if worker is not None else self._spawn()
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.close()
+        with self._lock:
+            self._workers.remove(worker)
+            self.stats.workers_replaced += 1
+        self._idle.put(None)
+
+    def run(self, program: str, tests: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Runs the tests of a program in a sandbox worker, blocking until they finish.
+        Returns a dict with the ``status`` of the attempt (``passed``,
+        ``failed``, ``program_error``, ``test_error``, ``timeout`` or
+        ``crashed``), the outcome of each test in ``tests``, any ``error``
+        and captured ``output``, and its ``seconds`` (including any wait for
+        a worker) and ``run_seconds`` (in the worker).
+        Args:
+            program (str): Python source of the program, importable by the tests as ``program``.
+            tests (str): Python source of a ``unittest`` module.
+            timeout (float): Seconds for the attempt, if not ``limits.timeout``.
+        """
+        return self._run(program, tests, timeout, None)
+
+    def _run(self, program: str, tests: str, timeout: Optional[float],
+             cancellation: Optional[_Cancellation]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        timeout = timeout or self.limits.timeout
+        worker = self._checkout()
+        if cancellation is not None and not cancellation.attach(worker):
+            self._idle.put(worker)
+            return {"status": "cancelled", "tests": [], "seconds": time.perf_counter() - start}
+        try:
+            # The worker kills the attempt after the timeout, and we give up on the worker a bit later
+            result = worker.run({"program": program, "tests": tests, "timeout": timeout}, timeout + 5)
+        except (SandboxError, OSError, ValueError) as e:
+            if cancellation is not None and cancellation.cancelled:
+                logger.debug("Replacing the sandbox worker of a cancelled attempt")
+            else:
+                logger.warning("Replacing sandbox worker: %s", e)
+            self._discard(worker)
+            result = {"status": "crashed", "error": str(e)}
+        else:
+            if cancellation is not None and cancellation.detach():
+                # Cancelled as the attempt finished: the worker may have been killed already
+                self._discard(worker)
+            else:
+                self._idle.put(worker)
+
+        result.setdefault("tests", [])
+        result["seconds"] = time.perf_counter() - start
+        with self._lock:
+            self.stats.runs += 1
+            self.stats.timeouts += result["status"] == "timeout"
+        return result
+
+    async def arun(self, program: str, tests: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Same as ``run``, from a thread so the event loop is not blocked. If
+        cancelled, the worker running the attempt is killed and replaced,
+        instead of staying busy until the attempt finishes.
+        """
+        cancellation = _Cancellation()
+        try:
+            return await asyncio.to_thread(self._run, program, tests, timeout, cancellation)
+        except asyncio.CancelledError:
+            cancellation.cancel()
+            with self._lock:
+                self.stats.cancelled += 1
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+        self._idle = queue.Queue()
+
+
+def describe_failures(result: Dict[str, Any]) -> str:
+    """Returns the errors and failed tests of the result of ``SandboxPool.run``, for a prompt."""
+    parts = []
+    if result.get("error"):
+        parts.append("{}: {}".format(result["status"], result["error"]))
+    for test in result["tests"]:
+        if test["outcome"] in ("failed", "error"):
+            parts.append("{} {}:\n{}".format(test["test"], test["outcome"], test["message"]))
+    if result.get("output"):
+        parts.append("Output of the program:\n{}".format(result["output"]))
+    return "\n\n".join(parts)
+
+
+# Shared by all runs of the tdd graph, and started on first use
+sandbox_pool = SandboxPool()
+atexit.register(sandbox_pool.close)
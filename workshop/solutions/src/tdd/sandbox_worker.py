@@ -0,0 +1,267 @@
+"""Worker process of ``tdd.sandbox.SandboxPool``, run as a script.
+
+On startup, the worker applies its resource limits, moves into a network
+namespace of its own (falling back to disabling sockets in Python if the
+kernel does not allow it), and says it is ready. It then reads one JSON job
+per line from stdin: a program and a ``unittest`` module to test it. Each
+job runs in a child forked from this warm interpreter, inside a temporary
+directory, with a CPU and wall-clock time limit. The worker answers each
+job with one JSON line on stdout, with the outcome of every test.
+
+Only the standard library is used, as the worker runs with ``python -I``.
+"""
+import ctypes
+import json
+import math
+import os
+import re
+import resource
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+import types
+import unittest
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+# Characters of output and tracebacks sent back for each job and test
+MAX_TEXT = 4000
+
+TEST_CASE_ID = re.compile(r"^test_(T\d+)")
+
+
+def isolate_network() -> bool:
+    """Moves into an empty network namespace, returning whether it was possible."""
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(CLONE_NEWNET) == 0:
+        return True
+    uid, gid = os.getuid(), os.getgid()
+    if libc.unshare(CLONE_NEWUSER | CLONE_NEWNET) != 0:
+        return False
+    # Keep our own user and group inside the new user namespace, so files can still be created
+    try:
+        with open("/proc/self/setgroups", "w") as f:
+            f.write("deny")
+        with open("/proc/self/uid_map", "w") as f:
+            f.write("{0} {0} 1".format(uid))
+        with open("/proc/self/gid_map", "w") as f:
+            f.write("{0} {0} 1".format(gid))
+    except OSError:
+        pass
+    return True
+
+
+def disable_sockets() -> None:
+    """Makes any attempt to open a socket from Python fail. This is not a security boundary."""
+    def blocked(*args, **kwargs):
+        raise PermissionError("Network access is disabled in the sandbox")
+
+    class BlockedSocket(socket.socket):
+        def __init__(self, *args, **kwargs):
+            blocked()
+
+    socket.socket = BlockedSocket
+    socket.create_connection = blocked
+    socket.getaddrinfo = blocked
+
+
+def set_limit(limit: int, value: int) -> None:
+    try:
+        resource.setrlimit(limit, (value, value))
+    except (ValueError, OSError):
+        # e.g. a hard limit that is already lower
+        pass
+
+
+def truncate(text: str) -> str:
+    return text if len(text) <= MAX_TEXT else "..." + text[-MAX_TEXT:]
+
+
+class _Result(unittest.TestResult):
+    def __init__(self):
+        super().__init__()
+        self.tests = []
+
+    def _add(self, test, outcome, message=""):
+        name = getattr(test, "_testMethodName", test.id())
+        match = TEST_CASE_ID.match(name)
+        self.tests.append({
+            "test": test.id(),
+            "test_case": match.group(1) if match else None,
+            "outcome": outcome,
+            "message": truncate(message),
+        })
+
+    def addSuccess(self, test):
+        self._add(test, "passed")
+
+    def addFailure(self, test, err):
+        self._add(test, "failed", self._exc_info_to_string(err, test))
+
+    def addError(self, test, err):
+        self._add(test, "error", self._exc_info_to_string(err, test))
+
+    def addSkip(self, test, reason):
+        self._add(test, "skipped", reason)
+
+    def addExpectedFailure(self, test, err):
+        self._add(test, "passed")
+
+    def addUnexpectedSuccess(self, test):
+        self._add(test, "failed", "Unexpected success")
+
+
+def load_module(name: str, source: str) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__file__ = name + ".py"
+    sys.modules[name] = module
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+def run_tests(job: dict) -> dict:
+    """Runs in the forked child: loads the program and its tests, and runs them."""
+    try:
+        load_module("program", job["program"])
+    except BaseException:
+        return {"status": "program_error", "error": truncate(traceback.format_exc())}
+    try:
+        tests = load_module("test_program", job["tests"])
+        suite = unittest.defaultTestLoader.loadTestsFromModule(tests)
+    except ImportError as e:
+        # The tests expect a name that the program does not define
+        status = "program_error" if e.name == "program" else "test_error"
+        return {"status": status, "error": truncate(traceback.format_exc())}
+    except BaseException:
+        return {"status": "test_error", "error": truncate(traceback.format_exc())}
+    result = _Result()
+    suite.run(result)
+    if result.errors and any(isinstance(t, unittest.loader._FailedTest) for t, _ in result.errors):
+        return {"status": "test_error", "error": truncate(result.errors[0][1]), "tests": result.tests}
+    passed = all(t["outcome"] in ("passed", "skipped") for t in result.tests)
+    return {"status": "passed" if passed and result.tests else "failed", "tests": result.tests}
+
+
+def child(job: dict, workdir: str, write_fd: int) -> None:
+    # In a process group of its own, so that any processes it starts are killed with it
+    os.setpgid(0, 0)
+    pid = os.getpid()
+    timeout = math.ceil(job["timeout"])
+    set_limit(resource.RLIMIT_CPU, timeout)
+    # No further processes, to stop fork bombs (not enforced for root)
+    set_limit(resource.RLIMIT_NPROC, 0)
+    signal.alarm(timeout)
+    os.chdir(workdir)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    output = os.open("output.txt", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.dup2(output, 1)
+    os.dup2(output, 2)
+    try:
+        result = run_tests(job)
+    except BaseException:
+        result = {"status": "crashed", "error": truncate(traceback.format_exc())}
+    if os.getpid() != pid:
+        # A process forked by the program: only the child itself reports
+        os._exit(0)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open("output.txt", errors="replace") as f:
+        result["output"] = truncate(f.read())
+    data = json.dumps(result).encode()
+    while data:
+        data = data[os.write(write_fd, data):]
+
+
+def kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def collect(pid: int, read_fd: int):
+    """
+    Reads the result of the child until it exits, and then kills the
+    processes it left behind, which could otherwise keep the pipe open.
+    Returns the result and the exit status of the child.
+    """
+    chunks = []
+    status = None
+    while True:
+        ready, _, _ = select.select([read_fd], [], [], 0.05)
+        if ready:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        elif status is not None:
+            break
+        if status is None:
+            done, child_status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                status = child_status
+                kill_group(pid)
+    if status is None:
+        _, status = os.waitpid(pid, 0)
+    kill_group(pid)
+    return b"".join(chunks), status
+
+
+def run_job(job: dict) -> dict:
+    start = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            child(job, workdir, write_fd)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    data, status = collect(pid, read_fd)
+    os.close(read_fd)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if data:
+        try:
+            result = json.loads(data)
+        except ValueError:
+            result = {"status": "crashed", "error": "The test process sent an invalid result"}
+    elif os.WIFSIGNALED(status) and os.WTERMSIG(status) in (signal.SIGALRM, signal.SIGXCPU, signal.SIGKILL):
+        result = {"status": "timeout", "error": "The tests did not finish in {}s".format(job["timeout"])}
+    else:
+        result = {"status": "crashed", "error": "The test process ended with status {}".format(status)}
+    result["run_seconds"] = time.perf_counter() - start
+    return result
+
+
+def answer(line: str) -> None:
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def main() -> None:
+    limits = json.loads(sys.argv[1])
+    set_limit(resource.RLIMIT_AS, limits["memory_mb"] * 1024 * 1024)
+    set_limit(resource.RLIMIT_FSIZE, limits["file_size_mb"] * 1024 * 1024)
+    set_limit(resource.RLIMIT_NOFILE, limits["open_files"])
+    isolated = isolate_network()
+    if not isolated:
+        disable_sockets()
+
+    answer(json.dumps({"ready": True, "network_isolated": isolated}))
+    for line in sys.stdin:
+        answer(json.dumps(run_job(json.loads(line))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-
-from typing import Annotated
+import operator
+from typing import Annotated, Any, Dict, List, TypedDict
 from langgraph.graph import MessagesState
 
 
@@ -7,8 +7,24 @@ def prefer_new(old_value, new_value):
     return new_value or old_value
 
 
+class TestCase(TypedDict):
+    id: str
+    description: str
+
+
 class State(MessagesState):
     spec: Annotated[str, prefer_new]
+    # Rendered from test_cases, for the prompts that take the whole suite
     test_suite: Annotated[str, prefer_new]
+    # Replaced as a whole, as refinement may remove every test case
+    test_cases: List[TestCase]
+    # Token usage of each round of test refinement
+    refinement_rounds: Annotated[List[Dict[str, Any]], operator.add]
     program: Annotated[str, prefer_new]
     programming_language: Annotated[str, prefer_new]
+    # Executable unittest module written from test_cases
+    test_code: Annotated[str, prefer_new]
+    # Result of the last run of the program in the sandbox, with the outcome of each test
+    execution: Dict[str, Any]
+    # Status, test counts and timing of each run of the program in the sandbox
+    attempts: Annotated[List[Dict[str, Any]], operator.add]
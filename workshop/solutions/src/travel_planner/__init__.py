@@ -1 +1 @@
-__all__ = ["graph", "context", "state"]
+__all__ = ["graph", "batch", "context", "speculation", "state", "streaming"]
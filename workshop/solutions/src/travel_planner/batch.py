@@ -0,0 +1,283 @@
+"""Batch runs of the travel planner over a queue of trip requests.
+
+Running ``graph.ainvoke`` on each request repeats the same research and
+summary for every request about the same trip. Instead, ``plan_batch``
+works in two phases, built from the same nodes as the interactive graph:
+
+1. ``identify_destination`` extracts the trip details of each request.
+2. Requests are grouped by their normalized departure and destination, and
+   the research branches and summary report run once per group. The report
+   is then written out for every request in the group.
+
+With ``--batch-api``, the extraction calls are all sent together through
+the OpenAI Batch API (see ``agent_runtime.batch_api``), which is cheaper
+but may take hours to answer. The submitted batches are recorded next to
+the results, so a resumed run waits for them instead of submitting them
+again.
+
+There is no user to ask for missing details or to approve them, so
+requests with missing details are written out as ``incomplete`` with the
+question the planner would have asked. Results are appended to a JSONL
+file as they are ready: running the batch again skips the requests that
+already have a result, so an interrupted batch can be resumed. The trip
+details of each request are also written out as an ``extracted`` record
+as soon as they are known, so a resumed batch only researches them. Run it
+from the ``solutions`` folder with:
+
+    uv run python -m travel_planner.batch requests.jsonl results.jsonl
+
+The queue can be a JSONL file with one ``{"id": ..., "query": ...}`` object
+per line, or a CSV file with ``id`` and ``query`` columns.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import unicodedata
+from dataclasses import asdict, dataclass
+from typing import IO, Any, Dict, Iterator, List, Set, Tuple
+
+from langgraph.constants import END, START
+from langgraph.graph import MessagesState, StateGraph
+
+from agent_runtime.batch_api import batch_api
+from agent_runtime.metrics import instrument
+from agent_runtime.rate_limits import BATCH, request_priority
+from travel_planner.context import ContextSchema
+from travel_planner.graph import (
+    TRIP_INSTRUCTIONS_TEMPLATE,
+    TRIP_THINGS_TO_DO_TEMPLATE,
+    ask_for_details,
+    destination_identified,
+    identify_destination,
+    subgraph_for_prompt_template,
+    summary_report,
+)
+from travel_planner.state import State, details_known
+
+logger = logging.getLogger(__name__)
+
+TRIP_FIELDS = ("departure_city", "departure_country", "destination_city", "destination_country")
+
+# Results with these statuses are not retried when the batch is resumed
+DONE_STATUSES = ("planned", "incomplete")
+
+
+@dataclass
+class BatchStats:
+    requests: int = 0
+    # Requests with a result from a previous run of the batch
+    skipped: int = 0
+    # Requests whose trip details were extracted in this run, or in a previous one
+    extracted: int = 0
+    resumed_extractions: int = 0
+    incomplete: int = 0
+    # Distinct trips that were researched, each shared by one or more requests
+    trips: int = 0
+    planned: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+extraction_graph = instrument(
+    StateGraph(State, input_schema=MessagesState, context_schema=ContextSchema)
+    .add_node(identify_destination)
+    .add_node(ask_for_details)
+    .add_edge(START, "identify_destination")
+    .add_conditional_edges("identify_destination", details_known, {False: "ask_for_details", True: END})
+    .add_edge("ask_for_details", END)
+    .compile(name="Travel Planner (batch extraction)")
+)
+
+research_graph = instrument(
+    StateGraph(State, context_schema=ContextSchema)
+    .add_node(destination_identified)
+    .add_node("find_travel_instructions", subgraph_for_prompt_template("instructions", TRIP_INSTRUCTIONS_TEMPLATE))
+    .add_node("find_things_to_do", subgraph_for_prompt_template("suggestions", TRIP_THINGS_TO_DO_TEMPLATE))
+    .add_node(summary_report)
+    .add_edge(START, "destination_identified")
+    .add_edge("destination_identified", "find_travel_instructions")
+    .add_edge("destination_identified", "find_things_to_do")
+    .add_edge("find_travel_instructions", "summary_report")
+    .add_edge("find_things_to_do", "summary_report")
+    .compile(name="Travel Planner (batch research)")
+)
+
+
+def normalize(value: str) -> str:
+    """Normalize a place name for grouping, ignoring case, accents and extra whitespace."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def trip_key(details: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(normalize(details[field]) for field in TRIP_FIELDS)
+
+
+def read_requests(path: str) -> Iterator[Dict[str, str]]:
+    """
+    Reads trip requests from a JSONL or CSV file (by extension). Requests
+    without an ``id`` are identified by their position in the file.
+    Args:
+        path (str): The path to the queue of requests.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows: Iterator[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for i, row in enumerate(rows):
+            yield {"id": str(row.get("id") or i), "query": row["query"]}
+
+
+def read_results(path: str) -> Iterator[Dict[str, Any]]:
+    """Reads the records of ``path``, if it exists, in the order they were written."""
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a batch that was killed while writing
+                continue
+
+
+def read_done(path: str) -> Set[str]:
+    """Returns the IDs of the requests that already have a result in ``path``."""
+    return {result["id"] for result in read_results(path) if result.get("status") in DONE_STATUSES}
+
+
+def read_extracted(path: str) -> Dict[str, Dict[str, Any]]:
+    """Returns the trip details already extracted for each request ID in ``path``."""
+    return {
+        result["id"]: {field: result[field] for field in TRIP_FIELDS if result.get(field)}
+        for result in read_results(path) if result.get("status") == "extracted"
+    }
+
+
+class _ResultWriter:
+    def __init__(self, f: IO[str], stats: BatchStats):
+        self.f = f
+        self.stats = stats
+
+    def write(self, request: Dict[str, str], status: str, **fields: Any) -> None:
+        self.f.write(json.dumps({**request, "status": status, **fields}) + "\n")
+        # Flushed on each result, so they are kept if the batch is interrupted
+        self.f.flush()
+        setattr(self.stats, status, getattr(self.stats, status) + 1)
+
+
+async def plan_batch(
+    requests: List[Dict[str, str]],
+    output: str,
+    context: ContextSchema = ContextSchema(),
+    concurrency: int = 8,
+) -> BatchStats:
+    """
+    Plans the trips for a list of requests, appending a JSON object for
+    each of them to ``output``. Requests which already have a result there
+    are skipped.
+    Args:
+        requests: Dicts with the ``id`` and ``query`` of each request.
+        output (str): Path to the JSONL file with the results.
+        context (ContextSchema): Context for the model calls.
+        concurrency (int): Maximum number of graph runs at once, in each phase.
+    """
+    start = time.perf_counter()
+    stats = BatchStats(requests=len(requests))
+    done = read_done(output)
+    extracted = read_extracted(output)
+    pending = [r for r in requests if r["id"] not in done]
+    stats.skipped = len(requests) - len(pending)
+    to_extract = [r for r in pending if r["id"] not in extracted]
+    semaphore = asyncio.Semaphore(concurrency)
+    # Through the Batch API, all the extractions are submitted together instead
+    extraction_semaphore = asyncio.Semaphore(len(to_extract) or 1) if context.batch_api else semaphore
+
+    # Interactive runs in the same process go first when the rate limits are reached
+    with open(output, "a") as f, request_priority(BATCH):
+        writer = _ResultWriter(f, stats)
+        groups: Dict[Tuple[str, ...], List[Tuple[Dict[str, str], Dict[str, Any]]]] = {}
+
+        async def extract(request: Dict[str, str]) -> None:
+            async with extraction_semaphore:
+                try:
+                    state = await extraction_graph.ainvoke(
+                        {"messages": [("user", request["query"])]}, context=context)
+                except Exception as e:
+                    logger.exception("Could not extract the trip details of request %s", request["id"])
+                    writer.write(request, "failed", error=repr(e))
+                    return
+            details = {field: state[field] for field in TRIP_FIELDS if state.get(field)}
+            if not details_known(state):
+                writer.write(request, "incomplete", question=state["messages"][-1].content, **details)
+            else:
+                writer.write(request, "extracted", **details)
+                groups.setdefault(trip_key(details), []).append((request, details))
+
+        async def research(members: List[Tuple[Dict[str, str], Dict[str, Any]]]) -> None:
+            # The details as written by the first request, which may differ in case from the rest
+            details = members[0][1]
+            async with semaphore:
+                try:
+                    state = await research_graph.ainvoke(details, context=context)
+                except Exception as e:
+                    logger.exception("Could not plan the trip for %d requests", len(members))
+                    for request, request_details in members:
+                        writer.write(request, "failed", error=repr(e), **request_details)
+                    return
+            for request, request_details in members:
+                writer.write(
+                    request, "planned",
+                    report=state["messages"][-1].content,
+                    instructions=state["instructions"],
+                    suggestions=state["suggestions"],
+                    **request_details,
+                )
+
+        for request in pending:
+            if request["id"] in extracted:
+                details = extracted[request["id"]]
+                groups.setdefault(trip_key(details), []).append((request, details))
+                stats.resumed_extractions += 1
+        await asyncio.gather(*(extract(r) for r in to_extract))
+        stats.trips = len(groups)
+        logger.info("Researching %d distinct trips for %d requests", len(groups),
+                    sum(len(m) for m in groups.values()))
+        await asyncio.gather(*(research(members) for members in groups.values()))
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plans the trips for a queue of requests.")
+    parser.add_argument("requests", help="JSONL or CSV file with the id and query of each request")
+    parser.add_argument("output", help="JSONL file where results are appended")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model", default=ContextSchema.model_name, help="model name, as in ContextSchema")
+    parser.add_argument("--batch-api", action="store_true", help="extract the trip details through the Batch API")
+    parser.add_argument("--batch-journal", help="JSONL file recording the submitted batches, to reattach to them "
+                                                "when resuming (defaults to the output path + .batches)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.batch_api:
+        batch_api.journal_path = args.batch_journal or batch_api.journal_path or args.output + ".batches"
+
+    stats = asyncio.run(plan_batch(
+        list(read_requests(args.requests)), args.output,
+        context=ContextSchema(model_name=args.model, batch_api=args.batch_api), concurrency=args.concurrency,
+    ))
+    sys.stdout.write(json.dumps(asdict(stats), indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
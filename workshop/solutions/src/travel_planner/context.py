@@ -1,5 +1,7 @@
-from dataclasses import dataclass
-from typing import Literal, TypedDict
+from dataclasses import dataclass, field
+from typing import Dict, Literal, Tuple, TypedDict
+
+from agent_runtime.routing import Route, as_route
 
 @dataclass
 class ContextSchema:
@@ -7,3 +9,22 @@ class ContextSchema:
         'gpt-4o',
         'gpt-4o-mini'
     ] = 'gpt-4o-mini'
+    # Start the research while waiting for the user to confirm the trip details
+    speculative_research: bool = False
+    # Ask for structured outputs through the Batch API, for offline runs
+    batch_api: bool = False
+    # Send a second request when a call to the model is slower than usual
+    hedging: bool = False
+    # Models to hedge with, and to fall back to when a call fails or times out
+    fallback_models: Tuple[str, ...] = ()
+    # Pick the model of each call from the routes of its node, instead of always using model_name
+    routing: bool = False
+    routes: Dict[str, Route] = field(default_factory=lambda: {
+        "identify_destination": Route("gpt-4o-mini"),
+        # Long research results need the larger model to be summarized faithfully
+        "summary_report": Route("gpt-4o-mini", upgrade_to="gpt-4o", max_prompt_tokens=3000),
+    })
+
+    def __post_init__(self):
+        # Routes in the JSON context of a run arrive as dicts
+        self.routes = {node: as_route(route) for node, route in self.routes.items()}
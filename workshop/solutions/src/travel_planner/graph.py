@@ -1,17 +1,29 @@
 from __future__ import annotations
 
-from typing import Any, Dict, cast, Optional, Callable, Literal
+from functools import cache, partial
+from typing import Any, Dict, Tuple, cast, Optional, Callable, Literal
 
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, message_chunk_to_message
+from langchain_core.tools import BaseTool
 from langchain_tavily import TavilySearch
+from langgraph.config import get_config, get_stream_writer
 from langgraph.constants import START, END
 from langgraph.prebuilt import create_react_agent
 from langgraph.types import Command, interrupt
 from pydantic import BaseModel
 
+from agent_runtime.batch_api import batch_api
+from agent_runtime.hedging import node_model
+from agent_runtime.llm_cache import default_structured_output_cache
+from agent_runtime.metrics import instrument
+from agent_runtime.models import model_registry
+from agent_runtime.prompts import PromptTemplate
+from agent_runtime.routing import router
+from agent_runtime.subgraphs import SubgraphCache, tool_set_key
+from agent_runtime.tool_cache import ToolCache
 from travel_planner.context import ContextSchema
+from travel_planner.speculation import SpeculativeResearch
 from travel_planner.state import State, details_known
-from langchain.chat_models import init_chat_model
 
 from langgraph.graph import StateGraph, MessagesState
 from langgraph.runtime import get_runtime
@@ -24,19 +36,26 @@ class TripDetails(BaseModel):
     destination_country: Optional[str] = None
 
 
-TRIP_DETAILS_TEMPLATE = """
-You are a travel planner, and you are trying to find out from the user
-where they are departing from, and where they want to go.
+# Placeholders allowed in the templates that are filled from the state
+STATE_KEYS = tuple(State.__annotations__)
 
-This is their current query:
+TRIP_DETAILS_TEMPLATE = PromptTemplate(
+    instructions="""
+    You are a travel planner, and you are trying to find out from the user
+    where they are departing from, and where they want to go.
 
-<query>
-{query}
-</query>
+    Respond with their intended travel details. If they have missed a particular
+    detail, do not try to fill it in yourself.
+    """,
+    request="""
+    This is their current query:
 
-Respond with their intended travel details. If they have missed a particular
-detail, do not try to fill it in yourself.
-"""
+    <query>
+    {query}
+    </query>
+    """,
+    variables=("query",),
+)
 
 TRIP_DETAILS_UPDATE_TEMPLATE = """
 Thank you for the new information. Your trip details are:
@@ -48,58 +67,141 @@ I will search the internet to find you some instructions on how
 to get there, and things you can do once you arrive.
 """
 
-TRIP_INSTRUCTIONS_TEMPLATE = """
-You are a travel agent. Your customer has told you they want to go
-from {departure_city} (in {departure_country}) to {destination_city}
-(in {destination_country}). Please give them some recommendations on
-how to travel, balancing cost, travel time. You can search on the
-internet to find options if you like.
-"""
+TRIP_REQUEST = """
+    Your customer wants to go from {departure_city} (in {departure_country})
+    to {destination_city} (in {destination_country}).
+    """
 
-TRIP_THINGS_TO_DO_TEMPLATE = """
-You are a travel agent. Your customer has told you they want to go
-from {departure_city} from {departure_city} (in {departure_country})
-to {destination_city} (in {destination_country}). Please suggest
-things to do, things to see, and places to have a meal in the area.
-You can search on the internet to find options if you like.
-"""
+TRIP_INSTRUCTIONS_TEMPLATE = PromptTemplate(
+    instructions="""
+    You are a travel agent. You will be told where your customer wants to
+    go from and to. Please give them some recommendations on how to travel,
+    balancing cost, travel time. You can search on the internet to find
+    options if you like.
+    """,
+    request=TRIP_REQUEST,
+    variables=STATE_KEYS,
+)
 
-TRIP_SUMMARY_TEMPLATE = """
-You are a travel agent. Your customer has told you they want to go
-from {departure_city} from {departure_city} (in {departure_country})
-to {destination_city} (in {destination_country}).
+TRIP_THINGS_TO_DO_TEMPLATE = PromptTemplate(
+    instructions="""
+    You are a travel agent. You will be told where your customer wants to
+    go from and to. Please suggest things to do, things to see, and places
+    to have a meal in the area. You can search on the internet to find
+    options if you like.
+    """,
+    request=TRIP_REQUEST,
+    variables=STATE_KEYS,
+)
 
-You have checked how to get there, and have seen these options:
+TRIP_SUMMARY_TEMPLATE = PromptTemplate(
+    instructions="""
+    You are a travel agent. You will be told where your customer wants to go,
+    the options you have checked on how to get there, and the things to do
+    and tips you have considered for them.
+
+    Combine these pieces of information into a unified report, and explain it
+    in simple terms to the customer. Do not add anything outside of this
+    information to the report. This is your final interaction with the user:
+    do not offer any follow-up interactions.
+    """,
+    request="""
+    Your customer wants to go from {departure_city} (in {departure_country})
+    to {destination_city} (in {destination_country}).
+
+    You have checked how to get there, and have seen these options:
+
+    <travel_options>
+    {instructions}
+    </travel_options>
+
+    You have also considered various things to do and tips to give them:
+
+    <things_to_do>
+    {suggestions}
+    </things_to_do>
+    """,
+    variables=STATE_KEYS,
+)
 
-<travel_options>
-{instructions}
-</travel_options>
 
-You have also considered various things to do and tips to give them:
+def get_chat_model():
+    runtime = get_runtime(ContextSchema)
+    return model_registry.get(runtime.context)
 
-<things_to_do>
-{suggestions}
-</things_to_do>
 
-Combine the above pieces of information into a unified report,
-and explain it in simple terms to the customer. Do not add anything
-outside of the above information to the report. This is your final
-interaction with the user: do not offer any follow-up interactions.
-"""
+def get_node_model(model_name: str):
+    """
+    Returns the chat model for the current node, hedging its calls and
+    falling back to other models as configured in the context.
+    Args:
+        model_name (str): The model picked by the router for the call.
+    """
+    return node_model(model_registry, get_runtime(ContextSchema).context, model_name)
 
 
-def get_chat_model():
+structured_output_cache = default_structured_output_cache()
+
+
+async def invoke_structured(schema, prompt):
+    """
+    Runs a structured output call through the response cache, so that repeated
+    prompts for the same model and schema do not need a model round trip.
+    The model is routed by the current node and the prompt.
+    """
+    runtime = get_runtime(ContextSchema)
+    decision = router.choose(runtime.context, prompt)
+    return await router.run(decision, structured_output_cache.ainvoke(
+        get_node_model(decision.model), schema, prompt, decision.model,
+        batch=batch_api if runtime.context.batch_api else None,
+    ))
+
+
+# Both research branches often search for the same city pair
+search_cache = ToolCache(ttl=24 * 60 * 60)
+
+
+@cache
+def get_search_tools() -> Tuple[BaseTool, ...]:
+    return (search_cache.wrap(TavilySearch()),)
+
+
+research_subgraphs = SubgraphCache()
+
+
+def get_research_subgraph():
+    """
+    Returns the ReAct research subgraph for the current model and search tools,
+    compiling it on first use. The compiled subgraph is shared by all runs.
+    """
     runtime = get_runtime(ContextSchema)
-    return init_chat_model(
-        model=runtime.context.model_name
+    tools = get_search_tools()
+    return research_subgraphs.get(
+        (runtime.context.model_name, tool_set_key(tools)),
+        lambda: create_react_agent(model=get_chat_model(), tools=list(tools))
     )
 
-async def identify_destination(state: State) -> Dict[str, Any]:
-    model = get_chat_model()
-    model_with_output = model.with_structured_output(TripDetails)
 
-    output = await model_with_output.ainvoke(
-        TRIP_DETAILS_TEMPLATE.format(query=state['messages'][-1].content)
+# Research started while destination_approval waits for the user
+speculative_research = SpeculativeResearch()
+
+RESEARCH_TEMPLATES = {
+    "instructions": TRIP_INSTRUCTIONS_TEMPLATE,
+    "suggestions": TRIP_THINGS_TO_DO_TEMPLATE,
+}
+
+
+def speculation_key(state: State) -> Tuple:
+    thread_id = get_config().get("configurable", {}).get("thread_id")
+    return (thread_id, get_runtime(ContextSchema).context.model_name) + tuple(
+        state.get(k) for k in ("departure_city", "departure_country", "destination_city", "destination_country")
+    )
+
+
+async def identify_destination(state: State) -> Dict[str, Any]:
+    output = await invoke_structured(
+        TripDetails,
+        TRIP_DETAILS_TEMPLATE.messages(query=state['messages'][-1].content)
     )
     location = cast(TripDetails, output)
     return location.model_dump(exclude_none=True, exclude_unset=True)
@@ -116,13 +218,23 @@ def ask_for_details(state: State) -> Dict[str, Any]:
         return {"messages": [AIMessage(content='Which city will you be travelling to?')]}
 
 
-def destination_approval(state: State) -> Command[Literal["destination_identified", "identify_destination"]]:
+async def destination_approval(state: State) -> Command[Literal["destination_identified", "identify_destination"]]:
+    runtime = get_runtime(ContextSchema)
+    if runtime.context.speculative_research:
+        # Resuming from the interrupt runs this node again, but only starts the branches once
+        subgraph = get_research_subgraph()
+        speculative_research.start(speculation_key(state), {
+            key: partial(run_research, subgraph, template, state)
+            for key, template in RESEARCH_TEMPLATES.items()
+        })
+
     feedback = interrupt({
         "question": "I understand that you wish to travel from {departure_city} in {departure_country} to {destination_city} in {destination_country}. Please confirm with an empty string, or provide feedback otherwise.".format(**state)
     })
     if not feedback or len(feedback.strip()) == 0:
         return Command(goto="destination_identified")
     else:
+        speculative_research.discard(speculation_key(state))
         return Command(goto="identify_destination",
                        update={"messages": [HumanMessage(content=feedback)]})
 
@@ -132,38 +244,56 @@ def destination_identified(state: State):
     return {}
 
 
-def subgraph_for_prompt_template(key: str, template: str) -> Callable:
+async def run_research(subgraph, template: PromptTemplate, state: State) -> str:
+    result = await subgraph.ainvoke({
+        "messages": template.messages(state)
+    })
+    return result['messages'][-1].content
+
+
+def subgraph_for_prompt_template(key: str, template: PromptTemplate) -> Callable:
     """
     Creates a ReAct subgraph that runs a prompt by passing the current state
-    through a static template.
+    through a static template. The result is also sent as a custom stream
+    event as soon as it is ready, without waiting for the other branch.
+    If the research was started speculatively, its result is used instead.
     Args:
         key (str): The state key where the result will be stored.
-        template (str): The static template to use.
+        template (PromptTemplate): The static template to use.
     """
     async def call_subgraph(state: State) -> Dict[str, Any]:
-        subgraph_travel_instructions = create_react_agent(
-            model=get_chat_model(),
-            tools=[TavilySearch()]
-        )
-        result = await subgraph_travel_instructions.ainvoke({
-            "messages": [HumanMessage(template.format(**state))]
-        })
+        content = None
+        if get_runtime(ContextSchema).context.speculative_research:
+            content = await speculative_research.take(speculation_key(state), key)
+        if content is None:
+            content = await run_research(get_research_subgraph(), template, state)
+        get_stream_writer()({"branch": key, "content": content})
         return {
-            key: result['messages'][-1].content
+            key: content
         }
 
     return call_subgraph
 
 
 async def summary_report(state: State) -> Dict[str, Any]:
-    model = get_chat_model()
-    result = await model.ainvoke([HumanMessage(TRIP_SUMMARY_TEMPLATE.format(**state))])
+    prompt = TRIP_SUMMARY_TEMPLATE.messages(state)
+    decision = router.choose(get_runtime(ContextSchema).context, prompt)
+    model = get_node_model(decision.model)
+
+    # Streamed, so the "messages" stream mode sends the report token by token
+    async def stream_report():
+        result = None
+        async for chunk in model.astream(prompt):
+            result = chunk if result is None else result + chunk
+        return result
+
+    result = await router.run(decision, stream_report())
     return {
-        "messages": [result]
+        "messages": [message_chunk_to_message(result)]
     }
 
 
-graph = (
+graph = instrument(
     StateGraph(State, input_schema=MessagesState, context_schema=ContextSchema)
     .add_node(identify_destination)
     .add_node(ask_for_details)
@@ -181,3 +311,5 @@ graph = (
     .add_edge("find_things_to_do", "summary_report")
     .compile(name="Travel Planner")
 )
+
+model_registry.warm_up(ContextSchema)
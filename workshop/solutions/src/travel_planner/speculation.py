@@ -0,0 +1,144 @@
+"""Speculative execution of the research branches while waiting for approval.
+
+Most users confirm the trip details that ``destination_approval`` asks
+about, so the research can start while the graph waits for them. The
+branches run as background tasks keyed on the thread and trip details:
+the research nodes take their results if the user confirms, and the tasks
+are cancelled if the user gives feedback instead. With metrics enabled,
+the branches and seconds of research that were saved, wasted or failed are
+exported through ``agent_runtime.metrics``.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from agent_runtime.metrics import metrics, metrics_enabled
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    used: int = 0
+    discarded: int = 0
+    failed: int = 0
+    # Seconds of research that ran while waiting for the user, and were used
+    saved_seconds: float = 0.0
+    # Seconds of research that ran for trip details the user did not confirm
+    wasted_seconds: float = 0.0
+
+
+def _record(outcome: str, seconds: float) -> None:
+    """Count a branch and its seconds of research, by whether it saved or wasted work."""
+    if metrics_enabled():
+        metrics.inc(
+            "agent_speculation_branches_total", "Speculative research branches, by outcome.", 1, outcome=outcome,
+        )
+        metrics.inc(
+            "agent_speculation_seconds_total", "Seconds of speculative research, by outcome.", seconds,
+            outcome=outcome,
+        )
+
+
+class _Speculation:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self.finished_at = time.monotonic()
+        if not task.cancelled():
+            # Mark errors as retrieved, in case the result is discarded
+            task.exception()
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class SpeculativeResearch:
+    """Runs research branches ahead of time, for results that may be needed later.
+
+    Args:
+        ttl (float): Seconds after which unclaimed results are discarded,
+            for users that never answer the interrupt.
+    """
+
+    def __init__(self, ttl: float = 15 * 60):
+        self.ttl = ttl
+        self.stats = SpeculationStats()
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Dict[str, _Speculation]] = {}
+
+    def start(self, key: Hashable, branches: Dict[str, Callable[[], Awaitable[str]]]) -> None:
+        """Start the branches for ``key`` in the background, unless they already started.
+
+        The branches run outside of the current graph run (in an empty
+        context), so they do not write to its checkpoints or traces.
+        """
+        self._expire()
+        with self._lock:
+            if key in self._pending:
+                return
+            # Tasks copy the context they are created in (create_task only takes
+            # a context argument from Python 3.11)
+            self._pending[key] = {
+                name: _Speculation(contextvars.Context().run(asyncio.create_task, branch()))
+                for name, branch in branches.items()
+            }
+            self.stats.started += len(branches)
+
+    async def take(self, key: Hashable, branch: str) -> Optional[str]:
+        """Return the result of a branch started for ``key``, or ``None`` if there is none."""
+        with self._lock:
+            speculation = self._pending.get(key, {}).pop(branch, None)
+            if key in self._pending and not self._pending[key]:
+                del self._pending[key]
+        if speculation is None or speculation.task.cancelled():
+            return None
+        saved = speculation.elapsed()
+        try:
+            result = await asyncio.shield(speculation.task)
+        except asyncio.CancelledError:
+            speculation.task.cancel()
+            raise
+        except Exception:
+            self.stats.failed += 1
+            _record("failed", speculation.elapsed())
+            logger.warning("Speculative %s branch failed, running it again", branch, exc_info=True)
+            return None
+        self.stats.used += 1
+        self.stats.saved_seconds += saved
+        _record("saved", saved)
+        return result
+
+    def discard(self, key: Hashable) -> None:
+        """Cancel the branches started for ``key``, as their results will not be needed."""
+        with self._lock:
+            speculations = self._pending.pop(key, {})
+        for speculation in speculations.values():
+            speculation.task.cancel()
+            wasted = speculation.elapsed()
+            self.stats.discarded += 1
+            self.stats.wasted_seconds += wasted
+            _record("wasted", wasted)
+        if speculations:
+            logger.debug("Discarded %d speculative branches, %s", len(speculations), self.stats)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key for key, speculations in self._pending.items()
+                if all(now - s.started_at > self.ttl for s in speculations.values())
+            ]
+        for key in expired:
+            self.discard(key)
@@ -0,0 +1,137 @@
+"""Streaming runs of the travel planner, with latency metrics.
+
+The research branches send their results as ``custom`` stream events as
+soon as each of them finishes, and the summary report is streamed token by
+token over the ``messages`` stream mode. ``astream_plan`` consumes those
+streams and records how long the user had to wait for each of them. If
+metrics are enabled (see ``agent_runtime.metrics``), these latencies are
+also observed in the ``agent_stream_latency_seconds`` histogram, e.g. the
+time to first token with ``output="first_token"``. Runs that do not go
+through ``astream_plan``, such as those of the LangGraph server, still
+record the time to first token of each chat model call, in
+``agent_llm_time_to_first_token_seconds``. To chat with the planner from a
+terminal, run from the ``solutions`` folder:
+
+    uv run python -m travel_planner.streaming
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+
+from agent_runtime.metrics import metrics as metrics_registry
+from agent_runtime.metrics import metrics_enabled
+from travel_planner.context import ContextSchema
+
+logger = logging.getLogger(__name__)
+
+STREAM_MODES = ["updates", "messages", "custom"]
+
+
+@dataclass
+class StreamMetrics:
+    """Seconds from the start of a run until each kind of output arrived."""
+    first_update: Optional[float] = None
+    first_branch: Optional[float] = None
+    first_token: Optional[float] = None
+    first_report_token: Optional[float] = None
+    total: Optional[float] = None
+
+
+async def astream_plan(
+    graph,
+    input: Any,
+    metrics: StreamMetrics,
+    config: Optional[RunnableConfig] = None,
+    context: Optional[ContextSchema] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streams a run of the travel planner as (stream mode, chunk) pairs, as
+    ``astream`` does with several stream modes, recording its latency.
+    Tokens from the research subgraphs are included: their metadata tells
+    them apart from the tokens of the summary report.
+    Args:
+        graph: The compiled travel planner graph.
+        input: The input of the run, or a ``Command`` to resume it.
+        metrics (StreamMetrics): Updated as the outputs arrive.
+        config (RunnableConfig): Configuration of the run.
+        context (ContextSchema): Context of the run.
+    """
+    start = time.perf_counter()
+    async for _, mode, chunk in graph.astream(
+        input, config, context=context or ContextSchema(), stream_mode=STREAM_MODES, subgraphs=True
+    ):
+        elapsed = time.perf_counter() - start
+        if mode == "updates" and metrics.first_update is None:
+            metrics.first_update = elapsed
+        elif mode == "custom" and "branch" in chunk and metrics.first_branch is None:
+            metrics.first_branch = elapsed
+        elif mode == "messages" and chunk[0].content:
+            if metrics.first_token is None:
+                metrics.first_token = elapsed
+            if metrics.first_report_token is None and chunk[1].get("langgraph_node") == "summary_report":
+                metrics.first_report_token = elapsed
+        yield mode, chunk
+    metrics.total = time.perf_counter() - start
+    logger.info("Time to first token: %s, run took %.2fs", metrics.first_token, metrics.total)
+    if metrics_enabled():
+        record_stream_metrics(metrics, graph.name)
+
+
+def record_stream_metrics(metrics: StreamMetrics, graph_name: str) -> None:
+    """Observe the latencies of a streamed run, labelled by the kind of output."""
+    for output, value in asdict(metrics).items():
+        if value is not None:
+            metrics_registry.observe(
+                "agent_stream_latency_seconds", "Seconds from the start of streamed runs until each kind of output.",
+                value, graph=graph_name, output=output,
+            )
+
+
+def seconds(value: Optional[float]) -> str:
+    return "-" if value is None else "{:.2f}s".format(value)
+
+
+async def main():
+    from travel_planner.graph import graph
+
+    # The LangGraph server provides its own checkpointer, so we add one here
+    planner = graph.builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    run_input: Any = {"messages": [("user", input("Where do you want to go? "))]}
+
+    while run_input is not None:
+        metrics = StreamMetrics()
+        question = None
+        async for mode, chunk in astream_plan(planner, run_input, metrics, config):
+            if mode == "custom" and "branch" in chunk:
+                sys.stdout.write("\n[{}]\n{}\n\n".format(chunk["branch"], chunk["content"]))
+            elif mode == "messages" and chunk[1].get("langgraph_node") == "summary_report":
+                sys.stdout.write(chunk[0].content)
+                sys.stdout.flush()
+            elif mode == "updates" and "__interrupt__" in chunk:
+                question = chunk["__interrupt__"][0].value["question"]
+            elif mode == "updates" and "ask_for_details" in chunk:
+                sys.stdout.write(chunk["ask_for_details"]["messages"][-1].content + "\n")
+
+        sys.stdout.write("\n\nFirst branch: {}, first report token: {}, total: {}\n".format(
+            seconds(metrics.first_branch), seconds(metrics.first_report_token), seconds(metrics.total)))
+        if question is not None:
+            run_input = Command(resume=input(question + " "))
+        elif not (await planner.aget_state(config)).values.get("suggestions"):
+            run_input = {"messages": [("user", input("> "))]}
+        else:
+            run_input = None
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Tests of the sandbox pool, against real worker processes.
+
+No API keys are needed. Run them from the ``workshop/solutions`` folder with:
+
+    uv run pytest
+"""
+import asyncio
+import time
+
+import pytest
+
+from tdd.sandbox import SandboxPool, _Cancellation
+
+PROGRAM = "def double(x):\n    return 2 * x\n"
+TESTS = """import unittest
+from program import double
+
+class DoubleTest(unittest.TestCase):
+    def test_double(self):
+        self.assertEqual(double(2), 4)
+"""
+SLOW_TESTS = """import time
+import unittest
+
+class SlowTest(unittest.TestCase):
+    def test_slow(self):
+        time.sleep(10)
+"""
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def test_cancelled_attempt_frees_its_worker(pool):
+    async def main():
+        task = asyncio.create_task(pool.arun(PROGRAM, SLOW_TESTS))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        start = time.perf_counter()
+        result = await pool.arun(PROGRAM, TESTS)
+        return result, time.perf_counter() - start
+
+    result, seconds = asyncio.run(main())
+    assert result["status"] == "passed"
+    # The slow test would have kept the only worker for 10s
+    assert seconds < 5
+    assert pool.stats.cancelled == 1
+
+
+def test_cancelling_a_finished_attempt_spares_the_next_one(pool):
+    # As when arun is cancelled right after its thread finished the attempt,
+    # and the worker went back to the pool
+    cancellation = _Cancellation()
+    assert pool._run(PROGRAM, TESTS, None, cancellation)["status"] == "passed"
+    cancellation.cancel()
+    assert pool.run(PROGRAM, TESTS)["status"] == "passed"
+    assert pool.stats.workers_replaced == 0
+
+
+def test_cancelling_during_the_attempt_discards_the_worker(pool):
+    # Killed while the attempt was finishing: the worker must not go back to the pool
+    cancellation = _Cancellation()
+    worker_run = pool._idle.queue[0].run
+
+    def run_and_cancel(job, timeout):
+        result = worker_run(job, timeout)
+        cancellation.cancel()
+        return result
+
+    pool._idle.queue[0].run = run_and_cancel
+    pool._run(PROGRAM, TESTS, None, cancellation)
+    assert pool.stats.workers_replaced == 1
+    assert pool.run(PROGRAM, TESTS)["status"] == "passed"